@@ -7,17 +7,27 @@ import threading
 import time
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Any, Dict, List, Type
+from typing import Any, Dict, List, Sequence, Type
 
 import psycopg2  # type: ignore
 
 import instruments
 from broker import tickers
 from broker.base import Broker, Ticker
+from broker.reconcile import TERMINAL_STATUSES
+from broker.slicing import aggregate_slices
 from config import get_server_config
+from core.chain import OptionChains
+from core.clock import get_clock
+from core.events import EventBus
+from core.handoff import TickHandoff
+from core.journal import TickJournal
+from core.prices import PriceHandle, PriceStore
+from core.quotes import QuoteCache
 from core.strategy import BaseStrategy, StartTimedBaseStrategy
+from core.subscriptions import Subscriptions
+from core.tick_writer import TickWriter
 from exceptions import DeRegisterStrategyException
-from instruments import symbol_to_CMP as cmp
 from models import (
     AlgoStatus,
     Direction,
@@ -29,8 +39,9 @@ from models import (
     UserDetails,
 )
 from models.order import Order
-from models.trade import Trade
+from models.trade import OrderAggregate, Trade
 from utils import (
+    get_epoch,
     get_today_date_str,
     get_user_details,
     is_market_closed_for_the_day,
@@ -45,6 +56,8 @@ class BaseAlgo(threading.Thread, ABC):
     broker: Broker
     ticker: Ticker
     loop: asyncio.AbstractEventLoop
+    price_store: PriceStore
+    events: EventBus
 
     def __init__(self, group=None, target=None, name=None, args=(), kwargs=None) -> None:
         super(BaseAlgo, self).__init__(group=group, target=target, name=name)
@@ -55,7 +68,7 @@ class BaseAlgo(threading.Thread, ABC):
         ) = args
         self.loop = asyncio.new_event_loop()
         self.tasks: List = []
-        self.registered_symbols: List[str] = []
+        self.subscriptions = Subscriptions(self.subscribe_symbols, self.unsubscribe_symbols)  # what the ticker streams, refcounted
         asyncio.set_event_loop(self.loop)
         self.trades_queue: asyncio.Queue[Trade] = asyncio.Queue()
         self.orders_queue: asyncio.Queue[Order] = asyncio.Queue()
@@ -65,6 +78,10 @@ class BaseAlgo(threading.Thread, ABC):
         self.strategies_data: Dict[str, Any] = {}
         self.trades: List[Trade] = []
         self.orders: Dict[str, Order] = {}
+        self.early_order_updates: Dict[str, List[Dict]] = {}  # order id => updates which arrived before the order was added
+        self.sliced_orders: Dict[str, Order] = {}  # order id => order placed as slices, its slices are in orders
+        self.order_book_synced = 0.0  # epoch of the last order book reconciliation
+        self.ticker_connects = -1  # Ticker.connects as of the last reconciliation, -1 to reconcile once at start
         self.strategy_to_instance: Dict[str, BaseStrategy] = {}
         self.status = AlgoStatus.INITIATED
 
@@ -82,9 +99,12 @@ class BaseAlgo(threading.Thread, ABC):
             logging.warn("Algo not started.")
             return
 
-        self.symbol_to_cmp = cmp[self.short_code]
+        self.price_store = instruments.price_stores[self.short_code]
+        self.events = EventBus(self.loop, self.price_store)
+        self.option_chains = OptionChains(self.price_store, self.subscriptions.hold, self.subscriptions.release)
 
         server_config = get_server_config()
+        self.quote_cache = QuoteCache(float(server_config.get("quote_cache_ttl", 1.0)))
         trades_dir = os.path.join(server_config["deploy_dir"], "trades")
         self.intradayTradesDir = os.path.join(trades_dir, get_today_date_str())
         if os.path.exists(self.intradayTradesDir) == False:
@@ -93,16 +113,29 @@ class BaseAlgo(threading.Thread, ABC):
 
         self.ticker = tickers[get_user_details(self.short_code).broker_name](self.short_code, self.broker)
 
+        # ticks and order updates arrive on the ticker's thread, they are applied on the algo loop
+        self.tick_handoff = TickHandoff(self.loop, self.ticks_listener)
         self.ticker.start_ticker()
-        self.ticker.register_listener(self.ticker_listener)
+        self.ticker.register_batch_listener(self.tick_handoff.on_ticks)
+        self.ticker.register_order_listener(self.order_update_listener_threadsafe)
 
-        self.ticker.register_symbols(["NIFTY 50", "NIFTY BANK", "INDIA VIX", "NIFTY FIN SERVICE"])
+        # ticks are persisted to {short_code}_tickData in batches off the ticker thread, never from the algo loop
+        self.tick_writer = TickWriter(self.short_code, server_config.get("questdb_host", "127.0.0.1"), int(server_config.get("questdb_ilp_port", 9009)))
+        self.tick_writer.start()
+        self.ticker.register_batch_listener(self.tick_writer.on_ticks)
+
+        if server_config.get("tick_journal", True):
+            # raw capture of every tick for research and replay, see core.journal.JournalReader
+            self.tick_journal = TickJournal(self.short_code, os.path.join(server_config["deploy_dir"], "journal"))
+            self.ticker.register_batch_listener(self.tick_journal.on_ticks)
+
+        self.subscriptions.hold(["NIFTY 50", "NIFTY BANK", "INDIA VIX", "NIFTY FIN SERVICE"])
 
         # Load all trades from json files to app memory
         self.load_trades_from_file()
         self.load_strategies_from_file()
 
-        while len(self.symbol_to_cmp) < 4:
+        while self.price_store.ticked_count() < 4:
             time.sleep(2)
 
         play_task = asyncio.run_coroutine_threadsafe(self.play(), self.loop)
@@ -133,16 +166,50 @@ class BaseAlgo(threading.Thread, ABC):
             if self.questDBCursor is None or self.questDBCursor.closed:
                 self.questDBCursor = self.get_questdb_connection()
 
+            self.events.triggers.compact()  # drop trigger levels which were re-armed before being crossed
+
             if not is_today_holiday() and not is_market_closed_for_the_day() and not len(self.strategy_to_instance) == 0:
 
                 # save updated data to json file
                 self.save_trades_to_file()
                 self.save_strategies_to_file()
-                self.broker.fetch_update_all_orders(self.orders)
+                if self.needs_order_book_sync():
+                    self.sync_order_book()
+            elif is_market_closed_for_the_day() and len(self.broker.latency.histograms) > 0:
+                self.save_latency_to_file()
 
-            now = datetime.datetime.now()
+            now = get_clock().now()
             waitSeconds = 30 - (now.second % 30)
-            await asyncio.sleep(waitSeconds)
+            await get_clock().sleep_async(waitSeconds)
+
+    def needs_order_book_sync(self) -> bool:
+        # order state comes from the ticker's order updates, the order book is only read to repair gaps in them:
+        # after a (re)connect, for orders no update arrived for since they were placed, and as a slow safety net
+        if self.ticker.connects != self.ticker_connects:
+            return True
+        now = get_epoch()
+        open_orders = False
+        for order in self.orders.values():
+            if order.order_status in TERMINAL_STATUSES:
+                continue
+            open_orders = True
+            if order.exchange_timestamp == 0 and now - order.place_timestamp > 5:
+                return True
+        return open_orders and now - self.order_book_synced >= int(get_server_config().get("order_book_sync_seconds", 300))
+
+    def sync_order_book(self) -> None:
+        self.ticker_connects = self.ticker.connects
+        self.order_book_synced = get_epoch()
+        diff = self.broker.fetch_update_all_orders(self.orders)
+        for order in diff.new_children:
+            # legs the broker split off one of our orders, tracked from now on, they carry the parent's tag
+            self.orders[order.order_id] = order
+            self.events.on_order_update(order)
+        for order in diff.changed:
+            logging.info("%s: order %s repaired from the order book, %s", self.short_code, order.order_id, order.order_status)
+            self.broker.order_updated(order)
+            self.update_sliced_order(order)
+            self.events.on_order_update(order)
 
     @abstractmethod
     async def start_strategies(self, short_code, multiple=0): ...
@@ -160,6 +227,11 @@ class BaseAlgo(threading.Thread, ABC):
     def _start_strategy(self, strategy_instance: BaseStrategy, run):
         strategy_instance.trades = self.get_trades_by_strategy(strategy_instance.getName())
         strategy_instance.run_config = run
+        strategy_instance.loop = self.loop
+        strategy_instance.events = self.events
+        strategy_instance.subscribe = self.subscriptions.hold
+        strategy_instance.chains = self.option_chains
+        strategy_instance.quote_cache = self.quote_cache
 
         strategy_task = asyncio.create_task(strategy_instance.run())
         strategy_task.set_name(strategy_instance.getName())
@@ -169,6 +241,8 @@ class BaseAlgo(threading.Thread, ABC):
         self.register_strategy(strategy_instance)
 
     def handle_exception(self, task):
+        if task.cancelled():
+            return
         if task.exception() is not None:
             logging.info("Exception in %s", task.get_name())
             logging.info(task.exception())
@@ -179,26 +253,80 @@ class BaseAlgo(threading.Thread, ABC):
     async def add_orders(self) -> None:
         while True:
             order: Order = await self.orders_queue.get()
+            for tracked in self.track_order(order):
+                for data in self.early_order_updates.pop(tracked.order_id, []):
+                    self.order_update_listener(data)
+
+    def track_order(self, order: Order) -> List[Order]:
+        # updates come for the broker's orders, for an order placed as slices those are its slices
+        if len(order.child_orders) == 0:
             self.orders[order.order_id] = order
+            return [order]
+        self.sliced_orders[order.order_id] = order
+        for child in order.child_orders:
+            self.orders[child.order_id] = child
+        return order.child_orders
+
+    def update_sliced_order(self, order: Order) -> None:
+        sliced = self.sliced_orders.get(order.parent_order_id, None) if order.parent_order_id else None
+        if sliced is not None:
+            aggregate_slices(sliced)
 
     async def add_trades(self) -> None:
         while True:
             trade: Trade = await self.trades_queue.get()
             self.trades.append(trade)
+            self.subscriptions.hold([trade.trading_symbol])  # its ticks drive the trade's tracking for the rest of the day
+
+    def ticks_listener(self, ticks: Sequence[TickData]) -> None:
+        # called on the algo loop with the coalesced ticks since the last wake up
+        price_store = self.price_store
+        for tick in ticks:
+            # Store the latest tick in the instrument's slot
+            price_store.update(
+                tick.slot if tick.slot >= 0 else price_store.slot_of(tick.trading_symbol),
+                tick.lastTradedPrice,
+                tick.volume,
+                tick.open,
+                tick.high,
+                tick.low,
+                tick.close,
+                tick.exchange_timestamp,
+                tick.totalBuyQuantity,
+                tick.totalSellQuantity,
+                tick.oi,
+            )
+        logging.debug("ticksListener: %d new ticks received", len(ticks))
+        self.option_chains.on_ticks()
+        self.events.on_ticks(ticks)
 
-    def ticker_listener(self, tick) -> None:
-        if isinstance(tick, TickData):
-            # assert isinstance(tick, TickData)
-            tick_data: TickData = tick
-            logging.debug("tickerLister: new tick received for %s = %f", tick_data.trading_symbol, tick_data.lastTradedPrice)
-            # Store the latest tick in map
-            self.symbol_to_cmp[tick.trading_symbol] = tick.lastTradedPrice
-            if tick.exchange_timestamp:
-                self.symbol_to_cmp["exchange_timestamp"] = tick.exchange_timestamp
-        elif "orderReference" in tick:
-            tick_order_id = tick["orderReference"]
-            if tick_order_id in self.orders:
-                self.broker.handle_order_update_tick(self.orders[tick_order_id], tick)
+    def order_update_listener_threadsafe(self, data: Dict) -> None:
+        self.loop.call_soon_threadsafe(self.order_update_listener, data)
+
+    def order_update_listener(self, data: Dict) -> None:
+        tick_order_id = self.broker.order_update_id(data)
+        if tick_order_id is None:
+            return
+        order = self.orders.get(tick_order_id, None)
+        if order is None:
+            # the update can beat the placing call's response, or be about an order placed outside the algo
+            self.early_order_updates.setdefault(tick_order_id, []).append(data)
+            if len(self.early_order_updates) > 500:
+                del self.early_order_updates[next(iter(self.early_order_updates))]
+            return
+        self.broker.handle_order_update_tick(order, data)
+        self.broker.latency.on_update(order)
+        self.broker.order_updated(order)
+        self.update_sliced_order(order)
+        self.events.on_order_update(order)
+
+    def subscribe_symbols(self, symbols: List[str]) -> None:
+        # by self.subscriptions only, once the first holder of a symbol turned up
+        self.ticker.register_symbols(symbols)
+
+    def unsubscribe_symbols(self, symbols: List[str]) -> None:
+        # by self.subscriptions only, once the last holder of a symbol let go of it
+        self.ticker.unregister_symbols(symbols)
 
     def get_trades_by_strategy(self, strategy: str) -> List[Trade]:
         tradesByStrategy = []
@@ -212,7 +340,10 @@ class BaseAlgo(threading.Thread, ABC):
         strategy_instance.strategyData = self.strategies_data.get(strategy_instance.getName(), None)
 
     def dergister_strategy(self, strategy_name):
-        del self.strategy_to_instance[strategy_name]
+        strategy_instance = self.strategy_to_instance.pop(strategy_name)
+        self.events.unsubscribe_all(strategy_instance)
+        self.subscriptions.release(strategy_instance.quoted)
+        strategy_instance.quoted = set()
 
     def get_questdb_connection(self):
         try:
@@ -248,13 +379,9 @@ class BaseAlgo(threading.Thread, ABC):
             trade = convert_json_to_trade(tr)
             logging.info("load_trades_from_file trade => %s", trade)
             self.trades.append(trade)
-            self.orders.update([(order.order_id, order) for order in trade.entry_orders])
-            self.orders.update([(order.order_id, order) for order in trade.sl_orders])
-            self.orders.update([(order.order_id, order) for order in trade.target_orders])
-            if trade.trading_symbol not in self.registered_symbols:
-                # Algo register symbols with ticker
-                self.ticker.register_symbols([trade.trading_symbol])
-                self.registered_symbols.append(trade.trading_symbol)
+            for order in trade.entry_orders + trade.sl_orders + trade.target_orders:
+                self.track_order(order)
+            self.subscriptions.hold([trade.trading_symbol])
         logging.info("TradeManager: Successfully loaded %d trades from json file %s", len(self.trades), trades_filepath)
 
     def load_strategies_from_file(self):
@@ -278,6 +405,19 @@ class BaseAlgo(threading.Thread, ABC):
         )
         return tradesFilepath
 
+    def get_latency_filepath(self):
+        return os.path.join(
+            self.intradayTradesDir, get_user_details(self.short_code).broker_name + "_" + get_user_details(self.short_code).client_id + "_latency.json"
+        )
+
+    def save_latency_to_file(self):
+        # end of day, the day's histograms go to the trades directory and the next day starts from empty ones
+        latencyFilepath = self.get_latency_filepath()
+        with open(latencyFilepath, "w") as lFile:
+            json.dump(self.broker.latency.summary(), lFile, indent=2)
+        self.broker.latency.reset()
+        logging.info("TradeManager: Saved order latencies to file %s", latencyFilepath)
+
     def save_trades_to_file(self):
         tradesFilepath = self.get_trades_filepath()
         with open(tradesFilepath, "w") as tFile:
@@ -297,6 +437,10 @@ class TradeEncoder(json.JSONEncoder):
             return o.isoformat()
         if isinstance(o, BaseStrategy):
             return o.asDict()
+        if isinstance(o, PriceHandle):
+            return None  # live view on the price store, re-resolved after load
+        if isinstance(o, OrderAggregate):
+            return None  # rebuilt from the orders on load
         if isinstance(o, Enum):
             return o.name
         return o.__dict__
@@ -322,6 +466,12 @@ def convert_json_to_order(jsonData):
     order.update_timestamp = jsonData["update_timestamp"]
     order.message = jsonData["message"]
     order.parent_order_id = jsonData.get("parent_order_id", "")
+    order.exchange_timestamp = jsonData.get("exchange_timestamp", 0)
+    order.child_orders = [convert_json_to_order(child) for child in jsonData.get("child_orders", [])]
+    order.tag = jsonData.get("tag", "")
+    order.direction = Direction[jsonData["direction"]] if jsonData.get("direction", None) else None
+    order.is_fno = jsonData.get("is_fno", False)
+    order.modify_count = jsonData.get("modify_count", 0)
     return order
 
 
@@ -356,12 +506,13 @@ def convert_json_to_trade(jsonData) -> Trade:
     trade.pnl_percentage = jsonData["pnl_percentage"]
     trade.exit = jsonData["exit"]
     trade.exit_reason = jsonData["exit_reason"]
+    trade.basket_id = jsonData.get("basket_id", None)
     trade.exchange = jsonData["exchange"]
     trade.sl_orders
     for entry_order in jsonData["entry_orders"]:
-        trade.entry_orders.append(convert_json_to_order(entry_order))
+        trade.add_entry_order(convert_json_to_order(entry_order))
     for sl_order in jsonData["sl_orders"]:
-        trade.sl_orders.append(convert_json_to_order(sl_order))
+        trade.add_sl_order(convert_json_to_order(sl_order))
     for target_order in jsonData["target_orders"]:
-        trade.target_orders.append(convert_json_to_order(target_order))
+        trade.add_target_order(convert_json_to_order(target_order))
     return trade
@@ -0,0 +1,79 @@
+# Order path throughput against the paper broker: place / modify / cancel calls per second and tick batches matched
+# per second with orders resting. Uses a simulated clock, so runs are repeatable.
+#
+# Run from src/:  python -m benchmarks.paper_orders [--orders 5000 --symbols 200]
+
+import argparse
+import datetime
+import random
+import time
+
+import app  # noqa: F401, wires config/views the same way flask does before the broker modules are imported
+from broker import paper
+from core.clock import SimulatedClock, set_clock
+from models import Direction, OrderType, TickData
+from models.order import OrderInputParams, OrderModifyParams
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Paper broker order path throughput")
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--batches", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    clock = SimulatedClock(datetime.datetime(2024, 5, 2, 9, 15))
+    set_clock(clock)
+    rnd = random.Random(42)
+    broker = paper.Broker({"broker_name": "paper", "short_code": "bench", "paper": {"latency_ms": args.latency_ms}})
+    symbols = ["BENCH" + str(i) for i in range(args.symbols)]
+
+    start = time.perf_counter()
+    orders = []
+    for i in range(args.orders):
+        oip = OrderInputParams(symbols[i % args.symbols])
+        oip.direction = Direction.LONG if i % 2 == 0 else Direction.SHORT
+        oip.order_type = OrderType.SL_LIMIT
+        oip.trigger_price = 90.0 if oip.direction == Direction.LONG else 110.0
+        oip.price = 91.0 if oip.direction == Direction.LONG else 109.0
+        oip.qty = 50
+        orders.append(broker.place_order(oip))
+    placed = args.orders / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for order in orders:
+        omp = OrderModifyParams()
+        omp.new_trigger_price = order.trigger_price + 0.05
+        broker.modify_order(order, omp, order.qty)
+    modified = args.orders / (time.perf_counter() - start)
+
+    ticks = [TickData(symbol) for symbol in symbols]
+    updates = 0
+    start = time.perf_counter()
+    for _ in range(args.batches):
+        clock.advance_to(clock.timestamp() + 0.5)
+        for tick in ticks:
+            tick.lastTradedPrice = 100 + rnd.uniform(-5, 5)
+        updates += len(broker.on_ticks(ticks))
+    matched = args.batches / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    cancelled = 0
+    for order in orders:
+        try:
+            broker.cancel_order(order)
+            cancelled += 1
+        except Exception:
+            pass
+    cancels = cancelled / max(time.perf_counter() - start, 1e-9)
+
+    print("orders = %d, symbols = %d, batches = %d" % (args.orders, args.symbols, args.batches))
+    print("place:  %10.0f orders/s" % placed)
+    print("modify: %10.0f orders/s" % modified)
+    print("match:  %10.0f batches/s of %d ticks with %d resting orders, %d order updates" % (matched, args.symbols, args.orders, updates))
+    print("cancel: %10.0f orders/s, %d cancelled" % (cancels, cancelled))
+
+
+if __name__ == "__main__":
+    main()
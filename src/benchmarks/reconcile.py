@@ -0,0 +1,115 @@
+# Order book reconciliation time, the old scan of every known order per order book row vs the indexed reconcile_order_book.
+#
+# Run from src/:  python -m benchmarks.reconcile [--orders 5000 --children 500]
+#
+# Both run against the same Kite shaped order book: every known order, a share of them filled since the last fetch,
+# iceberg legs of some orders which are not known yet, and rows of orders placed outside the algo.
+
+import argparse
+import random
+import time
+from typing import Dict, List
+
+import app  # noqa: F401, wires config/views the same way flask does before the broker modules are imported
+from broker import zerodha
+from broker.reconcile import child_order, reconcile_order_book
+from models import OrderStatus
+from models.order import Order, OrderInputParams
+
+
+def make_orders(count: int) -> Dict[str, Order]:
+    orders = {}
+    for i in range(count):
+        oip = OrderInputParams("NIFTY24MAY" + str(20000 + 50 * (i % 40)) + ("CE" if i % 2 == 0 else "PE"))
+        oip.qty = 50
+        oip.price = 100.0
+        oip.tag = "Strategy" + str(i % 20)
+        order = Order(oip)
+        order.order_id = str(240502000000000 + i)
+        order.order_status = OrderStatus.OPEN
+        orders[order.order_id] = order
+    return orders
+
+
+def make_order_book(orders: Dict[str, Order], children: int, unknown: int, rnd: random.Random) -> List[Dict]:
+    rows = []
+    for order in orders.values():
+        filled = rnd.random() < 0.2
+        rows.append(
+            {
+                "order_id": order.order_id,
+                "parent_order_id": None,
+                "status": "COMPLETE" if filled else "OPEN",
+                "quantity": order.qty,
+                "filled_quantity": order.qty if filled else 0,
+                "pending_quantity": 0 if filled else order.qty,
+                "price": order.price,
+                "trigger_price": 0.0,
+                "average_price": order.price if filled else 0.0,
+                "exchange_update_timestamp": "2024-05-02 10:15:00",
+            }
+        )
+    parents = rnd.sample(list(orders.keys()), children)
+    for i, parent_id in enumerate(parents):
+        rows.append(dict(rows[0], order_id=str(240502900000000 + i), parent_order_id=parent_id, status="OPEN", filled_quantity=0, pending_quantity=50))
+    for i in range(unknown):
+        rows.append(dict(rows[0], order_id=str(240502800000000 + i), parent_order_id=None))
+    rnd.shuffle(rows)
+    return rows
+
+
+def legacy_reconcile(orders: Dict[str, Order], order_book: List[Dict], apply_row) -> List[Order]:
+    # the loop fetch_update_all_orders had: every known order compared with every row
+    missing = []
+    for bOrder in order_book:
+        foundOrder = None
+        parentOrder = None
+        for order in orders.values():
+            if order.order_id == bOrder["order_id"]:
+                foundOrder = order
+            if order.order_id == bOrder["parent_order_id"]:
+                parentOrder = order
+        if foundOrder is not None:
+            apply_row(foundOrder, bOrder)
+        elif parentOrder is not None:
+            missing.append(child_order(parentOrder, bOrder["order_id"]))
+    return missing
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Order book reconciliation benchmark")
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--children", type=int, default=500)
+    parser.add_argument("--unknown", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--legacy-rounds", type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    broker = zerodha.Broker({"broker_name": "zerodha", "short_code": "bench"})
+    apply_row = broker._apply_order_book_row
+
+    orders = make_orders(args.orders)
+    order_book = make_order_book(orders, args.children, args.unknown, rnd)
+
+    start = time.perf_counter()
+    for _ in range(args.legacy_rounds):
+        missing = legacy_reconcile(orders, order_book, apply_row)
+    legacy = (time.perf_counter() - start) / args.legacy_rounds
+
+    orders = make_orders(args.orders)
+    diff = reconcile_order_book(orders, order_book, apply_row)  # the first round sees the fills, later ones no changes
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        reconcile_order_book(orders, order_book, apply_row)
+    indexed = (time.perf_counter() - start) / args.rounds
+    assert len(missing) == len(diff.new_children) == args.children
+
+    print("orders = %d, order book rows = %d" % (args.orders, len(order_book)))
+    print("legacy scan:  %10.2f ms per order book" % (legacy * 1000))
+    print("indexed:      %10.2f ms per order book, %.0fx" % (indexed * 1000, legacy / indexed))
+    print("first diff: %d changed, %d new children, %d unknown rows" % (len(diff.changed), len(diff.new_children), len(diff.unknown)))
+
+
+if __name__ == "__main__":
+    main()
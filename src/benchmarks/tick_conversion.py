@@ -0,0 +1,142 @@
+# Ticks/second of the Zerodha tick conversion, old per tick TickData allocation vs the reused buffers.
+#
+# Run from src/:  python -m benchmarks.tick_conversion [--frames recorded_frames.json]
+#
+# A recorded frames file is a json list of KiteTicker on_ticks payloads (list of lists of tick dicts) as captured
+# from a live session. Without one, frames of the same shape are generated for a synthetic option chain.
+
+import argparse
+import datetime
+import json
+import random
+import time
+from typing import Dict, List
+
+import app  # noqa: F401, wires config/views the same way flask does before the broker modules are imported
+import instruments
+from broker.zerodha import Ticker
+from core.prices import PriceStore
+from instruments import get_instrument_data_by_token
+
+
+class LegacyTickData:
+    # TickData as it was before it was slotted, kept here only as the baseline
+    def __init__(self, trading_symbol):
+        self.trading_symbol = trading_symbol
+        self.lastTradedPrice = 0
+        self.lastTradedQuantity = 0
+        self.avgTradedPrice = 0
+        self.volume = 0
+        self.totalBuyQuantity = 0
+        self.totalSellQuantity = 0
+        self.open = 0
+        self.high = 0
+        self.low = 0
+        self.close = 0
+        self.change = 0
+        self.exchange_timestamp = None
+
+
+def legacy_on_ticks(short_code, brokerTicks, on_new_ticks):
+    ticks = []
+    for bTick in brokerTicks:
+        isd = get_instrument_data_by_token(short_code, bTick["instrument_token"])
+        trading_symbol = isd["tradingsymbol"]
+        tick = LegacyTickData(trading_symbol)
+        tick.lastTradedPrice = bTick["last_price"]
+        if not isd["segment"] == "INDICES":
+            tick.lastTradedQuantity = bTick["last_traded_quantity"]
+            tick.avgTradedPrice = bTick["average_traded_price"]
+            tick.volume = bTick["volume_traded"]
+            tick.totalBuyQuantity = bTick["total_buy_quantity"]
+            tick.totalSellQuantity = bTick["total_sell_quantity"]
+        else:
+            tick.exchange_timestamp = bTick["exchange_timestamp"]
+        tick.open = bTick["ohlc"]["open"]
+        tick.high = bTick["ohlc"]["high"]
+        tick.low = bTick["ohlc"]["low"]
+        tick.close = bTick["ohlc"]["close"]
+        tick.change = bTick["change"]
+        ticks.append(tick)
+    on_new_ticks(ticks)
+
+
+def synthetic_frames(num_instruments: int, ticks_per_frame: int, num_frames: int) -> List[List[Dict]]:
+    rnd = random.Random(42)
+    now = datetime.datetime.now()
+    frames = []
+    for _ in range(num_frames):
+        frame = []
+        for token in rnd.sample(range(1, num_instruments + 1), min(ticks_per_frame, num_instruments)):
+            price = round(rnd.uniform(1, 500), 2)
+            frame.append(
+                {
+                    "instrument_token": token,
+                    "last_price": price,
+                    "last_traded_quantity": rnd.randint(1, 50) * 25,
+                    "average_traded_price": price,
+                    "volume_traded": rnd.randint(0, 10_000_000),
+                    "total_buy_quantity": rnd.randint(0, 500_000),
+                    "total_sell_quantity": rnd.randint(0, 500_000),
+                    "ohlc": {"open": price, "high": price + 5, "low": price - 5, "close": price},
+                    "change": 0.5,
+                    "exchange_timestamp": now,
+                }
+            )
+        frames.append(frame)
+    return frames
+
+
+def load_frames(path: str) -> List[List[Dict]]:
+    with open(path, "r") as frames_file:
+        return json.load(frames_file)
+
+
+def setup_instruments(short_code: str, frames: List[List[Dict]]) -> None:
+    tokens = sorted({bTick["instrument_token"] for frame in frames for bTick in frame})
+    price_store = PriceStore(len(tokens))
+    instruments.symbol_to_instrument[short_code] = {}
+    instruments.token_to_instrument[short_code] = {}
+    instruments.price_stores[short_code] = price_store
+    for token in tokens:
+        isd = {"tradingsymbol": "BENCH" + str(token), "instrument_token": token, "segment": "NFO-OPT"}
+        instruments.symbol_to_instrument[short_code][isd["tradingsymbol"]] = isd
+        instruments.token_to_instrument[short_code][token] = isd
+        price_store.add_instrument(isd["tradingsymbol"], token)
+
+
+def measure(convert, frames: List[List[Dict]], repeat: int) -> float:
+    num_ticks = sum(len(frame) for frame in frames) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            convert(frame)
+    return num_ticks / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tick conversion throughput, before and after buffer reuse")
+    parser.add_argument("--frames", help="json file with recorded KiteTicker frames")
+    parser.add_argument("--instruments", type=int, default=3000)
+    parser.add_argument("--ticks-per-frame", type=int, default=500)
+    parser.add_argument("--num-frames", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    short_code = "bench"
+    frames = load_frames(args.frames) if args.frames else synthetic_frames(args.instruments, args.ticks_per_frame, args.num_frames)
+    setup_instruments(short_code, frames)
+
+    ticker = Ticker(short_code, None)
+    ticker.register_batch_listener(lambda ticks: None)
+
+    before = measure(lambda frame: legacy_on_ticks(short_code, frame, ticker.on_new_ticks), frames, args.repeat)
+    after = measure(lambda frame: ticker.on_ticks(None, frame), frames, args.repeat)
+
+    print("frames = %d, ticks = %d" % (len(frames), sum(len(frame) for frame in frames)))
+    print("before: %12.0f ticks/s" % before)
+    print("after:  %12.0f ticks/s  (x%.2f)" % (after, after / before))
+
+
+if __name__ == "__main__":
+    main()
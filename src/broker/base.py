@@ -1,10 +1,24 @@
 import asyncio
 import logging
 from abc import ABC, abstractmethod
-from typing import Any, Callable, Dict, Generic, List, Optional, TypeVar
-
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Generic, List, Optional, Sequence, Tuple, TypeVar
+
+from broker.dispatch import OrderDispatcher
+from broker.modify import ModificationManager, replacement_params, split_off
+from broker.ratelimit import RateLimiter, get_rate_limiter
+from broker.reconcile import ORDER_BY_EXCHANGE_TIME, TERMINAL_STATUSES, OrderBookDiff
+from broker.slicing import (
+    aggregate_slices,
+    get_user_freeze_limits,
+    slice_order,
+    sliced_order,
+)
 from core import Quote
-from models import TickData
+from core.clock import get_clock
+from core.latency import LatencyRecorder
+from exceptions import StaleOrderRequestException
+from models import OrderPriority, TickColumns, TickData
 from models.order import Order, OrderInputParams, OrderModifyParams
 from models.trade import Trade
 
@@ -17,6 +31,16 @@ class Broker(ABC, Generic[T]):
     access_token: Optional[str]
     trades_queue: asyncio.Queue[Trade]
     orders_queue: asyncio.Queue[Order]
+    order_workers = 8  # order calls in flight at once per account
+    order_retries = 3  # attempts after a "Too many requests" rejection
+    quote_retries = 3  # attempts after a rate limited or failed quote call
+    quote_workers = 4  # quote calls in flight at once per account, for get_quotes of brokers without a batch quote call
+    order_modify_limit = 25  # modifications the broker allows per order
+    order_modify_reserve = 2  # an order with only this many modifications left is cancelled and placed again instead
+    order_terminal_wait = 3.0  # seconds to wait for the order update of a cancelled order before reading the order book
+    order_terminal_checks = 3  # order book reads before a cancel which never showed up is given up on
+    update_ordering = ORDER_BY_EXCHANGE_TIME  # how the broker's order updates are put in order, see broker.reconcile.accept_update
+    rate_limits: Dict[str, List[Tuple[float, int]]] = {}  # default budgets of the broker's API, see broker.ratelimit
 
     def __init__(self, user_details: Dict[str, str]) -> None:
         self.user_details = user_details
@@ -24,6 +48,14 @@ class Broker(ABC, Generic[T]):
         self.access_token = None
         self.short_code = self.user_details["short_code"]
         self.instruments_list: List[Dict[str, str]] = []
+        self.order_executor: Optional[ThreadPoolExecutor] = None
+        self.quote_executor: Optional[ThreadPoolExecutor] = None
+        self.rate_limiter: RateLimiter = get_rate_limiter(self.broker_name, self.short_code, self.rate_limits)
+        get_user_freeze_limits(self.short_code)  # read with the rest of the user config here, not on the first order
+        self.dispatcher: Optional[OrderDispatcher] = None
+        self.latency = LatencyRecorder(self.broker_name, self.short_code)
+        self.modifications = ModificationManager(self.broker_name + ":" + self.short_code, self.order_modify_limit, self.order_modify_reserve)
+        self.terminal_waiters: Dict[str, asyncio.Event] = {}  # order id => set once the order is complete, cancelled or rejected
 
     @abstractmethod
     def login(self, args: Dict) -> str: ...
@@ -38,7 +70,7 @@ class Broker(ABC, Generic[T]):
     def cancel_order(self, order: Order) -> Order: ...
 
     @abstractmethod
-    def fetch_update_all_orders(self, orders: Dict[str, Order]) -> List[Order]: ...
+    def fetch_update_all_orders(self, orders: Dict[str, Order]) -> OrderBookDiff: ...
 
     @abstractmethod
     def get_quote(self, trading_symbol: str, short_code: str, isFnO: bool, exchange: str) -> Quote: ...
@@ -46,6 +78,21 @@ class Broker(ABC, Generic[T]):
     @abstractmethod
     def get_index_quote(self, trading_symbol: str, short_code: str, exchange: str = "NSE") -> Quote: ...
 
+    def get_quotes(self, trading_symbols: List[str], short_code: str, isFnO: bool, exchange: str) -> Dict[str, Quote]:
+        # quotes of many symbols, by symbol, symbols the broker could not quote are left out. Brokers with a batch quote
+        # call override it, by default the single quote calls fan out on the account's quote executor (within the
+        # account's quote budget, see broker.ratelimit)
+        if self.quote_executor is None:
+            self.quote_executor = ThreadPoolExecutor(max_workers=self.quote_workers, thread_name_prefix=self.short_code + "_quotes")
+        futures = {symbol: self.quote_executor.submit(self.get_quote, symbol, short_code, isFnO, exchange) for symbol in dict.fromkeys(trading_symbols)}
+        quotes: Dict[str, Quote] = {}
+        for symbol, future in futures.items():
+            try:
+                quotes[symbol] = future.result()
+            except Exception as e:
+                logging.info("%s:%s could not get quote for %s => %s", self.broker_name, self.short_code, symbol, str(e))
+        return quotes
+
     @abstractmethod
     def margins(self) -> List: ...
 
@@ -61,6 +108,161 @@ class Broker(ABC, Generic[T]):
     @abstractmethod
     def handle_order_update_tick(self, order: Order, data: Dict) -> None: ...
 
+    def order_update_id(self, data: Dict) -> Optional[str]:
+        # id of the order a ticker order update is about
+        return data.get("order_id", None)
+
+    # Coroutine versions of the order calls for the algo loop: the blocking broker call runs on this account's order
+    # executor, so a slow response only holds up the strategy awaiting it and orders from other strategies overlap.
+    # Calls queue in the OrderDispatcher by priority for the order budget; key marks what a newer call supersedes
+    # (modifications and cancels of one order) and group what OrderDispatcher.drop() can drop (the trade id).
+    # An order above the underlying's freeze limit goes out as slices (broker.slicing), placed concurrently within the
+    # order budget. The caller gets one Order aggregating them, modify and cancel act on the slices still working.
+    # Modifications go through the ModificationManager (broker.modify), an order running out of them is replaced.
+
+    async def place_order_async(self, oip: OrderInputParams, priority: OrderPriority = OrderPriority.ENTRY, group: Optional[str] = None) -> Order:
+        slices = slice_order(self.short_code, oip)
+        if len(slices) == 1:
+            order = await self.run_order_call(priority, None, group, self.place_order, oip)
+            self.orders_queue.put_nowait(order)
+            return order
+
+        logging.info("%s:%s placing %s qty %d as %d slices", self.broker_name, self.short_code, oip.trading_symbol, oip.qty, len(slices))
+        results = await asyncio.gather(*[self.run_order_call(priority, None, group, self.place_order, sliceOip) for sliceOip in slices], return_exceptions=True)
+        placed = [result for result in results if isinstance(result, Order)]
+        failed = [result for result in results if not isinstance(result, Order)]
+        if len(placed) == 0:
+            raise failed[0]
+        if len(failed) > 0:
+            # the slices placed stay, the order is smaller than asked for rather than leaving untracked positions behind
+            logging.error("%s:%s %d of %d slices of %s failed: %s", self.broker_name, self.short_code, len(failed), len(slices), oip.trading_symbol, str(failed[0]))
+        order = sliced_order(oip, placed)
+        self.orders_queue.put_nowait(order)
+        return order
+
+    async def modify_order_async(
+        self, order: Order, omp: OrderModifyParams, qty: int, priority: OrderPriority = OrderPriority.PROTECT, group: Optional[str] = None
+    ) -> Order:
+        if len(order.child_orders) > 0:
+            await asyncio.gather(
+                *[self.modify_broker_order(order, child, omp, child.qty, priority, group) for child in order.child_orders if child.order_status not in TERMINAL_STATUSES]
+            )
+            aggregate_slices(order)
+            return order
+        return await self.modify_broker_order(None, order, omp, qty, priority, group)
+
+    async def modify_broker_order(
+        self, parent: Optional[Order], order: Order, omp: OrderModifyParams, qty: int, priority: OrderPriority, group: Optional[str]
+    ) -> Order:
+        modifications = self.modifications
+        order_id = order.order_id
+        async with modifications.submit(order_id, omp):
+            try:
+                if not modifications.take(order_id, omp):
+                    raise StaleOrderRequestException("Modification of order " + order_id + " superseded by a newer one")
+                if modifications.is_noop(order, omp):
+                    return parent if parent is not None else order
+                if not modifications.should_replace(order):
+                    try:
+                        await self.run_order_call(priority, order_id, group, self.modify_order, order, omp, qty)
+                        modifications.applied(order, omp)
+                        return parent if parent is not None else order
+                    except Exception as e:
+                        if "Maximum allowed order modifications exceeded" not in str(e) or order.direction is None:
+                            raise
+                        order.modify_count = self.order_modify_limit  # modified outside the algo as well
+                return await self.replace_order(parent, order, omp, priority, group)
+            finally:
+                modifications.release(order_id)
+
+    async def replace_order(self, parent: Optional[Order], order: Order, omp: OrderModifyParams, priority: OrderPriority, group: Optional[str]) -> Order:
+        # cancel and place again with omp applied, order and its replacement become slices of one order (broker.slicing).
+        # The replacement is only placed once the cancel is confirmed and for what was left unfilled by then, whatever
+        # filled while the cancel was on its way must not be placed again.
+        if parent is None:
+            parent = order
+            order = split_off(parent)
+            self.orders_queue.put_nowait(parent)  # order updates go to the broker order, now the child, from here
+        logging.info("%s:%s order %s is out of modifications, replacing it", self.broker_name, self.short_code, order.order_id)
+        try:
+            await self.run_order_call(priority, order.order_id, group, self.cancel_order, order)
+        except StaleOrderRequestException:
+            raise
+        except Exception as e:
+            # it may have filled in the meantime, the order's status tells
+            logging.info("%s:%s cancel of order %s failed: %s", self.broker_name, self.short_code, order.order_id, str(e))
+        if not await self.await_terminal(order):
+            aggregate_slices(parent)
+            raise StaleOrderRequestException("Order " + order.order_id + " not confirmed cancelled, not replaced")
+        oip = replacement_params(order, omp)
+        if oip.qty > 0:
+            replacement = await self.run_order_call(priority, None, group, self.place_order, oip)
+            replacement.parent_order_id = parent.order_id
+            parent.child_orders.append(replacement)
+            self.orders_queue.put_nowait(parent)
+            self.modifications.replaced += 1
+        aggregate_slices(parent)
+        return parent
+
+    async def await_terminal(self, order: Order) -> bool:
+        # True once order is complete, cancelled or rejected: from its order updates (order_updated), or failing those
+        # from the order book, False if neither shows it within order_terminal_checks rounds
+        if order.order_status in TERMINAL_STATUSES:
+            return True
+        event = self.terminal_waiters.setdefault(order.order_id, asyncio.Event())
+        loop = asyncio.get_running_loop()
+        try:
+            for _ in range(self.order_terminal_checks):
+                if await get_clock().wait_event(event, self.order_terminal_wait):
+                    return True
+                await loop.run_in_executor(self.order_executor, self.fetch_update_all_orders, {order.order_id: order})
+                if order.order_status in TERMINAL_STATUSES:
+                    return True
+            logging.error("%s:%s order %s still %s after its cancel", self.broker_name, self.short_code, order.order_id, order.order_status)
+            return False
+        finally:
+            self.terminal_waiters.pop(order.order_id, None)
+
+    def order_updated(self, order: Order) -> None:
+        # after an order update or order book row was applied to order, on the algo loop
+        if order.order_status in TERMINAL_STATUSES and order.order_id in self.terminal_waiters:
+            self.terminal_waiters[order.order_id].set()
+
+    async def cancel_order_async(self, order: Order, priority: OrderPriority = OrderPriority.PROTECT, group: Optional[str] = None) -> Order:
+        if len(order.child_orders) > 0:
+            await asyncio.gather(
+                *[self.run_order_call(priority, child.order_id, group, self.cancel_order, child) for child in order.child_orders if child.order_status not in TERMINAL_STATUSES]
+            )
+            aggregate_slices(order)
+            return order
+        return await self.run_order_call(priority, order.order_id, group, self.cancel_order, order)
+
+    async def run_order_call(self, priority: OrderPriority, key: Optional[str], group: Optional[str], call: Callable, *args: Any) -> Any:
+        if self.order_executor is None:
+            self.order_executor = ThreadPoolExecutor(max_workers=self.order_workers, thread_name_prefix=self.short_code + "_orders")
+        if self.dispatcher is None:
+            self.dispatcher = OrderDispatcher(self.broker_name + ":" + self.short_code, self.rate_limiter)
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            # queue for the account's order budget here on the loop, not on an executor thread
+            await self.dispatcher.admit(priority, key, group, call == self.cancel_order)
+            sent = get_clock().timestamp()
+            try:
+                result = await loop.run_in_executor(self.order_executor, call, *args)
+                self.latency.on_call(call.__name__, args[0], result, sent)
+                return result
+            except Exception as e:
+                if "Too many requests" not in str(e) or attempt >= self.order_retries:
+                    raise
+                attempt += 1
+                logging.info("%s:%s %s rate limited, retry %d", self.broker_name, self.short_code, call.__name__, attempt)
+                self.rate_limiter.pause("orders")
+
+    def drop_queued_orders(self, group: str, priority: OrderPriority = OrderPriority.ENTRY) -> int:
+        # order calls of group still waiting for the budget, at priority or less urgent, fail with StaleOrderRequestException
+        return self.dispatcher.drop(group, priority) if self.dispatcher is not None else 0
+
     def set_access_token(self, access_token: str) -> None:
         self.access_token = access_token
 
@@ -80,7 +282,10 @@ class Ticker(ABC, Generic[B]):
         self.broker_name: str
         self.broker = broker
         self.ticker = None
-        self.tickListeners: List[Callable] = []
+        self.tickListeners: List[Callable] = []  # per tick listeners, they get order updates as well
+        self.batchListeners: List[Tuple[Callable, bool]] = []  # (listener, wants columnar view)
+        self.orderListeners: List[Callable] = []
+        self.connects = 0
 
     @abstractmethod
     def start_ticker(sellf) -> None: ...
@@ -88,8 +293,18 @@ class Ticker(ABC, Generic[B]):
     def stop_ticker(self) -> None: ...
 
     def register_listener(self, listener) -> None:
-        # All registered tick listeners will be notified on new ticks
+        # All registered tick listeners will be notified on new ticks, one tick at a time, and on order updates
         self.tickListeners.append(listener)
+        self.batchListeners.append((per_tick_adapter(listener), False))
+        self.orderListeners.append(listener)
+
+    def register_batch_listener(self, listener: Callable, columnar: bool = False) -> None:
+        # listener is called once per broker frame with the list of TickData, or a TickColumns view if columnar
+        # tickers reuse both the list and the TickData objects for the next frame, copy whatever has to outlive the call
+        self.batchListeners.append((listener, columnar))
+
+    def register_order_listener(self, listener: Callable) -> None:
+        self.orderListeners.append(listener)
 
     @abstractmethod
     def register_symbols(self, symbols: List[str]) -> None: ...
@@ -97,17 +312,23 @@ class Ticker(ABC, Generic[B]):
     @abstractmethod
     def unregister_symbols(self, symbols: List[str]) -> None: ...
 
-    def on_new_ticks(self, ticks) -> None:
+    def on_new_ticks(self, ticks: Sequence[TickData]) -> None:
         # logging.info('New ticks received %s', ticks)
-        for tick in ticks:
-            for listener in self.tickListeners:
-                try:
-                    listener(tick)
-                except Exception as e:
-                    logging.error("BaseTicker: Exception from listener callback function. Error => %s", str(e))
+        columns = None
+        for listener, columnar in self.batchListeners:
+            try:
+                if columnar:
+                    if columns is None:
+                        columns = TickColumns(ticks)  # built once per batch, shared by all columnar listeners
+                    listener(columns)
+                else:
+                    listener(ticks)
+            except Exception as e:
+                logging.error("BaseTicker: Exception from batch listener callback function. Error => %s", str(e))
 
     def onConnect(self) -> None:
         logging.info("Ticker connection successful.")
+        self.connects += 1  # order updates sent while disconnected are lost, the algo repairs them from the order book
 
     def onDisconnect(self, code, reason) -> None:
         logging.error("Ticker got disconnected. code = %d, reason = %s", code, reason)
@@ -123,8 +344,17 @@ class Ticker(ABC, Generic[B]):
 
     def on_order_update(self, data: dict) -> None:
         # logging.info('Ticker: order update %s', data)
-        for listener in self.tickListeners:
+        for listener in self.orderListeners:
             try:
                 listener(data)
             except Exception as e:
                 logging.error("BaseTicker: Exception from listener callback function. Error => %s", str(e))
+
+
+def per_tick_adapter(listener: Callable) -> Callable:
+    # lets a listener written for single ticks sit in the batch dispatch, errors abort the rest of its batch only
+    def adapter(ticks: Sequence[TickData]) -> None:
+        for tick in ticks:
+            listener(tick)
+
+    return adapter
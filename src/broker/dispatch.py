@@ -0,0 +1,93 @@
+import asyncio
+import heapq
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from broker.ratelimit import RateLimiter
+from core.clock import get_clock
+from exceptions import StaleOrderRequestException
+from models import OrderPriority
+
+
+class OrderRequest:
+    __slots__ = ("priority", "key", "group", "cancel", "future")
+
+    def __init__(self, priority: OrderPriority, key: Optional[str], group: Optional[str], cancel: bool, future: asyncio.Future) -> None:
+        self.priority = priority
+        self.key = key  # a newer request with the same key (eg an order id) at the same or more urgent priority makes this one stale
+        self.group = group  # what the request belongs to, usually the trade id, see drop()
+        self.cancel = cancel  # a cancel is only superseded by another cancel
+        self.future = future
+
+
+class OrderDispatcher:
+    # Sits in front of the account's order budget (broker.ratelimit "orders") on the algo loop. Order calls are let out
+    # as fast as the budget allows; once they have to queue, the most urgent OrderPriority goes first, so square offs
+    # and SL / target orders never wait behind new entries. Requests still queued can be dropped as stale.
+
+    def __init__(self, name: str, rate_limiter: RateLimiter, kind: str = "orders") -> None:
+        self.name = name
+        self.rate_limiter = rate_limiter
+        self.kind = kind
+        self.queue: List[Tuple[int, int, OrderRequest]] = []
+        self.by_key: Dict[str, OrderRequest] = {}
+        self.count = 0
+        self.pump: Optional[asyncio.Task] = None
+
+    async def admit(self, priority: OrderPriority, key: Optional[str] = None, group: Optional[str] = None, cancel: bool = False) -> None:
+        # returns once the call may go to the broker, raises StaleOrderRequestException if it was dropped meanwhile
+        queued = self.by_key.get(key, None) if key is not None else None
+        if queued is not None:
+            if queued.cancel and (not cancel or priority.value > queued.priority.value):
+                # the order is on its way out already, a modification or a less urgent cancel of it has nothing left to do
+                raise StaleOrderRequestException("Order request " + str(key) + " behind a queued cancel")
+            if priority.value <= queued.priority.value:
+                self._drop(queued, "superseded")
+        if len(self.queue) == 0 and self.rate_limiter.available_in(self.kind) == 0:
+            self.rate_limiter.reserve(self.kind)
+            return
+        request = OrderRequest(priority, key, group, cancel, asyncio.get_running_loop().create_future())
+        self.count += 1
+        heapq.heappush(self.queue, (priority.value, self.count, request))
+        if key is not None and key not in self.by_key:
+            self.by_key[key] = request
+        if self.pump is None or self.pump.done():
+            self.pump = asyncio.create_task(self._pump())
+        await request.future
+
+    def drop(self, group: str, priority: OrderPriority = OrderPriority.ENTRY) -> int:
+        # drops queued requests of group (or whose group starts with it, eg a strategy name) at priority or less urgent
+        dropped = 0
+        for _, _, request in self.queue:
+            if request.future.done() or request.group is None or not request.group.startswith(group) or request.priority.value < priority.value:
+                continue
+            self._drop(request, "dropped")
+            dropped += 1
+        if dropped > 0:
+            logging.info("%s: dropped %d queued order requests of %s", self.name, dropped, group)
+        return dropped
+
+    def pending(self) -> int:
+        return sum(1 for _, _, request in self.queue if not request.future.done())
+
+    def _drop(self, request: OrderRequest, reason: str) -> None:
+        if self.by_key.get(request.key, None) is request:
+            del self.by_key[request.key]
+        if not request.future.done():
+            request.future.set_exception(StaleOrderRequestException("Order request " + str(request.key) + " " + reason + " while queued"))
+
+    async def _pump(self) -> None:
+        queue = self.queue
+        while len(queue) > 0:
+            wait = self.rate_limiter.available_in(self.kind)
+            if wait > 0:
+                await get_clock().sleep_async(wait)
+                continue
+            # the most urgent request as of now, anything queued during the wait included
+            _, _, request = heapq.heappop(queue)
+            if request.future.done():
+                continue
+            if self.by_key.get(request.key, None) is request:
+                del self.by_key[request.key]
+            self.rate_limiter.reserve(self.kind)
+            request.future.set_result(None)
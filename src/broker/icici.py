@@ -4,7 +4,7 @@ import logging
 import time
 import urllib
 from io import BytesIO, TextIOWrapper
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 from urllib.request import urlopen, urlretrieve
 from zipfile import ZipFile
 
@@ -17,15 +17,29 @@ from breeze_connect import config as breeze_config
 from broker import brokers, tickers
 from broker.base import Broker as Base
 from broker.base import Ticker as BaseTicker
+from broker.ratelimit import BREEZE_LIMITS
+from broker.reconcile import (
+    ORDER_BY_EXCHANGE_TIME,
+    ORDER_BY_PROGRESS,
+    OrderBookDiff,
+    accept_update,
+    reconcile_order_book,
+)
 from config import get_system_config
 from core import Quote
-from instruments import get_instrument_data_by_symbol, get_instrument_data_by_token
+from instruments import (
+    get_instrument_data_by_symbol,
+    get_instrument_data_by_token,
+    get_price_slot_by_token,
+)
 from models import Direction, OrderStatus, OrderType, TickData
 from models.order import Order, OrderInputParams, OrderModifyParams
 from utils import get_epoch
 
 
 class Broker(Base[BreezeConnect]):
+    rate_limits = BREEZE_LIMITS
+    update_ordering = ORDER_BY_EXCHANGE_TIME  # of notifications, stamped with messageDate / messageTime, see _apply_order_book_row for order book rows
 
     def login(self, args: Dict) -> str:
         logging.info("==> ICICILogin .args => %s", args)
@@ -58,25 +72,12 @@ class Broker(Base[BreezeConnect]):
         logging.debug("%s:%s:: Going to place order with params %s", self.broker_name, self.short_code, oip)
         breeze = self.broker_handle
         oip.qty = int(oip.qty)
-        import math
-
-        freeze_limit = 900 if oip.trading_symbol.startswith("BANK") else 1800
         isd = get_instrument_data_by_symbol(self.short_code, oip.trading_symbol)
-        lot_size = isd["lot_size"]
-        # leg_count = max(math.ceil(orderInputParams.qty/freeze_limit), 2)
-        # slice = orderInputParams.qty / leg_count
-        # iceberg_quantity = math.ceil(slice / lot_size) * lot_size
-        # iceberg_legs = leg_count
-
-        if oip.qty > freeze_limit and oip.order_type == OrderType.MARKET:
-            oip.order_type = OrderType.LIMIT
 
         try:
+            # orders above the freeze limit arrive here as slices, see broker.slicing
             order_info = breeze.place_order(
                 stock_code=isd["name"],
-                # variety= breeze.VARIETY_REGULAR if orderInputParams.qty<=freeze_limit else breeze.VARIETY_ICEBERG,
-                # iceberg_quantity = iceberg_quantity,
-                # tradingsymbol=orderInputParams.trading_symbol,
                 exchange_code=oip.exchange if oip.is_fno == True else breeze.EXCHANGE_NSE,
                 product=self._convert_to_broker_product(oip.trading_symbol),
                 action=self._convert_to_broker_direction(oip.direction),
@@ -95,16 +96,9 @@ class Broker(Base[BreezeConnect]):
             order.order_id = order_info["Success"]["order_id"]
             order.place_timestamp = get_epoch()
             order.update_timestamp = get_epoch()
-            self.orders_queue.put_nowait(order)
             logging.info("%s:%s:: Order placed successfully, orderId = %s with tag: %s", self.broker_name, self.short_code, order.order_id, oip.tag)
             return order
         except Exception as e:
-            if "Too many requests" in str(e):
-                logging.info("%s:%s retrying order placement in 1 s for %s", self.broker_name, self.short_code, order.order_id)
-                import time
-
-                time.sleep(1)
-                self.place_order(oip)
             logging.info("%s:%s Order placement failed: %s", self.broker_name, self.short_code, str(order_info))
             if "price cannot be" in order_info["Error"]:
                 oip.order_type = OrderType.LIMIT
@@ -117,17 +111,7 @@ class Broker(Base[BreezeConnect]):
     def modify_order(self, order: Order, omp: OrderModifyParams, tradeQty: int) -> Order:
         logging.info("%s:%s:: Going to modify order with params %s", self.broker_name, self.short_code, omp)
 
-        if order.order_type == OrderType.SL_LIMIT and omp.new_trigger_price == order.trigger_price:
-            logging.info("%s:%s:: Not Going to modify order with params %s", self.broker_name, self.short_code, omp)
-            # nothing to modify
-            return order
-        elif order.order_type == OrderType.LIMIT and omp.new_price < 0 or omp.new_price == order.price:
-            # nothing to modify
-            logging.info("%s:%s:: Not Going to modify order with params %s", self.broker_name, self.short_code, omp)
-            return order
-
         breeze = self.broker_handle
-        freeze_limit = 900 if order.trading_symbol.startswith("BANK") else 1800
 
         try:
             orderId = breeze.modify_order(
@@ -142,19 +126,12 @@ class Broker(Base[BreezeConnect]):
             order.update_timestamp = get_epoch()
             return order
         except Exception as e:
-            if "Too many requests" in str(e):
-                logging.info("%s:%s retrying order modification in 1 s for %s", self.broker_name, self.short_code, order.order_id)
-                import time
-
-                time.sleep(1)
-                self.modify_order(order, omp, tradeQty)
             logging.info("%s:%s Order %s modify failed: %s", self.broker_name, self.short_code, order.order_id, str(e))
             raise Exception(str(e))
 
     def cancel_order(self, order: Order) -> Order:
         logging.debug("%s:%s Going to cancel order %s", self.broker_name, self.short_code, order.order_id)
         breeze = self.broker_handle
-        freeze_limit = 900 if order.trading_symbol.startswith("BANK") else 1800
         try:
             orderId = breeze.cancel_order(order_id=order.order_id, exchange_code="NFO")
 
@@ -162,19 +139,14 @@ class Broker(Base[BreezeConnect]):
             order.update_timestamp = get_epoch()
             return order
         except Exception as e:
-            if "Too many requests" in str(e):
-                logging.info("%s:%s retrying order cancellation in 1 s for %s", self.broker_name, self.short_code, order.order_id)
-                import time
-
-                time.sleep(1)
-                self.cancel_order(order)
             logging.info("%s:%s Order cancel failed: %s", self.broker_name, self.short_code, str(e))
             raise Exception(str(e))
 
-    def fetch_update_all_orders(self, orders: Dict[str, Order]) -> List[Order]:
+    def fetch_update_all_orders(self, orders: Dict[str, Order]) -> OrderBookDiff:
         logging.debug("%s:%s Going to fetch order book", self.broker_name, self.short_code)
         breeze = self.broker_handle
         orderBook = None
+        self.rate_limiter.acquire("order_book")
         try:
             orderBook = breeze.get_order_list(
                 exchange_code="NFO",
@@ -186,62 +158,51 @@ class Broker(Base[BreezeConnect]):
 
             traceback.format_exc()
             logging.error("%s:%s Failed to fetch order book", self.broker_name, self.short_code)
-            return []
+            return OrderBookDiff()
+
+        if orderBook is None:
+            return OrderBookDiff()
 
         logging.debug("%s:%s Order book length = %d", self.broker_name, self.short_code, len(orderBook))
-        numOrdersUpdated = 0
-        missingOrders = []
-
-        for bOrder in orderBook:
-            foundOrder = None
-            foundChildOrder = None
-            parentOrder = None
-            for order in orders.values():
-                if order.order_id == bOrder["order_id"]:
-                    foundOrder = order
-                if order.order_id == bOrder["parent_order_id"]:
-                    foundChildOrder = bOrder
-                    parentOrder = order
-
-            if foundOrder != None:
-                assert foundOrder is not None
-                logging.debug("Found order for orderId %s", foundOrder.order_id)
-                foundOrder.qty = int(bOrder["quantity"])
-                foundOrder.pending_qty = int(bOrder["pending_quantity"])
-                foundOrder.filled_qty = foundOrder.qty - foundOrder.pending_qty
-
-                foundOrder.order_status = self._map_order_status(foundOrder, bOrder["status"])
-                foundOrder.price = float(bOrder["price"])
-                foundOrder.trigger_price = float(bOrder["SLTP_price"]) if bOrder["SLTP_price"] != None else 0.0
-                foundOrder.average_price = float(bOrder["average_price"])
-                foundOrder.update_timestamp = bOrder["exchange_acknowledgement_date"]
-                logging.debug("%s:%s:%s Updated order %s", self.broker_name, self.short_code, orders[foundOrder.order_id], foundOrder)
-                numOrdersUpdated += 1
-            elif foundChildOrder != None:
-                assert parentOrder is not None
-                oip = OrderInputParams(parentOrder.trading_symbol)
-                oip.exchange = parentOrder.exchange
-                oip.product_type = parentOrder.product_type
-                oip.order_type = parentOrder.order_type
-                oip.price = parentOrder.price
-                oip.trigger_price = parentOrder.trigger_price
-                oip.qty = parentOrder.qty
-                oip.tag = parentOrder.tag
-                oip.product_type = parentOrder.product_type
-                order = Order(oip)
-                order.order_id = bOrder["order_id"]
-                order.parent_order_id = parentOrder.order_id
-                order.place_timestamp = get_epoch()  # TODO should get from bOrder
-                missingOrders.append(order)
-
-        return missingOrders
+        diff = reconcile_order_book(orders, orderBook, self._apply_order_book_row)
+        logging.debug("%s:%s Order book: %d changed, %d new child orders", self.broker_name, self.short_code, len(diff.changed), len(diff.new_children))
+        return diff
+
+    def _apply_order_book_row(self, order: Order, bOrder: Dict) -> None:
+        qty = int(bOrder["quantity"])
+        pending_qty = int(bOrder["pending_quantity"])
+        status = self._map_order_status(order, bOrder["status"])
+        # a row only carries when the order was placed and acknowledged, never when it last changed, so any notification
+        # is newer than its row: rows are put in order by the order's progress, not by their times
+        exchange_epoch = max(self._exchange_epoch(bOrder.get("exchange_acknowledgement_date", None)), self._exchange_epoch(bOrder.get("order_datetime", None)))
+        if not accept_update(order, exchange_epoch, status, qty - pending_qty, ORDER_BY_PROGRESS):
+            logging.debug("%s:%s Dropped out of sequence update of order %s: %s", self.broker_name, self.short_code, order.order_id, bOrder["status"])
+            return
+        order.qty = qty
+        order.pending_qty = pending_qty
+        order.apply_update(status, qty - pending_qty, float(bOrder["average_price"]))
+        order.price = float(bOrder["price"])
+        order.trigger_price = float(bOrder["SLTP_price"]) if bOrder["SLTP_price"] != None else 0.0
+        order.update_timestamp = bOrder["exchange_acknowledgement_date"]
 
     def handle_order_update_tick(self, order: Order, tick: Dict):
-
-        order.order_status = self._map_order_status(order, tick["orderStatus"])
-        order.average_price = float(tick.get("averageExecutredRate", 0.0))
-        order.filled_qty = int(tick["executedQuantity"])
-        order.update_timestamp = int(datetime.datetime.strptime(tick["messageDate"] + " " + tick["messageTime"], "%d-%m-%Y %H:%M:%S").timestamp())
+        status = self._map_order_status(order, tick["orderStatus"])
+        filled_qty = int(tick["executedQuantity"])
+        exchange_epoch = int(datetime.datetime.strptime(tick["messageDate"] + " " + tick["messageTime"], "%d-%m-%Y %H:%M:%S").timestamp())
+        if not accept_update(order, exchange_epoch, status, filled_qty, self.update_ordering):
+            logging.debug("%s:%s Dropped out of sequence notification of order %s: %s", self.broker_name, self.short_code, order.order_id, tick["orderStatus"])
+            return
+        order.apply_update(status, filled_qty, float(tick.get("averageExecutredRate", 0.0)))
+        order.update_timestamp = exchange_epoch
+
+    def order_update_id(self, data: Dict) -> Optional[str]:
+        return data.get("orderReference", None)
+
+    def _exchange_epoch(self, timestamp: Optional[str]) -> int:
+        try:
+            return int(dateutil.parser.parse(timestamp).timestamp()) if timestamp else 0
+        except (ValueError, OverflowError):
+            return 0
 
     def _get_instrument_right(self, trading_symbol):
         if trading_symbol[-2:] == "PE":
@@ -288,6 +249,8 @@ class Broker(Base[BreezeConnect]):
     def get_quote(self, trading_symbol: str, short_code: str, isFnO: bool, exchange: str) -> Quote:
         isd = get_instrument_data_by_symbol(short_code, trading_symbol)
         bQuote = self._quote(isd)
+        if bQuote is None:
+            raise Exception("No quote for " + trading_symbol)
         quote = Quote(trading_symbol)
         quote.trading_symbol = trading_symbol
         quote.last_traded_price = bQuote["ltp"]
@@ -312,6 +275,8 @@ class Broker(Base[BreezeConnect]):
     def get_index_quote(self, trading_symbol, short_code, exchange="NSE"):
         isd = get_instrument_data_by_symbol(short_code, trading_symbol)
         bQuote = self._quote(isd)
+        if bQuote is None:
+            raise Exception("No quote for " + trading_symbol)
         quote = Quote(trading_symbol)
         quote.trading_symbol = trading_symbol
         quote.last_traded_price = bQuote["ltp"]
@@ -333,7 +298,8 @@ class Broker(Base[BreezeConnect]):
 
         return quote
 
-    def _quote(self, isd):
+    def _quote(self, isd, attempt=0):
+        # None if it still fails after quote_retries retries
         product_type = ""
         right = ""
         retry = False
@@ -347,6 +313,7 @@ class Broker(Base[BreezeConnect]):
             product_type = "futures"
             right = "Others"
 
+        self.rate_limiter.acquire("quotes")
         try:
             return self.broker_handle.get_quotes(
                 stock_code=isd["name"],
@@ -357,12 +324,21 @@ class Broker(Base[BreezeConnect]):
                 strike_price=isd["strike"],
             )["Success"][0]
         except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 503:
-                retry = True
+            if e.response.status_code not in [429, 503]:
+                return None
+            if attempt >= self.quote_retries:
+                logging.error("%s:%s get_quote for %s failed after %d retries", self.broker_name, self.short_code, isd["name"], attempt)
+                return None
+            if e.response.status_code == 429:
+                # over the budget anyway, hold back every call of this account, the retry queues behind them
+                self.rate_limiter.pause("quotes")
+                logging.info("retrying get_quote for %s after a rate limit rejection", isd["name"])
+                return self._quote(isd, attempt + 1)
+            retry = True
         if retry:
             time.sleep(1)
             logging.info("retrying get_quote after 1 s for %s", isd["name"])
-            return self._quote(isd)
+            return self._quote(isd, attempt + 1)
 
     def margins(self) -> List:
         return []
@@ -371,6 +347,7 @@ class Broker(Base[BreezeConnect]):
         return []
 
     def orders(self) -> List:
+        self.rate_limiter.acquire("order_book")
         order_list = self.broker_handle.get_order_list(
             exchange_code="NFO",
             from_date=datetime.datetime.now().isoformat()[:10] + "T05:30:00.000Z",
@@ -497,6 +474,14 @@ class Ticker(BaseTicker[Broker]):
 
     def __init__(self, short_code, broker_handler: Broker):
         super().__init__(short_code, broker_handler)
+        self.tick_buffers: Dict[str, Tuple[TickData, bool]] = {}  # instrument token => (reused TickData, is index)
+        self.batch: List[TickData] = [TickData("")]  # breeze delivers one tick per callback
+
+    def _tick_buffer(self, instrument_token) -> Tuple[TickData, bool]:
+        isd = get_instrument_data_by_token(self.short_code, instrument_token)
+        tick_buffer = (TickData(isd["tradingsymbol"], get_price_slot_by_token(self.short_code, instrument_token)), isd["segment"] == "INDICES")
+        self.tick_buffers[instrument_token] = tick_buffer
+        return tick_buffer
 
     def start_ticker(self):
 
@@ -527,17 +512,19 @@ class Ticker(BaseTicker[Broker]):
                 if "symbol" in bTick:
                     logging.debug(bTick["symbol"] + " => " + str(bTick["last"]))
                     # convert broker specific Ticks to our system specific Ticks (models.TickData) and pass to super class function
-                    ticks = []
-                    isd = get_instrument_data_by_token(self.short_code, bTick["symbol"][4:])
-                    trading_symbol = isd["tradingsymbol"]
-                    tick = TickData(trading_symbol)
+                    instrument_token = bTick["symbol"][4:]
+                    tick_buffer = self.tick_buffers.get(instrument_token, None)
+                    if tick_buffer is None:
+                        tick_buffer = self._tick_buffer(instrument_token)
+                    tick, is_index = tick_buffer
                     tick.lastTradedPrice = bTick["last"]
-                    if not isd["segment"] == "INDICES":
+                    if not is_index:
                         tick.lastTradedQuantity = bTick["ltq"]
                         tick.avgTradedPrice = bTick["avgPrice"]
                         tick.volume = bTick["ttq"]
                         tick.totalBuyQuantity = bTick["totalBuyQt"]
                         tick.totalSellQuantity = bTick["totalSellQ"]
+                        tick.oi = bTick.get("OI", 0)
                     # else:
                     #   tick.exchange_timestamp = bTick['exchange_timestamp']
                     tick.open = bTick["open"]
@@ -545,8 +532,8 @@ class Ticker(BaseTicker[Broker]):
                     tick.low = bTick["low"]
                     tick.close = bTick["close"]
                     tick.change = bTick["change"]
-                    ticks.append(tick)
-                    self.on_new_ticks(ticks)
+                    self.batch[0] = tick
+                    self.on_new_ticks(self.batch)
                 else:
                     self.on_order_update(bTick)
 
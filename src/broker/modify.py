@@ -0,0 +1,95 @@
+import asyncio
+import copy
+from typing import Dict
+
+from models import OrderType
+from models.order import Order, OrderInputParams, OrderModifyParams
+
+
+class ModificationManager:
+    # Per account bookkeeping of order modifications, used by Broker.modify_order_async. Modifications of one order go
+    # out one at a time and only the newest waiting one is sent, changes the order already has are dropped, and every
+    # order's modification count is kept against the broker's limit so it can be cancelled and placed again instead.
+
+    def __init__(self, name: str, limit: int, reserve: int) -> None:
+        self.name = name
+        self.limit = limit  # modifications the broker accepts per order
+        self.reserve = reserve  # cancel and replace once only this many are left
+        self.latest: Dict[str, OrderModifyParams] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.sent = 0
+        self.coalesced = 0  # superseded by a newer modification before they were sent
+        self.noops = 0
+        self.replaced = 0
+
+    def submit(self, order_id: str, omp: OrderModifyParams) -> asyncio.Lock:
+        self.latest[order_id] = omp
+        if order_id not in self.locks:
+            self.locks[order_id] = asyncio.Lock()
+        return self.locks[order_id]
+
+    def take(self, order_id: str, omp: OrderModifyParams) -> bool:
+        # with the order's lock held: False if a newer modification came in while this one waited
+        if self.latest.get(order_id, None) is not omp:
+            self.coalesced += 1
+            return False
+        del self.latest[order_id]
+        return True
+
+    def release(self, order_id: str) -> None:
+        # after the order's lock is released: nothing newer is waiting for it (waiters are in latest), so it can go
+        if order_id not in self.latest:
+            self.locks.pop(order_id, None)
+
+    def is_noop(self, order: Order, omp: OrderModifyParams) -> bool:
+        # the brokers' modify calls send whatever they are given, what isn't worth a modification is decided here: an
+        # SL_LIMIT order moves with its trigger price, a new limit price alone only counts when no trigger price is given
+        price_same = omp.new_price <= 0 or omp.new_price == order.price
+        trigger_same = omp.new_trigger_price <= 0 or omp.new_trigger_price == order.trigger_price
+        qty_same = omp.new_qty <= 0 or omp.new_qty == order.qty
+        if order.order_type == OrderType.SL_LIMIT:
+            noop = qty_same and (omp.new_trigger_price == order.trigger_price or (omp.new_trigger_price <= 0 and price_same))
+        else:
+            noop = price_same and trigger_same and qty_same
+        if noop:
+            self.noops += 1
+        return noop
+
+    def should_replace(self, order: Order) -> bool:
+        return order.direction is not None and self.limit - order.modify_count <= self.reserve
+
+    def applied(self, order: Order, omp: OrderModifyParams) -> None:
+        # the order book / order updates confirm it later, until then the order carries what was sent
+        self.sent += 1
+        order.modify_count += 1
+        if omp.new_price > 0:
+            order.price = omp.new_price
+        if omp.new_trigger_price > 0:
+            order.trigger_price = omp.new_trigger_price
+
+
+def replacement_params(order: Order, omp: OrderModifyParams) -> OrderInputParams:
+    # the order as modified by omp, for what is still unfilled of it
+    oip = OrderInputParams(order.trading_symbol)
+    oip.exchange = order.exchange
+    oip.is_fno = order.is_fno
+    oip.direction = order.direction
+    oip.product_type = order.product_type
+    oip.order_type = order.order_type
+    oip.price = omp.new_price if omp.new_price > 0 else order.price
+    oip.trigger_price = omp.new_trigger_price if omp.new_trigger_price > 0 else order.trigger_price
+    oip.qty = order.qty - order.filled_qty
+    oip.tag = order.tag
+    return oip
+
+
+def split_off(order: Order) -> Order:
+    # turns a plain order into the aggregate of its broker order and the replacements to come (see broker.slicing), in
+    # place, so strategies holding it keep seeing the one order. The broker order goes on as a new child Order with the
+    # same order id, order keeps it too: order calls, modifications, waiters and order updates keyed by it stay valid.
+    child = copy.copy(order)
+    child.child_orders = []
+    child.aggregate = None  # the trade's aggregate follows order, which now sums up the child
+    child.parent_order_id = order.order_id
+    order.child_orders = [child]
+    return child
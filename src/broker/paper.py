@@ -0,0 +1,297 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from broker import brokers, load_broker_module, tickers
+from broker.base import Broker as Base
+from broker.base import Ticker as BaseTicker
+from broker.reconcile import OrderBookDiff, accept_update
+from config import get_user_config
+from core import Quote
+from core.clock import get_clock
+from models import Direction, OrderPriority, OrderStatus, OrderType, TickData
+from models.order import Order, OrderInputParams, OrderModifyParams
+from utils import get_epoch
+
+
+class RestingOrder:
+    # the matching engine's own copy of an order, Order objects are only changed through order updates on the algo loop
+    __slots__ = ("order_id", "trading_symbol", "long", "order_type", "price", "trigger_price", "qty", "status", "ready_at")
+
+    def __init__(self, order_id: str, oip: OrderInputParams, ready_at: float) -> None:
+        self.order_id = order_id
+        self.trading_symbol = oip.trading_symbol
+        self.long = oip.direction == Direction.LONG
+        self.order_type = oip.order_type
+        self.price = oip.price
+        self.trigger_price = oip.trigger_price
+        self.qty = int(oip.qty)
+        self.status = OrderStatus.TRIGGER_PENDING if oip.order_type in [OrderType.SL_LIMIT, OrderType.SL_MARKET] else OrderStatus.OPEN
+        self.ready_at = ready_at  # clock epoch from which the exchange "has" the order, placement / modification latency
+
+
+class MatchingEngine:
+    # Fills paper orders against the tick stream, deterministically for a given sequence of ticks and clock readings.
+    # MARKET fills at the next price, LIMIT once the price is at or through the limit, SL orders trigger once the price
+    # reaches the trigger price and then fill like their LIMIT / MARKET part. Fills are all or nothing.
+    # slippage moves every fill against the order by that fraction of the price, LIMIT fills never go past their limit.
+
+    def __init__(self, latency: float = 0.0, slippage: float = 0.0) -> None:
+        self.latency = latency  # seconds
+        self.slippage = slippage
+        self.lock = threading.Lock()  # orders come from the algo loop, ticks from the ticker thread
+        self.resting: Dict[str, RestingOrder] = {}
+        self.last_prices: Dict[str, float] = {}
+        self.updates: List[Dict[str, Any]] = []  # order updates since the last on_ticks, kite postback style
+        self.order_count = 0
+
+    def place(self, oip: OrderInputParams) -> str:
+        with self.lock:
+            self.order_count += 1
+            order_id = "paper-" + str(self.order_count)
+            self.resting[order_id] = RestingOrder(order_id, oip, get_clock().timestamp() + self.latency)
+            self._match_at_last_price(self.resting[order_id])
+            return order_id
+
+    def modify(self, order_id: str, price: float, trigger_price: float, qty: int) -> None:
+        with self.lock:
+            resting = self.resting.get(order_id, None)
+            if resting is None:
+                raise Exception("Order " + order_id + " can't be modified, it is not open")
+            if price > 0:
+                resting.price = price
+            if trigger_price > 0:
+                resting.trigger_price = trigger_price
+            if qty > 0:
+                resting.qty = int(qty)
+            resting.ready_at = get_clock().timestamp() + self.latency
+            self._update(resting, 0, 0.0)
+            self._match_at_last_price(resting)
+
+    def cancel(self, order_id: str) -> None:
+        with self.lock:
+            resting = self.resting.pop(order_id, None)
+            if resting is None:
+                raise Exception("Order " + order_id + " can't be cancelled, it is not open")
+            resting.status = OrderStatus.CANCELLED
+            self._update(resting, 0, 0.0)
+
+    def on_ticks(self, ticks: Sequence[TickData]) -> List[Dict[str, Any]]:
+        # returns the order updates caused by these ticks and by order calls since the last batch
+        with self.lock:
+            last_prices = self.last_prices
+            for tick in ticks:
+                last_prices[tick.trading_symbol] = tick.lastTradedPrice
+            if len(self.resting) > 0:
+                now = get_clock().timestamp()
+                for resting in list(self.resting.values()):
+                    if resting.ready_at <= now and resting.trading_symbol in last_prices:
+                        self._match(resting, last_prices[resting.trading_symbol])
+            updates, self.updates = self.updates, []
+            return updates
+
+    def _match_at_last_price(self, resting: RestingOrder) -> None:
+        if resting.ready_at <= get_clock().timestamp() and resting.trading_symbol in self.last_prices:
+            self._match(resting, self.last_prices[resting.trading_symbol])
+
+    def _match(self, resting: RestingOrder, ltp: float) -> None:
+        long = resting.long
+        if resting.status == OrderStatus.TRIGGER_PENDING:
+            if (long and ltp < resting.trigger_price) or (not long and ltp > resting.trigger_price):
+                return
+            resting.status = OrderStatus.OPEN
+            self._update(resting, 0, 0.0)
+        fill_price = ltp * (1 + self.slippage) if long else ltp * (1 - self.slippage)
+        if resting.order_type not in [OrderType.MARKET, OrderType.SL_MARKET]:
+            if (long and ltp > resting.price) or (not long and ltp < resting.price):
+                return
+            fill_price = min(fill_price, resting.price) if long else max(fill_price, resting.price)
+        del self.resting[resting.order_id]
+        resting.status = OrderStatus.COMPLETE
+        self._update(resting, resting.qty, round(fill_price, 2))
+
+    def _update(self, resting: RestingOrder, filled_qty: int, average_price: float) -> None:
+        self.updates.append(
+            {
+                "order_id": resting.order_id,
+                "status": resting.status.value,
+                "price": resting.price,
+                "trigger_price": resting.trigger_price,
+                "quantity": resting.qty,
+                "filled_quantity": filled_qty,
+                "pending_quantity": resting.qty - filled_qty if resting.status != OrderStatus.CANCELLED else 0,
+                "average_price": average_price,
+                "exchange_update_timestamp": get_epoch(),
+            }
+        )
+
+
+class Broker(Base[Any]):
+    # Paper trading: orders go to a local MatchingEngine, market data (login, instruments, ticks, quotes) comes from
+    # the data broker named in the user config, or only from pushed ticks when there is none (replay).
+    # user config: "broker": "paper", "paper": {"data_broker": "zerodha", "latency_ms": 50, "slippage": 0.0005}
+
+    def __init__(self, user_details: Dict) -> None:
+        super().__init__(user_details)
+        settings = user_details.get("paper", None)
+        if settings is None:
+            settings = paper_config(self.short_code)
+        self.engine = MatchingEngine(float(settings.get("latency_ms", 0)) / 1000, float(settings.get("slippage", 0)))
+        self.last_ticks: Dict[str, TickData] = {}
+        self.data_broker: Optional[Base] = None
+        self.data_broker_name: Optional[str] = settings.get("data_broker", None)
+        if self.data_broker_name is not None:
+            load_broker_module(self.data_broker_name)
+            self.data_broker = brokers[self.data_broker_name](dict(user_details, broker_name=self.data_broker_name))
+
+    def login(self, args: Dict) -> str:
+        if self.data_broker is None:
+            return ""
+        redirect_url = self.data_broker.login(args)
+        self.access_token = self.data_broker.get_access_token()
+        return redirect_url
+
+    def set_access_token(self, access_token: str) -> None:
+        self.access_token = access_token
+        if self.data_broker is not None:
+            self.data_broker.set_access_token(access_token)
+
+    def place_order(self, oip: OrderInputParams) -> Order:
+        logging.debug("%s:%s:: Going to place order with params %s", self.broker_name, self.short_code, oip)
+        order = Order(oip)
+        order.order_id = self.engine.place(oip)
+        order.order_status = OrderStatus.TRIGGER_PENDING if oip.order_type in [OrderType.SL_LIMIT, OrderType.SL_MARKET] else OrderStatus.OPEN
+        order.pending_qty = order.qty
+        order.place_timestamp = get_epoch()
+        order.update_timestamp = get_epoch()
+        logging.info("%s:%s:: Order placed successfully, orderId = %s with tag: %s", self.broker_name, self.short_code, order.order_id, oip.tag)
+        return order
+
+    def modify_order(self, order: Order, omp: OrderModifyParams, qty: int) -> Order:
+        logging.info("%s:%s:: Going to modify order %s with params %s", self.broker_name, self.short_code, order.order_id, omp)
+        self.engine.modify(order.order_id, omp.new_price, omp.new_trigger_price, omp.new_qty)
+        order.update_timestamp = get_epoch()
+        return order
+
+    def cancel_order(self, order: Order) -> Order:
+        logging.debug("%s:%s Going to cancel order %s", self.broker_name, self.short_code, order.order_id)
+        self.engine.cancel(order.order_id)
+        order.update_timestamp = get_epoch()
+        return order
+
+    async def run_order_call(self, priority: OrderPriority, key: Optional[str], group: Optional[str], call: Callable, *args: Any) -> Any:
+        # engine calls never block, running them inline keeps a replay's order of events the same on every run
+        sent = get_clock().timestamp()
+        result = call(*args)
+        self.latency.on_call(call.__name__, args[0], result, sent)
+        return result
+
+    def fetch_update_all_orders(self, orders: Dict[str, Order]) -> OrderBookDiff:
+        return OrderBookDiff()  # every change already went out as an order update, there is no order book to reconcile with
+
+    def handle_order_update_tick(self, order: Order, data: Dict) -> None:
+        if not accept_update(order, data["exchange_update_timestamp"], OrderStatus(data["status"]), data["filled_quantity"], self.update_ordering):
+            return
+        order.apply_update(OrderStatus(data["status"]), data["filled_quantity"], data["average_price"])
+        order.price = data["price"]
+        order.trigger_price = data["trigger_price"]
+        order.qty = data["quantity"]
+        order.pending_qty = data["pending_quantity"]
+        order.update_timestamp = data["exchange_update_timestamp"]
+
+    def on_ticks(self, ticks: Sequence[TickData]) -> List[Dict[str, Any]]:
+        for tick in ticks:
+            self.last_ticks[tick.trading_symbol] = tick.copy()
+        return self.engine.on_ticks(ticks)
+
+    def get_quote(self, trading_symbol: str, short_code: str, isFnO: bool, exchange: str) -> Quote:
+        tick = self.last_ticks.get(trading_symbol, None)
+        if tick is None:
+            if self.data_broker is not None:
+                return self.data_broker.get_quote(trading_symbol, short_code, isFnO, exchange)
+            raise KeyError(trading_symbol)
+        quote = Quote(trading_symbol)
+        quote.last_traded_price = tick.lastTradedPrice
+        quote.last_traded_quantity = tick.lastTradedQuantity
+        quote.avg_traded_price = tick.avgTradedPrice
+        quote.volume = tick.volume
+        quote.total_buy_quantity = tick.totalBuyQuantity
+        quote.total_sell_quantity = tick.totalSellQuantity
+        quote.open = tick.open
+        quote.high = tick.high
+        quote.low = tick.low
+        quote.close = tick.close
+        quote.change = tick.change
+        quote.oi = tick.oi
+        return quote
+
+    def get_quotes(self, trading_symbols: List[str], short_code: str, isFnO: bool, exchange: str) -> Dict[str, Quote]:
+        quotes = {symbol: self.get_quote(symbol, short_code, isFnO, exchange) for symbol in trading_symbols if symbol in self.last_ticks}
+        missing = [symbol for symbol in trading_symbols if symbol not in quotes]
+        if len(missing) > 0 and self.data_broker is not None:
+            quotes.update(self.data_broker.get_quotes(missing, short_code, isFnO, exchange))
+        return quotes
+
+    def get_index_quote(self, trading_symbol: str, short_code: str, exchange: str = "NSE") -> Quote:
+        if trading_symbol not in self.last_ticks and self.data_broker is not None:
+            return self.data_broker.get_index_quote(trading_symbol, short_code, exchange)
+        return self.get_quote(trading_symbol, short_code, False, exchange)
+
+    def margins(self) -> List:
+        return []
+
+    def positions(self) -> List:
+        return []
+
+    def orders(self) -> List:
+        return []
+
+    def instruments(self, exchange: str) -> List:
+        if self.data_broker is None:
+            return []
+        return self.data_broker.instruments(exchange)
+
+
+class Ticker(BaseTicker[Broker]):
+    # Relays the data broker's ticker, running the matching engine on every batch first so fills go out as order updates.
+    # Without a data broker something else (a replay) pushes batches into on_feed_ticks.
+
+    def __init__(self, short_code: str, broker: Broker) -> None:
+        super().__init__(short_code, broker)
+        self.feed: Optional[BaseTicker] = None
+        if broker.data_broker is not None:
+            self.feed = tickers[broker.data_broker_name](short_code, broker.data_broker)
+            self.feed.register_batch_listener(self.on_feed_ticks)
+
+    def start_ticker(self) -> None:
+        if self.feed is not None:
+            self.feed.start_ticker()
+
+    def stop_ticker(self) -> None:
+        if self.feed is not None:
+            self.feed.stop_ticker()
+
+    def register_symbols(self, symbols: List[str]) -> None:
+        if self.feed is not None:
+            self.feed.register_symbols(symbols)
+
+    def unregister_symbols(self, symbols: List[str]) -> None:
+        if self.feed is not None:
+            self.feed.unregister_symbols(symbols)
+
+    def on_feed_ticks(self, ticks: Sequence[TickData]) -> None:
+        updates = self.broker.on_ticks(ticks)
+        self.on_new_ticks(ticks)
+        for data in updates:
+            self.on_order_update(data)
+
+
+def paper_config(short_code: str) -> Dict:
+    try:
+        return get_user_config(short_code).get("paper", {})
+    except FileNotFoundError:
+        return {}
+
+
+brokers["paper"] = Broker
+tickers["paper"] = Ticker
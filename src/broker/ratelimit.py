@@ -0,0 +1,120 @@
+import logging
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+from config import get_user_config
+from core.clock import get_clock
+
+# Published per account API limits as (requests per second, burst) budgets, a call waits for a token in every budget
+# of its kind. Calls of a kind without its own budgets use "default". Overridable per user with "rate_limits" in the
+# user config, eg "rate_limits": {"quotes": [[1, 1]], "orders": [[10, 10], [3.33, 200]]}
+KITE_LIMITS: Dict[str, List[Tuple[float, int]]] = {
+    "orders": [(10, 10), (200 / 60, 200)],  # 10 per second, 200 per minute for place, modify and cancel
+    "quotes": [(1, 1)],
+    "default": [(10, 10)],  # order book and every other endpoint
+}
+# Breeze allows 100 calls per minute across all endpoints, split so quotes (a strike chain without a live option chain
+# is one call per strike) can't hold order calls back: orders keep 30 of them even if they end up unused
+BREEZE_LIMITS: Dict[str, List[Tuple[float, int]]] = {
+    "orders": [(30 / 60, 30)],
+    "default": [(70 / 60, 70)],  # quotes, order book and every other endpoint
+}
+
+
+class TokenBucket:
+    # rate tokens per second up to burst. Tokens are handed out in order and may go negative: every caller reserves
+    # the next free slot and waits for it, so callers queue instead of all retrying at the same moment.
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = get_clock().timestamp()
+
+    def reserve(self, now: float) -> float:
+        # takes a token, returns the seconds until it may be used
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def available_in(self, now: float) -> float:
+        # seconds until reserve() would not have to wait, without taking a token
+        tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def pause(self, now: float, seconds: float) -> None:
+        # the broker rejected a call anyway, nothing goes out of this bucket for the next seconds
+        self.reserve(now)
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class RateLimiter:
+    # One per broker account (see get_rate_limiter), shared by the algo loop, order executor threads and views.
+
+    def __init__(self, name: str, budgets: Dict[str, Sequence[Tuple[float, int]]]) -> None:
+        self.name = name
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, List[TokenBucket]] = {kind: [TokenBucket(rate, burst) for rate, burst in limits] for kind, limits in budgets.items()}
+        self.calls: Dict[str, int] = {}
+        self.queued: Dict[str, int] = {}  # calls which had to wait for a token
+        self.waited: Dict[str, float] = {}  # total seconds spent waiting
+
+    def kind_buckets(self, kind: str) -> List[TokenBucket]:
+        buckets = self.buckets.get(kind, None)
+        return buckets if buckets is not None else self.buckets.get("default", [])
+
+    def reserve(self, kind: str) -> float:
+        buckets = self.kind_buckets(kind)
+        with self.lock:
+            now = get_clock().timestamp()
+            wait = max([bucket.reserve(now) for bucket in buckets], default=0.0)
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            if wait > 0:
+                self.queued[kind] = self.queued.get(kind, 0) + 1
+                self.waited[kind] = self.waited.get(kind, 0.0) + wait
+        if wait > 1:
+            logging.info("%s: %s call queued for %.2f s by the rate limiter", self.name, kind, wait)
+        return wait
+
+    def available_in(self, kind: str) -> float:
+        buckets = self.kind_buckets(kind)
+        with self.lock:
+            now = get_clock().timestamp()
+            return max([bucket.available_in(now) for bucket in buckets], default=0.0)
+
+    def acquire(self, kind: str) -> None:
+        # blocking, for REST calls made off the algo loop or by sync code
+        wait = self.reserve(kind)
+        if wait > 0:
+            get_clock().sleep(wait)
+
+    async def acquire_async(self, kind: str) -> None:
+        wait = self.reserve(kind)
+        if wait > 0:
+            await get_clock().sleep_async(wait)
+
+    def pause(self, kind: str, seconds: float = 1.0) -> None:
+        buckets = self.kind_buckets(kind)
+        with self.lock:
+            now = get_clock().timestamp()
+            for bucket in buckets:
+                bucket.pause(now, seconds)
+        logging.info("%s: %s calls paused for %.2f s after a rate limit rejection", self.name, kind, seconds)
+
+
+limiters: Dict[str, RateLimiter] = {}
+limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(broker_name: str, short_code: str, defaults: Dict[str, List[Tuple[float, int]]]) -> RateLimiter:
+    key = broker_name + ":" + short_code
+    with limiters_lock:
+        if key not in limiters:
+            budgets = dict(defaults)
+            try:
+                budgets.update(get_user_config(short_code).get("rate_limits", {}))
+            except FileNotFoundError:
+                pass
+            limiters[key] = RateLimiter(key, budgets)
+        return limiters[key]
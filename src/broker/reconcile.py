@@ -0,0 +1,97 @@
+import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from models import OrderStatus
+from models.order import TERMINAL_STATUSES, Order, OrderInputParams
+from utils import get_epoch
+
+
+class OrderBookDiff:
+    # outcome of one order book reconciliation
+    def __init__(self) -> None:
+        self.changed: List[Order] = []  # known orders whose status, fills or prices changed with this order book
+        self.new_children: List[Order] = []  # orders the broker split off a known order (iceberg legs), not known yet
+        self.unknown: List[Dict[str, Any]] = []  # order book rows of orders placed outside this algo
+
+    def __len__(self) -> int:
+        return len(self.changed) + len(self.new_children)
+
+
+def to_epoch(timestamp: Any) -> int:
+    # exchange timestamps come as datetime, "YYYY-MM-DD HH:MM:SS" strings or epochs depending on broker and channel
+    if timestamp is None or timestamp == "":
+        return 0
+    if isinstance(timestamp, datetime.datetime):
+        return int(timestamp.timestamp())
+    if isinstance(timestamp, str):
+        return int(datetime.datetime.strptime(timestamp[:19], "%Y-%m-%d %H:%M:%S").timestamp())
+    return int(timestamp)
+
+
+# how accept_update puts the order updates and order book rows of a broker in order, see Broker.update_ordering
+ORDER_BY_EXCHANGE_TIME = "exchange_time"  # every update carries the exchange time of the change it reports
+ORDER_BY_PROGRESS = "progress"  # update times are missing or not comparable, only fills and terminal statuses order updates
+
+
+def accept_update(order: Order, exchange_epoch: int, status: Optional[OrderStatus], filled_qty: int, ordering: str = ORDER_BY_EXCHANGE_TIME) -> bool:
+    # websocket order updates and order book rows race each other and can arrive out of order. One with fewer fills or
+    # one the order's state machine doesn't allow (models.order) is dropped. One which moves the order forward, more
+    # fills or a terminal status, is applied whatever its time, exchange times come in seconds at best. Anything else
+    # older than the last update applied is dropped when the broker orders updates by exchange time.
+    if filled_qty < order.filled_qty or not order.can_move_to(status):
+        return False
+    progress = filled_qty > order.filled_qty or (status in TERMINAL_STATUSES and status != order.order_status)
+    if not progress and ordering == ORDER_BY_EXCHANGE_TIME and exchange_epoch < order.exchange_timestamp:
+        return False
+    order.exchange_timestamp = max(order.exchange_timestamp, exchange_epoch)
+    return True
+
+
+def order_state(order: Order) -> tuple:
+    return (order.order_status, order.filled_qty, order.pending_qty, order.qty, order.price, order.trigger_price, order.average_price)
+
+
+def child_order(parent: Order, order_id: str) -> Order:
+    oip = OrderInputParams(parent.trading_symbol)
+    oip.exchange = parent.exchange
+    oip.product_type = parent.product_type
+    oip.order_type = parent.order_type
+    oip.price = parent.price
+    oip.trigger_price = parent.trigger_price
+    oip.qty = parent.qty
+    oip.tag = parent.tag
+    order = Order(oip)
+    order.order_id = order_id
+    order.parent_order_id = parent.order_id
+    order.place_timestamp = get_epoch()
+    return order
+
+
+def reconcile_order_book(
+    orders: Dict[str, Order],
+    order_book: Iterable[Dict[str, Any]],
+    apply_row: Callable[[Order, Dict[str, Any]], None],
+    order_id_key: str = "order_id",
+    parent_id_key: str = "parent_order_id",
+) -> OrderBookDiff:
+    # orders is keyed by order_id, so every row is one lookup by its own id and, failing that, one by its parent id.
+    # apply_row is the broker's conversion of a row onto an Order; children get it too, before they are returned.
+    diff = OrderBookDiff()
+    for row in order_book:
+        order_id = str(row[order_id_key])
+        order = orders.get(order_id, None)
+        if order is not None:
+            before = order_state(order)
+            apply_row(order, row)
+            if order_state(order) != before:
+                diff.changed.append(order)
+            continue
+        parent_id = row.get(parent_id_key, None)
+        parent = orders.get(str(parent_id), None) if parent_id else None
+        if parent is not None:
+            child = child_order(parent, order_id)
+            apply_row(child, row)
+            diff.new_children.append(child)
+        else:
+            diff.unknown.append(row)
+    return diff
@@ -0,0 +1,111 @@
+import copy
+import functools
+from typing import Dict, List, Optional
+
+from config import get_user_config
+from models import OrderStatus
+from models.order import TERMINAL_STATUSES, Order, OrderInputParams
+from utils import get_epoch
+
+# Exchange freeze quantities by underlying (the instrument's "name", Kite and Breeze short names both), an order above
+# it is rejected, so it is sent as slices. The instrument master's "freeze_qty" wins when the broker provides it, then
+# "freeze_limits" in the user config, eg "freeze_limits": {"BANKNIFTY": 900}. Underlyings not listed are not sliced.
+FREEZE_LIMITS: Dict[str, int] = {
+    "NIFTY": 1800,
+    "BANKNIFTY": 900,
+    "CNXBAN": 900,
+    "FINNIFTY": 1800,
+    "NIFFIN": 1800,
+    "MIDCPNIFTY": 4200,
+    "NIFSEL": 4200,
+    "SENSEX": 1000,
+    "BANKEX": 900,
+}
+
+
+@functools.lru_cache
+def get_user_freeze_limits(short_code: str) -> Dict[str, int]:
+    # read once per account, get_freeze_limit runs for every order placed on the algo loop
+    try:
+        return {name: int(limit) for name, limit in get_user_config(short_code).get("freeze_limits", {}).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def get_freeze_limit(short_code: str, trading_symbol: str) -> Optional[int]:
+    from instruments import get_instrument_data_by_symbol  # instruments imports broker.base, which imports this module
+
+    isd = get_instrument_data_by_symbol(short_code, trading_symbol)
+    if isd.get("freeze_qty", None):
+        return int(isd["freeze_qty"])
+    name = isd.get("name", None)
+    limit = get_user_freeze_limits(short_code).get(name, FREEZE_LIMITS.get(name, None))
+    return int(limit) if limit else None
+
+
+def slice_quantities(qty: int, freeze_limit: Optional[int], lot_size: int) -> List[int]:
+    # as few slices as the freeze limit allows, in whole lots and as even as possible, eg 2000 at 900 / 25 => 675, 675, 650
+    max_slice = (freeze_limit // lot_size) * lot_size if freeze_limit else 0
+    if max_slice <= 0 or qty <= max_slice:
+        return [qty]
+    lots = qty // lot_size
+    count = -(-qty // max_slice)
+    quantities = [(lots // count + (1 if i < lots % count else 0)) * lot_size for i in range(count)]
+    quantities[-1] += qty - lots * lot_size  # a quantity not in whole lots keeps its odd remainder
+    return quantities
+
+
+def slice_order(short_code: str, oip: OrderInputParams) -> List[OrderInputParams]:
+    from instruments import get_instrument_data_by_symbol  # see get_freeze_limit
+
+    lot_size = int(get_instrument_data_by_symbol(short_code, oip.trading_symbol)["lot_size"])
+    quantities = slice_quantities(int(oip.qty), get_freeze_limit(short_code, oip.trading_symbol), lot_size)
+    slices = []
+    for qty in quantities:
+        sliceOip = copy.copy(oip)
+        sliceOip.qty = qty
+        slices.append(sliceOip)
+    return slices
+
+
+def sliced_order(oip: OrderInputParams, child_orders: List[Order]) -> Order:
+    # the one Order strategies see for an order placed as slices, its fills are the slices' fills
+    order = Order(oip)
+    order.order_id = "slices:" + child_orders[0].order_id
+    order.place_timestamp = get_epoch()
+    order.update_timestamp = get_epoch()
+    order.child_orders = child_orders
+    order.qty = sum(child.qty for child in child_orders)
+    for child in child_orders:
+        child.parent_order_id = order.order_id
+    aggregate_slices(order)
+    return order
+
+
+def aggregate_slices(order: Order) -> None:
+    # status and fills are set past the state machine (Order.can_move_to), a replaced slice can reopen a finished order
+    children = order.child_orders
+    filled_qty = sum(child.filled_qty for child in children)
+    average_price = sum(child.average_price * child.filled_qty for child in children) / filled_qty if filled_qty > 0 else 0.0
+    live = [child for child in children if child.order_status not in TERMINAL_STATUSES]
+    statuses = [child.order_status for child in children]
+    if len(live) > 0:
+        # working while any slice is, prices follow the slices still working
+        status = OrderStatus.OPEN if OrderStatus.OPEN in statuses else live[0].order_status
+        order.price = live[0].price
+        order.trigger_price = live[0].trigger_price
+    elif filled_qty >= order.qty:
+        # cancelled slices count with what they filled, what they left open went to their replacements (broker.modify)
+        status = OrderStatus.COMPLETE
+    elif all(status == OrderStatus.REJECTED for status in statuses):
+        status = OrderStatus.REJECTED
+    else:
+        # some slices filled or cancelled, the rest cancelled or rejected: a partly filled order which was cancelled
+        status = OrderStatus.CANCELLED
+    order.apply_update(status, filled_qty, average_price)
+    order.pending_qty = sum(child.pending_qty for child in children)
+    order.exchange_timestamp = max(child.exchange_timestamp for child in children)
+    order.update_timestamp = max([order.update_timestamp] + [child.update_timestamp for child in children])
+    messages = [child.message for child in children if child.message]
+    if len(messages) > 0:
+        order.message = "; ".join(messages)
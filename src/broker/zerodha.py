@@ -1,6 +1,6 @@
 import logging
 import time
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 from kiteconnect import KiteConnect, KiteTicker  # type: ignore[import-untyped]
 from kiteconnect.exceptions import (  # type: ignore[import-untyped]
@@ -12,15 +12,32 @@ from requests import ReadTimeout  # type: ignore[import-untyped]
 from broker import brokers, tickers
 from broker.base import Broker as Base
 from broker.base import Ticker as BaseTicker
+from broker.ratelimit import KITE_LIMITS
+from broker.reconcile import (
+    ORDER_BY_EXCHANGE_TIME,
+    OrderBookDiff,
+    accept_update,
+    reconcile_order_book,
+    to_epoch,
+)
 from config import get_system_config
 from core import Quote
-from instruments import get_instrument_data_by_symbol, get_instrument_data_by_token
+from instruments import (
+    get_instrument_data_by_symbol,
+    get_instrument_data_by_token,
+    get_price_slot_by_token,
+)
 from models import Direction, OrderStatus, OrderType, ProductType, TickData
 from models.order import Order, OrderInputParams, OrderModifyParams
 from utils import get_epoch
 
+order_statuses = {status.value: status for status in OrderStatus}  # kite order status => OrderStatus
+
 
 class Broker(Base[KiteConnect]):
+    rate_limits = KITE_LIMITS
+    update_ordering = ORDER_BY_EXCHANGE_TIME  # postbacks and order book rows both carry exchange_update_timestamp
+    quote_batch = 500  # instruments Kite accepts in one quote call
 
     def login(self, args: Dict) -> str:
         logging.info("==> ZerodhaLogin .args => %s", args)
@@ -57,23 +74,11 @@ class Broker(Base[KiteConnect]):
         logging.debug("%s:%s:: Going to place order with params %s", self.broker_name, self.short_code, oip)
         kite = self.broker_handle
         oip.qty = int(oip.qty)
-        import math
-
-        freeze_limit = 900 if oip.trading_symbol.startswith("BANK") else 1800
-        lot_size = get_instrument_data_by_symbol(self.short_code, oip.trading_symbol)["lot_size"]
-        leg_count = max(math.ceil(oip.qty / freeze_limit), 2)
-        slice = oip.qty / leg_count
-        iceberg_quantity = math.ceil(slice / lot_size) * lot_size
-        iceberg_legs = leg_count
-
-        if oip.qty > freeze_limit and oip.order_type == OrderType.MARKET:
-            oip.order_type = OrderType.LIMIT
 
         try:
+            # orders above the freeze limit arrive here as slices, see broker.slicing
             orderId = kite.place_order(
-                variety=kite.VARIETY_REGULAR if oip.qty <= freeze_limit else kite.VARIETY_ICEBERG,
-                iceberg_legs=iceberg_legs,
-                iceberg_quantity=iceberg_quantity,
+                variety=kite.VARIETY_REGULAR,
                 exchange=oip.exchange if oip.is_fno == True else kite.EXCHANGE_NSE,
                 tradingsymbol=oip.trading_symbol,
                 transaction_type=self.convert_to_broker_direction(oip.direction),
@@ -90,15 +95,8 @@ class Broker(Base[KiteConnect]):
             order.order_id = orderId
             order.place_timestamp = get_epoch()
             order.update_timestamp = get_epoch()
-            self.orders_queue.put_nowait(order)
             return order
         except Exception as e:
-            if "Too many requests" in str(e):
-                logging.info("%s:%s retrying order placement in 1 s for %s", self.broker_name, self.short_code, order.order_id)
-                import time
-
-                time.sleep(1)
-                return self.place_order(oip)
             logging.info("%s:%s Order placement failed: %s", self.broker_name, self.short_code, str(e))
             if "Trigger price for stoploss" in str(e):
                 oip.order_type = OrderType.LIMIT
@@ -109,21 +107,11 @@ class Broker(Base[KiteConnect]):
     def modify_order(self, order: Order, omp: OrderModifyParams, tradeQty: int):
         logging.info("%s:%s:: Going to modify order with params %s", self.broker_name, self.short_code, omp)
 
-        if order.order_type == OrderType.SL_LIMIT and omp.new_trigger_price == order.trigger_price:
-            logging.info("%s:%s:: Not Going to modify order with params %s", self.broker_name, self.short_code, omp)
-            # nothing to modify
-            return order
-        elif order.order_type == OrderType.LIMIT and omp.new_price < 0 or omp.new_price == order.price:
-            # nothing to modify
-            logging.info("%s:%s:: Not Going to modify order with params %s", self.broker_name, self.short_code, omp)
-            return order
-
         kite = self.broker_handle
-        freeze_limit = 900 if order.trading_symbol.startswith("BANK") else 1800
 
         try:
             orderId = kite.modify_order(
-                variety=kite.VARIETY_REGULAR if tradeQty <= freeze_limit else kite.VARIETY_ICEBERG,
+                variety=kite.VARIETY_REGULAR,
                 order_id=order.order_id,
                 quantity=int(omp.new_qty) if omp.new_qty > 0 else None,
                 price=omp.new_price if omp.new_price > 0 else None,
@@ -135,92 +123,55 @@ class Broker(Base[KiteConnect]):
             order.update_timestamp = get_epoch()
             return order
         except Exception as e:
-            if "Too many requests" in str(e):
-                logging.info("%s:%s retrying order modification in 1 s for %s", self.broker_name, self.short_code, order.order_id)
-                import time
-
-                time.sleep(1)
-                self.modify_order(order, omp, tradeQty)
             logging.info("%s:%s Order %s modify failed: %s", self.broker_name, self.short_code, order.order_id, str(e))
             raise Exception(str(e))
 
     def cancel_order(self, order):
         logging.debug("%s:%s Going to cancel order %s", self.broker_name, self.short_code, order.order_id)
         kite = self.broker_handle
-        freeze_limit = 900 if order.trading_symbol.startswith("BANK") else 1800
         try:
-            orderId = kite.cancel_order(variety=kite.VARIETY_REGULAR if order.qty <= freeze_limit else kite.VARIETY_ICEBERG, order_id=order.order_id)
+            orderId = kite.cancel_order(variety=kite.VARIETY_REGULAR, order_id=order.order_id)
 
             logging.info("%s:%s Order cancelled successfully, orderId = %s", self.broker_name, self.short_code, orderId)
             order.update_timestamp = get_epoch()
             return order
         except Exception as e:
-            if "Too many requests" in str(e):
-                logging.info("%s:%s retrying order cancellation in 1 s for %s", self.broker_name, self.short_code, order.order_id)
-                import time
-
-                time.sleep(1)
-                self.cancel_order(order)
             logging.info("%s:%s Order cancel failed: %s", self.broker_name, self.short_code, str(e))
             raise Exception(str(e))
 
-    def fetch_update_all_orders(self, orders):
+    def fetch_update_all_orders(self, orders: Dict[str, Order]) -> OrderBookDiff:
         logging.debug("%s:%s Going to fetch order book", self.broker_name, self.short_code)
         kite = self.broker_handle
         orderBook = None
+        self.rate_limiter.acquire("order_book")
         try:
             orderBook = kite.orders()
         except Exception as e:
             logging.error("%s:%s Failed to fetch order book", self.broker_name, self.short_code)
-            return []
+            return OrderBookDiff()
 
         logging.debug("%s:%s Order book length = %d", self.broker_name, self.short_code, len(orderBook))
-        numOrdersUpdated = 0
-        missingOrders = []
-
-        for bOrder in orderBook:
-            foundOrder = None
-            foundChildOrder = None
-            parentOrder = None
-            for order in orders.keys():
-                if order.order_id == bOrder["order_id"]:
-                    foundOrder = order
-                if order.order_id == bOrder["parent_order_id"]:
-                    foundChildOrder = bOrder
-                    parentOrder = order
-
-            if foundOrder != None:
-                logging.debug("Found order for orderId %s", foundOrder.order_id)
-                foundOrder.qty = bOrder["quantity"]
-                foundOrder.filled_qty = bOrder["filled_quantity"]
-                foundOrder.pending_qty = bOrder["pending_quantity"]
-                foundOrder.order_status = bOrder["status"]
-                if foundOrder.order_status == OrderStatus.CANCELLED and foundOrder.filled_qty > 0:
-                    # Consider this case as completed in our system as we cancel the order with pending qty when strategy stop timestamp reaches
-                    foundOrder.order_status = OrderStatus.COMPLETE
-                foundOrder.price = bOrder["price"]
-                foundOrder.trigger_price = bOrder["trigger_price"]
-                foundOrder.average_price = bOrder["average_price"]
-                foundOrder.update_timestamp = bOrder["exchange_update_timestamp"]
-                logging.debug("%s:%s:%s Updated order %s", self.broker_name, self.short_code, orders[foundOrder], foundOrder)
-                numOrdersUpdated += 1
-            elif foundChildOrder != None:
-                oip = OrderInputParams(parentOrder.trading_symbol)
-                oip.exchange = parentOrder.exchange
-                oip.product_type = parentOrder.product_type
-                oip.order_type = parentOrder.orderType
-                oip.price = parentOrder.price
-                oip.trigger_price = parentOrder.trigger_price
-                oip.qty = parentOrder.qty
-                oip.tag = parentOrder.tag
-                oip.product_type = parentOrder.product_type
-                order = Order(oip)
-                order.order_id = bOrder["order_id"]
-                order.parent_order_id = parentOrder.order_id
-                order.place_timestamp = get_epoch()  # TODO should get from bOrder
-                missingOrders.append(order)
-
-        return missingOrders
+        diff = reconcile_order_book(orders, orderBook, self._apply_order_book_row)
+        logging.debug("%s:%s Order book: %d changed, %d new child orders", self.broker_name, self.short_code, len(diff.changed), len(diff.new_children))
+        return diff
+
+    def _apply_order_book_row(self, order: Order, bOrder: Dict) -> None:
+        # order book rows and websocket postbacks have the same fields
+        # transitional kite statuses (MODIFY PENDING, CANCEL PENDING, ..) leave the last known status in place
+        status = order_statuses.get(bOrder["status"], order.order_status)
+        if status == OrderStatus.CANCELLED and bOrder["filled_quantity"] > 0:
+            # Consider this case as completed in our system as we cancel the order with pending qty when strategy stop timestamp reaches
+            status = OrderStatus.COMPLETE
+        exchange_epoch = to_epoch(bOrder.get("exchange_update_timestamp", None))
+        if not accept_update(order, exchange_epoch, status, bOrder["filled_quantity"], self.update_ordering):
+            logging.debug("%s:%s Dropped out of sequence update of order %s: %s", self.broker_name, self.short_code, order.order_id, bOrder["status"])
+            return
+        order.qty = bOrder["quantity"]
+        order.pending_qty = bOrder["pending_quantity"]
+        order.apply_update(status, bOrder["filled_quantity"], bOrder["average_price"])
+        order.price = bOrder["price"]
+        order.trigger_price = bOrder["trigger_price"]
+        order.update_timestamp = exchange_epoch if exchange_epoch > 0 else get_epoch()
 
     def convert_to_broker_product(self, productType):
         kite = self.broker_handle
@@ -253,17 +204,33 @@ class Broker(Base[KiteConnect]):
         return None
 
     def handle_order_update_tick(self, order: Order, data: Dict) -> None:
-        logging.info(data)
+        self._apply_order_book_row(order, data)
 
     def get_quote(self, trading_symbol: str, short_code: str, isFnO: bool, exchange: str) -> Quote:
-        key = (exchange + ":" + trading_symbol.upper()) if isFnO == True else ("NSE:" + trading_symbol.upper())
-        quote = Quote(trading_symbol)
+        key = self._quote_key(trading_symbol, isFnO, exchange)
 
         bQuoteResp = self._get_quote(key)
+        if bQuoteResp is None:
+            raise Exception("No quote for " + key)
 
-        bQuote = bQuoteResp[key]
+        return self._convert_quote(trading_symbol, bQuoteResp[key])
+
+    def get_quotes(self, trading_symbols: List[str], short_code: str, isFnO: bool, exchange: str) -> Dict[str, Quote]:
+        # Kite quotes up to quote_batch instruments in one call
+        keys = {symbol: self._quote_key(symbol, isFnO, exchange) for symbol in dict.fromkeys(trading_symbols)}
+        keyList = list(dict.fromkeys(keys.values()))
+        bQuoteResp: Dict = {}
+        for i in range(0, len(keyList), self.quote_batch):
+            bQuoteResp.update(self._get_quote(keyList[i : i + self.quote_batch]) or {})
 
+        return {symbol: self._convert_quote(symbol, bQuoteResp[key]) for symbol, key in keys.items() if key in bQuoteResp}
+
+    def _quote_key(self, trading_symbol: str, isFnO: bool, exchange: str) -> str:
+        return (exchange + ":" + trading_symbol.upper()) if isFnO == True else ("NSE:" + trading_symbol.upper())
+
+    def _convert_quote(self, trading_symbol: str, bQuote: Dict) -> Quote:
         # convert broker quote to our system quote
+        quote = Quote(trading_symbol)
         quote.trading_symbol = trading_symbol
         quote.last_traded_price = bQuote["last_price"]
         quote.last_traded_quantity = bQuote["last_quantity"]
@@ -289,6 +256,8 @@ class Broker(Base[KiteConnect]):
         key = exchange + ":" + trading_symbol.upper()
 
         bQuoteResp = self._get_quote(key)
+        if bQuoteResp is None:
+            raise Exception("No quote for " + key)
 
         bQuote = bQuoteResp[key]
         # convert broker quote to our system quote
@@ -304,11 +273,14 @@ class Broker(Base[KiteConnect]):
         return quote
 
     def _get_quote(self, key):
+        # None if it still fails after quote_retries retries
         retry = True
+        attempt = 0
         bQuoteResp = None
 
         while retry:
             retry = False
+            self.rate_limiter.acquire("quotes")
             try:
                 bQuoteResp = self.broker_handle.quote(key)
             except DataException as de:
@@ -316,13 +288,19 @@ class Broker(Base[KiteConnect]):
                     retry = True
             except NetworkException as ne:
                 if ne.code in [429]:
-                    time.sleep(1)  # extra 1 sec wait for too many requests
+                    # over the budget anyway, hold back every quote call of this account, the retry queues behind them
+                    self.rate_limiter.pause("quotes")
                     retry = True
             except ReadTimeout:
                 retry = True
+            if retry and attempt >= self.quote_retries:
+                logging.error("%s:%s get_quote for %s failed after %d retries", self.broker_name, self.short_code, key, attempt)
+                return None
             if retry:
-                time.sleep(1)
-                logging.info("retrying get_quote after 1 s for %s", key)
+                attempt += 1
+                if self.rate_limiter.available_in("quotes") == 0:
+                    time.sleep(1)  # not rate limited, the paused budget holds a rate limited retry back already
+                logging.info("retrying get_quote for %s, retry %d", key, attempt)
         return bQuoteResp
 
     def margins(self) -> List:
@@ -342,6 +320,8 @@ class Ticker(BaseTicker[Broker]):
 
     def __init__(self, short_code, broker):
         super().__init__(short_code, broker)
+        self.tick_buffers: Dict[int, Tuple[TickData, bool]] = {}  # instrument token => (reused TickData, is index)
+        self.batch: List[TickData] = []
 
     def start_ticker(self):
         ticker = KiteTicker(self.broker.broker_handle.api_key, self.broker.access_token)
@@ -351,7 +331,7 @@ class Ticker(BaseTicker[Broker]):
         ticker.on_reconnect = self.on_reconnect
         ticker.on_noreconnect = self.on_noreconnect
         ticker.on_ticks = self.on_ticks
-        ticker.on_order_update = self.on_order_update
+        ticker.on_order_update = self.on_kite_order_update
 
         logging.info("ZerodhaTicker: Going to connect..")
         self.ticker = ticker
@@ -389,26 +369,39 @@ class Ticker(BaseTicker[Broker]):
         logging.info("ZerodhaTicker Unsubscribing tokens %s", tokens)
         self.ticker.unsubscribe(tokens)
 
+    def _tick_buffer(self, instrument_token) -> Tuple[TickData, bool]:
+        isd = get_instrument_data_by_token(self.short_code, instrument_token)
+        tick_buffer = (TickData(isd["tradingsymbol"], get_price_slot_by_token(self.short_code, instrument_token)), isd["segment"] == "INDICES")
+        self.tick_buffers[instrument_token] = tick_buffer
+        return tick_buffer
+
     def on_ticks(self, ws, brokerTicks):
         # convert broker specific Ticks to our system specific Ticks (models.TickData) and pass to super class function
-        ticks = []
+        # the TickData of each instrument and the batch list are reused from frame to frame, nothing is allocated per tick
+        ticks = self.batch
+        ticks.clear()
+        tick_buffers = self.tick_buffers
         for bTick in brokerTicks:
-            isd = get_instrument_data_by_token(self.short_code, bTick["instrument_token"])
-            trading_symbol = isd["tradingsymbol"]
-            tick = TickData(trading_symbol)
+            instrument_token = bTick["instrument_token"]
+            tick_buffer = tick_buffers.get(instrument_token, None)
+            if tick_buffer is None:
+                tick_buffer = self._tick_buffer(instrument_token)
+            tick, is_index = tick_buffer
             tick.lastTradedPrice = bTick["last_price"]
-            if not isd["segment"] == "INDICES":
+            if not is_index:
                 tick.lastTradedQuantity = bTick["last_traded_quantity"]
                 tick.avgTradedPrice = bTick["average_traded_price"]
                 tick.volume = bTick["volume_traded"]
                 tick.totalBuyQuantity = bTick["total_buy_quantity"]
                 tick.totalSellQuantity = bTick["total_sell_quantity"]
+                tick.oi = bTick.get("oi", 0)
             else:
                 tick.exchange_timestamp = bTick["exchange_timestamp"]
-            tick.open = bTick["ohlc"]["open"]
-            tick.high = bTick["ohlc"]["high"]
-            tick.low = bTick["ohlc"]["low"]
-            tick.close = bTick["ohlc"]["close"]
+            ohlc = bTick["ohlc"]
+            tick.open = ohlc["open"]
+            tick.high = ohlc["high"]
+            tick.low = ohlc["low"]
+            tick.close = ohlc["close"]
             tick.change = bTick["change"]
             ticks.append(tick)
 
@@ -429,7 +422,8 @@ class Ticker(BaseTicker[Broker]):
     def on_noreconnect(self, ws):
         self.onMaxReconnectsAttempt()
 
-    def on_order_update(self, ws, data):
+    def on_kite_order_update(self, ws, data):
+        # postbacks of this account's orders, the primary source of order state
         self.on_order_update(data)
 
 
@@ -0,0 +1,159 @@
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.prices import PriceStore
+from core.strikes import StrikeChain
+from utils import (
+    getNearestStrikePrice,
+    prepare_weekly_options_symbol,
+    prepareMonthlyExpiryFuturesSymbol,
+)
+
+
+class ChainSide:
+    # the CE or PE column set of an OptionChain, gathered from the PriceStore slots of its strikes' instruments
+
+    def __init__(self, option_type: str) -> None:
+        self.option_type = option_type
+        self.resize([], [])
+
+    def resize(self, symbols: List[str], slots: List[int]) -> None:
+        count = len(symbols)
+        self.symbols = symbols
+        self.slots = np.array(slots, dtype=np.int64)
+        self.ltp = np.zeros(count, dtype=np.float64)
+        self.volume = np.zeros(count, dtype=np.int64)
+        self.buy_quantity = np.zeros(count, dtype=np.int64)
+        self.sell_quantity = np.zeros(count, dtype=np.int64)
+        self.oi = np.zeros(count, dtype=np.int64)
+        self.last_update = np.zeros(count, dtype=np.float64)  # 0 for instruments which have not ticked yet
+
+    def gather(self, store: PriceStore) -> None:
+        np.take(store.ltp, self.slots, out=self.ltp)
+        np.take(store.volume, self.slots, out=self.volume)
+        np.take(store.buy_quantity, self.slots, out=self.buy_quantity)
+        np.take(store.sell_quantity, self.slots, out=self.sell_quantity)
+        np.take(store.oi, self.slots, out=self.oi)
+        np.take(store.last_update, self.slots, out=self.last_update)
+
+
+class OptionChain:
+    # Live CE and PE columns of the strikes within band strikes of ATM, one underlying and weekly expiry, in arrays
+    # ordered by ascending strike. Refreshed from the PriceStore after every tick batch (OptionChains.on_ticks). The
+    # centre follows the underlying's monthly future: once its ATM strike is shift strikes away, the band moves and
+    # the strikes which left it are unsubscribed, the new ones subscribed.
+
+    def __init__(self, price_store: PriceStore, underlying: str, expiryDay: int, step: int, band: int, shift: int = 2) -> None:
+        self.price_store = price_store
+        self.underlying = underlying
+        self.expiryDay = expiryDay
+        self.step = step
+        self.band = band
+        self.shift = shift
+        self.future_symbol = prepareMonthlyExpiryFuturesSymbol(underlying, expiryDay)
+        self.future = price_store.handle(self.future_symbol)
+        self.centre = 0  # 0 until the future ticks
+        self.strikes: List[int] = []
+        self.strike_values = np.zeros(0, dtype=np.float64)
+        self.ce = ChainSide("CE")
+        self.pe = ChainSide("PE")
+        self.strike_symbols: Dict[int, Optional[Tuple[str, str]]] = {}  # strike => (CE, PE), None if either is not listed
+
+    @property
+    def ready(self) -> bool:
+        # centred and every option of the band has ticked
+        return self.centre > 0 and bool(np.all(self.ce.last_update > 0)) and bool(np.all(self.pe.last_update > 0))
+
+    @property
+    def symbols(self) -> List[str]:
+        return self.ce.symbols + self.pe.symbols
+
+    def atm(self) -> int:
+        return getNearestStrikePrice(self.future.ltp, self.step) if self.future.has_tick else 0
+
+    def update(self) -> Tuple[List[str], List[str]]:
+        # after a tick batch, returns the symbols to subscribe and to unsubscribe if the band moved
+        atm = self.atm()
+        if atm > 0 and (self.centre == 0 or abs(atm - self.centre) >= self.shift * self.step):
+            return self.recentre(atm)
+        self.ce.gather(self.price_store)
+        self.pe.gather(self.price_store)
+        return [], []
+
+    def recentre(self, atm: int) -> Tuple[List[str], List[str]]:
+        before = set(self.symbols)
+        strikes = []
+        ceSymbols, peSymbols = [], []
+        for offset in range(-self.band, self.band + 1):
+            strike = atm + offset * self.step
+            pair = self.options(strike)
+            if pair is not None:
+                strikes.append(strike)
+                ceSymbols.append(pair[0])
+                peSymbols.append(pair[1])
+        slot_of = self.price_store.symbol_to_slot
+        self.ce.resize(ceSymbols, [slot_of[symbol] for symbol in ceSymbols])
+        self.pe.resize(peSymbols, [slot_of[symbol] for symbol in peSymbols])
+        self.strikes = strikes
+        self.strike_values = np.array(strikes, dtype=np.float64)
+        self.centre = atm
+        self.ce.gather(self.price_store)
+        self.pe.gather(self.price_store)
+        after = set(self.symbols)
+        logging.info("OptionChain %s %d: centred on %d, %d strikes", self.underlying, self.expiryDay, atm, len(strikes))
+        return [symbol for symbol in self.symbols if symbol not in before], [symbol for symbol in before if symbol not in after]
+
+    def options(self, strike: int) -> Optional[Tuple[str, str]]:
+        if strike not in self.strike_symbols:
+            ceSymbol = prepare_weekly_options_symbol(self.underlying, strike, "CE", expiryDay=self.expiryDay)
+            peSymbol = prepare_weekly_options_symbol(self.underlying, strike, "PE", expiryDay=self.expiryDay)
+            listed = ceSymbol in self.price_store.symbol_to_slot and peSymbol in self.price_store.symbol_to_slot
+            self.strike_symbols[strike] = (ceSymbol, peSymbol) if listed else None
+        return self.strike_symbols[strike]
+
+    def strike_chain(self, option_type: str) -> Optional[StrikeChain]:
+        # the band as of the last tick batch for the strike selection (StrikeChain.priced copies it), None if the current
+        # ATM strike is not in it or has no premium
+        atm = self.atm()
+        if atm not in self.strikes:
+            return None
+        if option_type == "CE":
+            return StrikeChain.priced(atm, self.strikes, self.ce.ltp, self.ce.volume, self.ce.buy_quantity, self.ce.sell_quantity)
+        return StrikeChain.priced(atm, self.strikes[::-1], self.pe.ltp[::-1], self.pe.volume[::-1], self.pe.buy_quantity[::-1], self.pe.sell_quantity[::-1])
+
+
+class OptionChains:
+    # Per algo registry of option chains, one per underlying, expiry and strike step shared by every strategy asking
+    # for it. Each chain holds the symbols of its band with the algo's core.subscriptions.Subscriptions while they are in it.
+
+    def __init__(self, price_store: PriceStore, hold: Callable[[List[str]], None], release: Callable[[List[str]], None]) -> None:
+        self.price_store = price_store
+        self.hold_symbols = hold
+        self.release_symbols = release
+        self.chains: Dict[Tuple[str, int, int], OptionChain] = {}
+
+    def get(self, underlying: str, expiryDay: int, step: int, band: int = 10) -> OptionChain:
+        key = (underlying, expiryDay, step)
+        chain = self.chains.get(key, None)
+        if chain is None:
+            chain = OptionChain(self.price_store, underlying, expiryDay, step, band)
+            self.chains[key] = chain
+            self.hold([chain.future_symbol], [])
+            self.hold(*chain.update())
+        elif band > chain.band:
+            chain.band = band
+            if chain.centre > 0:
+                self.hold(*chain.recentre(chain.centre))
+        return chain
+
+    def on_ticks(self) -> None:
+        for chain in self.chains.values():
+            self.hold(*chain.update())
+
+    def hold(self, added: List[str], removed: List[str]) -> None:
+        if len(added) > 0:
+            self.hold_symbols(added)
+        if len(removed) > 0:
+            self.release_symbols(removed)
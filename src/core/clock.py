@@ -0,0 +1,131 @@
+import asyncio
+import heapq
+import time
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class Clock:
+    # Wall clock. Everything asks the installed clock (get_clock()) for the time instead of datetime.now()/time.time(),
+    # so a replay can swap in a SimulatedClock and run the same code against recorded ticks.
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def timestamp(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    async def sleep_async(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+    async def wait_event(self, event: asyncio.Event, timeout: float) -> bool:
+        # True if event got set, False if timeout passed first
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def call_later(self, loop: asyncio.AbstractEventLoop, delay: float, callback: Callable, *args: Any) -> Any:
+        # returns a handle with cancel()
+        return loop.call_later(delay, callback, *args)
+
+
+class SimulatedTimer:
+    __slots__ = ("when", "callback", "args", "cancelled")
+
+    def __init__(self, when: float, callback: Callable, args: Tuple) -> None:
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class SimulatedClock(Clock):
+    # Replay time, it only moves when advance_to() is called, normally with the timestamp of the next replayed tick.
+    # Async sleeps, event timeouts and call_later wait for simulated time; blocking sleeps return at once.
+
+    def __init__(self, start: datetime) -> None:
+        self.current = start.timestamp()
+        self.timers: List[Tuple[float, int, SimulatedTimer]] = []
+        self.timer_count = 0
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.current)
+
+    def timestamp(self) -> float:
+        return self.current
+
+    def sleep(self, seconds: float) -> None:
+        pass
+
+    async def sleep_async(self, seconds: float) -> None:
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._add_timer(seconds, resolve, (future,))
+        await future
+
+    async def wait_event(self, event: asyncio.Event, timeout: float) -> bool:
+        if event.is_set():
+            return True
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        timer = self._add_timer(timeout, resolve, (future,))
+        waiter = loop.create_task(event.wait())
+        waiter.add_done_callback(lambda _: resolve(future))
+        try:
+            await future
+        finally:
+            timer.cancel()
+            waiter.cancel()
+        return event.is_set()
+
+    def call_later(self, loop: asyncio.AbstractEventLoop, delay: float, callback: Callable, *args: Any) -> SimulatedTimer:
+        return self._add_timer(delay, callback, args)
+
+    def next_timer(self) -> Optional[float]:
+        while self.timers and self.timers[0][2].cancelled:
+            heapq.heappop(self.timers)
+        return self.timers[0][0] if self.timers else None
+
+    def advance_to(self, epoch: float) -> None:
+        # moves time forward to epoch, timers falling due on the way run in order with the clock set to their time
+        timers = self.timers
+        while timers and timers[0][0] <= epoch:
+            when, _, timer = heapq.heappop(timers)
+            if timer.cancelled:
+                continue
+            self.current = max(self.current, when)
+            timer.callback(*timer.args)
+        self.current = max(self.current, epoch)
+
+    def _add_timer(self, delay: float, callback: Callable, args: Tuple) -> SimulatedTimer:
+        timer = SimulatedTimer(self.current + max(delay, 0), callback, args)
+        self.timer_count += 1
+        heapq.heappush(self.timers, (timer.when, self.timer_count, timer))
+        return timer
+
+
+def resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+clock: Clock = Clock()
+
+
+def get_clock() -> Clock:
+    return clock
+
+
+def set_clock(new_clock: Clock) -> None:
+    global clock
+    clock = new_clock
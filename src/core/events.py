@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Protocol, Sequence
+
+from core.clock import get_clock
+from core.prices import PriceStore
+from core.triggers import Trigger, TriggerIndex
+from models import TickData
+from models.order import Order
+from utils import get_epoch
+
+CLOCK = "clock"  # trigger key fed with the epoch seconds on every tick drain
+
+
+class Wakeable(Protocol):
+    def getName(self) -> str: ...
+
+    def wake(self, reason: str, trade: Any = None) -> None: ...
+
+
+class EventBus:
+    # Per algo registry of what each strategy wants to be woken up for: a price crossing a level,
+    # a status change on one of its orders or a point in time. Everything runs on the algo loop.
+    # Price and time levels live in a TriggerIndex, so a tick only costs work for the levels it crosses.
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, price_store: PriceStore) -> None:
+        self.loop = loop
+        self.price_store = price_store
+        self.triggers = TriggerIndex()
+        self.order_owners: Dict[str, Wakeable] = {}  # order tag (strategy name) => strategy
+        self.deadlines: Dict[str, List[Any]] = {}  # strategy name => timer handles
+        # strategy MTM is moved along with ticks: mtm += weight * (ltp - last ltp), weight = +-filled qty summed per symbol
+        self.mtm_values: Dict[str, float] = {}
+        self.mtm_weights: Dict[str, Dict[str, float]] = {}  # symbol => strategy name => weight
+        self.mtm_prices: Dict[str, float] = {}  # symbol => ltp the mtm values are based on
+
+    def current_price(self, trading_symbol: str) -> Optional[float]:
+        if trading_symbol in self.price_store.symbol_to_slot:
+            handle = self.price_store.handle(trading_symbol)
+            if handle.has_tick:
+                return handle.ltp
+        return None
+
+    def subscribe_price_cross(self, owner: Wakeable, trading_symbol: str, level: float, trade: Any = None) -> Trigger:
+        # one shot, the owner is woken the first time the price moves to the other side of level
+        return self.triggers.add_cross(trading_symbol, level, self.current_price(trading_symbol), owner, "trigger:" + trading_symbol, trade)
+
+    def subscribe_price_level(self, owner: Wakeable, trading_symbol: str, level: float, rising: bool, trade: Any = None) -> Trigger:
+        # one shot, the owner is woken once the price is at or beyond level in the given direction
+        return self.triggers.add(trading_symbol, level, rising, owner, "trigger:" + trading_symbol, trade)
+
+    def subscribe_time(self, owner: Wakeable, epoch: float, trade: Any = None) -> Trigger:
+        # like a deadline, but checked on tick drains through the index instead of a loop timer
+        return self.triggers.add(CLOCK, epoch, True, owner, "trigger:" + CLOCK, trade)
+
+    def unsubscribe(self, trigger: Optional[Trigger]) -> None:
+        self.triggers.remove(trigger)
+
+    def subscribe_order_updates(self, owner: Wakeable) -> None:
+        self.order_owners[owner.getName()] = owner
+
+    def subscribe_deadline(self, owner: Wakeable, when: datetime, reason: str = "deadline") -> Optional[Any]:
+        delay = get_epoch(when) - get_epoch()
+        if delay < 0:
+            return None
+        timer = get_clock().call_later(self.loop, delay, owner.wake, reason)
+        self.deadlines.setdefault(owner.getName(), []).append(timer)
+        return timer
+
+    def subscribe_mtm(self, owner: Wakeable, level: float, rising: bool) -> Trigger:
+        # one shot, the owner is woken once its MTM, as moved along by ticks since the last set_mtm, reaches level
+        return self.triggers.add("mtm:" + owner.getName(), level, rising, owner, "trigger:mtm")
+
+    def set_mtm(self, owner: Wakeable, mtm: float, weights: Dict[str, float]) -> None:
+        # rebase the strategy MTM on current prices, weights are the signed open quantity per symbol
+        name = owner.getName()
+        self.mtm_values[name] = mtm
+        for symbol_weights in self.mtm_weights.values():
+            symbol_weights.pop(name, None)
+        for symbol, weight in weights.items():
+            if weight == 0:
+                continue
+            price = self.current_price(symbol)
+            if price is None:
+                continue
+            self.mtm_weights.setdefault(symbol, {})[name] = weight
+            self.mtm_prices[symbol] = price
+
+    def unsubscribe_all(self, owner: Wakeable) -> None:
+        name = owner.getName()
+        for levels in self.triggers.levels.values():
+            for trigger in levels.rising + levels.falling:
+                if trigger.owner is owner:
+                    self.triggers.remove(trigger)
+        self.triggers.compact()
+        self.order_owners.pop(name, None)
+        for timer in self.deadlines.pop(name, []):
+            timer.cancel()
+        self.mtm_values.pop(name, None)
+        for symbol_weights in self.mtm_weights.values():
+            symbol_weights.pop(name, None)
+
+    def on_ticks(self, ticks: Sequence[TickData]) -> None:
+        triggers = self.triggers
+        fired: List[Trigger] = []
+        if triggers.active_count > 0:
+            levels = triggers.levels
+            for tick in ticks:
+                if tick.trading_symbol in levels:
+                    fired.extend(triggers.update(tick.trading_symbol, tick.lastTradedPrice))
+            fired.extend(triggers.update(CLOCK, get_clock().timestamp()))
+        if self.mtm_weights:
+            fired.extend(self._move_mtm(ticks))
+        for trigger in fired:
+            logging.debug("EventBus: %s crossed %f for %s", trigger.key, trigger.level, trigger.owner.getName())
+            trigger.owner.wake(trigger.reason, trigger.trade)
+
+    def _move_mtm(self, ticks: Sequence[TickData]) -> List[Trigger]:
+        moved = set()
+        for tick in ticks:
+            symbol_weights = self.mtm_weights.get(tick.trading_symbol, None)
+            if not symbol_weights:
+                continue
+            ltp = tick.lastTradedPrice
+            change = ltp - self.mtm_prices[tick.trading_symbol]
+            self.mtm_prices[tick.trading_symbol] = ltp
+            for name, weight in symbol_weights.items():
+                self.mtm_values[name] += weight * change
+                moved.add(name)
+        fired: List[Trigger] = []
+        for name in moved:
+            fired.extend(self.triggers.update("mtm:" + name, self.mtm_values[name]))
+        return fired
+
+    def on_order_update(self, order: Order) -> None:
+        owner = self.order_owners.get(order.tag, None)
+        if owner is not None:
+            owner.wake("order:" + order.order_id)
@@ -0,0 +1,52 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Sequence
+
+from models import TickData
+
+
+class TickHandoff:
+    # Moves ticks from the broker's websocket thread onto the algo's event loop.
+    # Ticks are coalesced per instrument (latest value wins) and the loop is woken once per pending batch,
+    # so the consumer always sees a whole snapshot at once and a burst of frames costs one loop callback.
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, consumer: Callable[[List[TickData]], None]) -> None:
+        self.loop = loop
+        self.consumer = consumer
+        self.lock = threading.Lock()
+        self.pending: Dict[Any, TickData] = {}
+        self.scheduled = False
+        self.ticks_received = 0
+        self.ticks_delivered = 0
+
+    def on_ticks(self, ticks: Sequence[TickData]) -> None:
+        # batch listener, runs on the ticker thread; tickers reuse their TickData so keep copies
+        with self.lock:
+            pending = self.pending
+            for tick in ticks:
+                pending[tick.slot if tick.slot >= 0 else tick.trading_symbol] = tick.copy()
+            self.ticks_received += len(ticks)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        try:
+            self.loop.call_soon_threadsafe(self.drain)
+        except RuntimeError:
+            # loop is closed, nothing to deliver to anymore
+            with self.lock:
+                self.scheduled = False
+
+    def drain(self) -> None:
+        # runs on the event loop
+        with self.lock:
+            snapshot = list(self.pending.values())
+            self.pending = {}
+            self.scheduled = False
+        if len(snapshot) == 0:
+            return
+        self.ticks_delivered += len(snapshot)
+        try:
+            self.consumer(snapshot)
+        except Exception as e:
+            logging.error("TickHandoff: Exception from consumer. Error => %s", str(e))
@@ -0,0 +1,208 @@
+import datetime
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import instruments
+from models import TickData
+
+# one fixed width record per tick, little endian and unaligned so the file layout never depends on the platform
+TICK_FIELDS = [
+    ("recv_ts", "<i8"),  # epoch ns when the tick reached on_new_ticks
+    ("exchange_ts", "<i8"),  # epoch ns from the exchange, 0 if the broker sent none
+    ("sid", "<i4"),  # index into the journal's symbols file
+    ("ltp", "<f8"),
+    ("qty", "<i8"),
+    ("avg_price", "<f8"),
+    ("volume", "<i8"),
+    ("total_buy_qty", "<i8"),
+    ("total_sell_qty", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("change", "<f8"),
+]
+TICK_DTYPE = np.dtype(TICK_FIELDS + [("oi", "<i8")])
+TICK_DTYPE_V1 = np.dtype(TICK_FIELDS)  # journals written before open interest was recorded, read with oi 0
+
+JOURNAL_MAGIC = 0x314B434954414D52  # "RMATICK1"
+JOURNAL_VERSION = 2
+HEADER_SIZE = 64  # 8 int64s: magic, version, record count, record size, rest reserved
+CHUNK_RECORDS = 1_000_000  # the file grows by this many records at a time
+
+
+def journal_paths(directory: str, short_code: str, date_str: str) -> Tuple[str, str]:
+    base = os.path.join(directory, short_code + "_" + date_str)
+    return base + ".ticks", base + ".symbols.json"
+
+
+class TickJournal:
+    # Append only capture of every tick a ticker dispatches, into one memory mapped file per day under deploy_dir/journal.
+    # Registered as a batch listener, so it runs on the ticker thread: a batch is one array copy into the map and
+    # a header update, the OS writes the pages back. Symbols are stored once per day in a small json sidecar.
+
+    def __init__(self, short_code: str, directory: str, chunk_records: int = CHUNK_RECORDS) -> None:
+        self.short_code = short_code
+        self.directory = directory
+        self.chunk_records = chunk_records
+        self.date_str: Optional[str] = None
+        self.path: Optional[str] = None
+        self.symbols_path: Optional[str] = None
+        self.header: Optional[np.memmap] = None
+        self.records: Optional[np.memmap] = None
+        self.count = 0
+        self.symbols: List[List[Any]] = []  # [trading_symbol, instrument_token]
+        self.symbol_to_sid: Dict[str, int] = {}
+        if os.path.exists(directory) == False:
+            os.makedirs(directory)
+
+    def on_ticks(self, ticks: Sequence[TickData]) -> None:
+        now = time.time_ns()
+        date_str = datetime.datetime.fromtimestamp(now / 1_000_000_000).strftime("%Y-%m-%d")
+        if date_str != self.date_str:
+            self._open(date_str)
+        sid_of = self.symbol_to_sid
+        rows = [
+            (
+                now,
+                int(tick.exchange_timestamp.timestamp() * 1_000_000_000) if tick.exchange_timestamp else 0,
+                sid_of[tick.trading_symbol] if tick.trading_symbol in sid_of else self._add_symbol(tick.trading_symbol),
+                tick.lastTradedPrice,
+                tick.lastTradedQuantity,
+                tick.avgTradedPrice,
+                tick.volume,
+                tick.totalBuyQuantity,
+                tick.totalSellQuantity,
+                tick.open,
+                tick.high,
+                tick.low,
+                tick.close,
+                tick.change,
+                tick.oi,
+            )
+            for tick in ticks
+        ]
+        if self.count + len(rows) > len(self.records):
+            self._grow(self.count + len(rows))
+        self.records[self.count : self.count + len(rows)] = np.array(rows, dtype=TICK_DTYPE)
+        self.count += len(rows)
+        self.header[2] = self.count
+
+    def close(self) -> None:
+        if self.records is not None:
+            self.records.flush()
+            self.header.flush()
+        self.records = None
+        self.header = None
+        self.date_str = None
+
+    def _open(self, date_str: str) -> None:
+        self.close()
+        self.date_str = date_str
+        self.path, self.symbols_path = journal_paths(self.directory, self.short_code, date_str)
+        self.symbols = []
+        self.symbol_to_sid = {}
+        if os.path.exists(self.path):
+            # restarted during the day, keep appending to the same journal
+            header = np.fromfile(self.path, dtype="<i8", count=HEADER_SIZE // 8)
+            if header[0] != JOURNAL_MAGIC or header[1] != JOURNAL_VERSION or header[3] != TICK_DTYPE.itemsize:
+                raise ValueError("TickJournal: " + self.path + " is not a version " + str(JOURNAL_VERSION) + " tick journal")
+            self.count = int(header[2])
+            if os.path.exists(self.symbols_path):
+                with open(self.symbols_path, "r") as sFile:
+                    self.symbols = json.loads(sFile.read())
+                self.symbol_to_sid = {symbol[0]: sid for sid, symbol in enumerate(self.symbols)}
+        else:
+            self.count = 0
+            with open(self.path, "wb") as jFile:
+                jFile.truncate(HEADER_SIZE + self.chunk_records * TICK_DTYPE.itemsize)
+            header = np.memmap(self.path, dtype="<i8", mode="r+", offset=0, shape=(HEADER_SIZE // 8,))
+            header[:4] = [JOURNAL_MAGIC, JOURNAL_VERSION, 0, TICK_DTYPE.itemsize]
+            header.flush()
+            del header
+        self._map()
+        logging.info("TickJournal: journaling ticks to %s, %d records already present", self.path, self.count)
+
+    def _map(self) -> None:
+        capacity = (os.path.getsize(self.path) - HEADER_SIZE) // TICK_DTYPE.itemsize
+        self.header = np.memmap(self.path, dtype="<i8", mode="r+", offset=0, shape=(HEADER_SIZE // 8,))
+        self.records = np.memmap(self.path, dtype=TICK_DTYPE, mode="r+", offset=HEADER_SIZE, shape=(capacity,))
+
+    def _grow(self, min_records: int) -> None:
+        capacity = len(self.records)
+        while capacity < min_records:
+            capacity += self.chunk_records
+        self.records.flush()
+        self.header.flush()
+        self.records = None
+        self.header = None
+        with open(self.path, "r+b") as jFile:
+            jFile.truncate(HEADER_SIZE + capacity * TICK_DTYPE.itemsize)
+        self._map()
+
+    def _add_symbol(self, trading_symbol: str) -> int:
+        isd = instruments.symbol_to_instrument.get(self.short_code, {}).get(trading_symbol, None)
+        sid = len(self.symbols)
+        self.symbols.append([trading_symbol, isd["instrument_token"] if isd is not None else None])
+        self.symbol_to_sid[trading_symbol] = sid
+        with open(self.symbols_path, "w") as sFile:
+            json.dump(self.symbols, sFile)
+        return sid
+
+
+class JournalReader:
+    # Read side of a TickJournal file: records come straight off the map as a NumPy structured array, nothing is parsed.
+    # Records are in arrival order, so recv_ts is sorted and time ranges are a binary search; the per symbol index
+    # is built once on first use.
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        header = np.fromfile(path, dtype="<i8", count=HEADER_SIZE // 8)
+        dtype = TICK_DTYPE if header[1] == JOURNAL_VERSION else TICK_DTYPE_V1
+        if header[0] != JOURNAL_MAGIC or header[1] > JOURNAL_VERSION or header[3] != dtype.itemsize:
+            raise ValueError("JournalReader: " + path + " is not a version " + str(JOURNAL_VERSION) + " tick journal")
+        self.count = int(header[2])
+        self.records = np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(self.count,)) if self.count > 0 else np.zeros(0, dtype)
+        if dtype is not TICK_DTYPE:
+            # an older journal, copied into the current layout once
+            records = np.zeros(self.count, TICK_DTYPE)
+            for name in dtype.names:
+                records[name] = self.records[name]
+            self.records = records
+        with open(path[: -len(".ticks")] + ".symbols.json", "r") as sFile:
+            symbols = json.loads(sFile.read())
+        self.symbols: List[str] = [symbol[0] for symbol in symbols]
+        self.tokens: List[Any] = [symbol[1] for symbol in symbols]
+        self.symbol_to_sid: Dict[str, int] = {symbol: sid for sid, symbol in enumerate(self.symbols)}
+        self.sid_order: Optional[np.ndarray] = None
+        self.sid_bounds: Optional[np.ndarray] = None
+
+    @classmethod
+    def for_day(cls, directory: str, short_code: str, date_str: str) -> "JournalReader":
+        return cls(journal_paths(directory, short_code, date_str)[0])
+
+    def __len__(self) -> int:
+        return self.count
+
+    def between(self, start: datetime.datetime, end: datetime.datetime) -> np.ndarray:
+        # records received in [start, end)
+        recv_ts = self.records["recv_ts"]
+        i = np.searchsorted(recv_ts, int(start.timestamp() * 1_000_000_000), side="left")
+        j = np.searchsorted(recv_ts, int(end.timestamp() * 1_000_000_000), side="left")
+        return self.records[i:j]
+
+    def for_symbol(self, trading_symbol: str) -> np.ndarray:
+        # all records of one symbol in arrival order, a copy
+        sid = self.symbol_to_sid.get(trading_symbol, None)
+        if sid is None:
+            return np.zeros(0, TICK_DTYPE)
+        if self.sid_order is None:
+            sids = self.records["sid"]
+            self.sid_order = np.argsort(sids, kind="stable")
+            self.sid_bounds = np.searchsorted(sids[self.sid_order], np.arange(len(self.symbols) + 1), side="left")
+        return self.records[self.sid_order[self.sid_bounds[sid] : self.sid_bounds[sid + 1]]]
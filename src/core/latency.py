@@ -0,0 +1,128 @@
+import threading
+from bisect import bisect_left
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, Tuple
+
+from core.clock import get_clock
+from models import OrderStatus
+from models.order import TERMINAL_STATUSES, Order, OrderInputParams
+
+# Order latency, in milliseconds, by stage:
+#   queued        strategy decision to the place call going out (order budget queue included)
+#   ack           place call to the broker's order id
+#   first_update  ack to the first order update
+#   fill          ack to the order update which completes the order
+#   decide_fill   strategy decision to that update
+#   modify        modify call to its response
+#   cancel        cancel call to its response
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000]
+PENDING_LIMIT = 2000  # placed orders waiting for their updates, the oldest are dropped past it
+
+
+class LatencyHistogram:
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS_MS) + 1)  # last one is everything above the largest bucket
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms: float) -> None:
+        ms = max(ms, 0.0)
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p: float) -> float:
+        # upper bound of the bucket the p-th percentile falls in, capped at the max
+        rank = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count > 0:
+                return min(float(BUCKETS_MS[i]), self.max) if i < len(BUCKETS_MS) else self.max
+        return 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 2) if self.count > 0 else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": round(self.max, 2),
+            "buckets": dict(zip([str(bound) for bound in BUCKETS_MS] + ["inf"], self.counts)),
+        }
+
+
+class LatencyRecorder:
+    # One per broker account (Broker.latency), histograms by stage, order type and strategy (the order tag). Fed from
+    # the order executor calls and the algo's order updates, read by the latency view, saved and reset at end of day.
+
+    def __init__(self, broker_name: str, short_code: str) -> None:
+        self.broker_name = broker_name
+        self.short_code = short_code
+        self.lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, str, str], LatencyHistogram] = {}
+        self.pending: Dict[str, Tuple[float, float, bool]] = {}  # order id => (decided, acked, had an update)
+        self.since = get_clock().timestamp()
+
+    def record(self, stage: str, order: Order, seconds: float) -> None:
+        key = (stage, order_type_name(order), order.tag)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = LatencyHistogram()
+            self.histograms[key].add(seconds * 1000)
+
+    def on_call(self, name: str, arg: Any, result: Any, sent: float) -> None:
+        # a broker order call (Broker.run_order_call) returned
+        now = get_clock().timestamp()
+        if name == "place_order" and isinstance(arg, OrderInputParams) and isinstance(result, Order):
+            if arg.decision_time > 0:
+                self.record("queued", result, sent - arg.decision_time)
+            self.record("ack", result, now - sent)
+            self.pending[result.order_id] = (arg.decision_time, now, False)
+            if len(self.pending) > PENDING_LIMIT:
+                del self.pending[next(iter(self.pending))]
+        elif name in ["modify_order", "cancel_order"] and isinstance(arg, Order):
+            self.record(name.split("_")[0], arg, now - sent)
+
+    def on_update(self, order: Order) -> None:
+        # an order update was applied to order
+        timings = self.pending.get(order.order_id, None)
+        if timings is None:
+            return
+        decided, acked, updated = timings
+        now = get_clock().timestamp()
+        if not updated:
+            self.record("first_update", order, now - acked)
+            self.pending[order.order_id] = (decided, acked, True)
+        if order.order_status == OrderStatus.COMPLETE:
+            self.record("fill", order, now - acked)
+            if decided > 0:
+                self.record("decide_fill", order, now - decided)
+        if order.order_status in TERMINAL_STATUSES:
+            del self.pending[order.order_id]
+
+    def summary(self) -> Dict[str, Any]:
+        stages: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        with self.lock:
+            for (stage, order_type, strategy), histogram in sorted(self.histograms.items()):
+                stages.setdefault(stage, {}).setdefault(order_type, {})[strategy] = histogram.as_dict()
+        return {
+            "broker": self.broker_name,
+            "short_code": self.short_code,
+            "since": datetime.fromtimestamp(self.since).isoformat(),
+            "unit": "ms",
+            "stages": stages,
+        }
+
+    def reset(self) -> None:
+        with self.lock:
+            self.histograms = {}
+            self.since = get_clock().timestamp()
+
+
+def order_type_name(order: Order) -> str:
+    return order.order_type.name if isinstance(order.order_type, Enum) else str(order.order_type)
@@ -0,0 +1,179 @@
+import datetime
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from core import Quote
+from core.clock import get_clock
+
+
+class PriceHandle:
+    # cheap, long lived view on one slot of a PriceStore, resolve once and read as often as needed
+    __slots__ = ("store", "slot", "trading_symbol")
+
+    def __init__(self, store: "PriceStore", slot: int, trading_symbol: str) -> None:
+        self.store = store
+        self.slot = slot
+        self.trading_symbol = trading_symbol
+
+    @property
+    def ltp(self) -> float:
+        return float(self.store.ltp[self.slot])
+
+    @property
+    def volume(self) -> int:
+        return int(self.store.volume[self.slot])
+
+    @property
+    def open(self) -> float:
+        return float(self.store.open[self.slot])
+
+    @property
+    def high(self) -> float:
+        return float(self.store.high[self.slot])
+
+    @property
+    def low(self) -> float:
+        return float(self.store.low[self.slot])
+
+    @property
+    def close(self) -> float:
+        return float(self.store.close[self.slot])
+
+    @property
+    def buy_quantity(self) -> int:
+        return int(self.store.buy_quantity[self.slot])
+
+    @property
+    def sell_quantity(self) -> int:
+        return int(self.store.sell_quantity[self.slot])
+
+    @property
+    def oi(self) -> int:
+        return int(self.store.oi[self.slot])
+
+    @property
+    def exchange_timestamp(self) -> Optional[datetime.datetime]:
+        ts = self.store.exchange_timestamp[self.slot]
+        return None if np.isnan(ts) else datetime.datetime.fromtimestamp(ts)
+
+    @property
+    def last_update(self) -> float:
+        # wall clock epoch of the last tick applied to this slot, 0 if never ticked
+        return float(self.store.last_update[self.slot])
+
+    @property
+    def has_tick(self) -> bool:
+        return self.store.last_update[self.slot] > 0
+
+    def quote(self) -> Quote:
+        # what the ticks carry of a quote, last traded quantity and circuit limits stay 0
+        quote = Quote(self.trading_symbol)
+        quote.last_traded_price = self.ltp
+        quote.volume = self.volume
+        quote.total_buy_quantity = self.buy_quantity
+        quote.total_sell_quantity = self.sell_quantity
+        quote.open = self.open
+        quote.high = self.high
+        quote.low = self.low
+        quote.close = self.close
+        quote.oi = self.oi
+        return quote
+
+    def __repr__(self) -> str:
+        return "PriceHandle(" + self.trading_symbol + ", slot=" + str(self.slot) + ", ltp=" + str(self.ltp) + ")"
+
+
+class PriceStore:
+    # Latest tick values of every instrument of a user, kept as preallocated columns indexed by a dense slot.
+    # Slots are handed out once when instruments are fetched, so ticks never grow or rehash anything and
+    # readers on other threads only ever see a fixed set of arrays.
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(capacity, 1)
+        self.ltp = np.zeros(self.capacity, dtype=np.float64)
+        self.volume = np.zeros(self.capacity, dtype=np.int64)
+        self.open = np.zeros(self.capacity, dtype=np.float64)
+        self.high = np.zeros(self.capacity, dtype=np.float64)
+        self.low = np.zeros(self.capacity, dtype=np.float64)
+        self.close = np.zeros(self.capacity, dtype=np.float64)
+        self.buy_quantity = np.zeros(self.capacity, dtype=np.int64)
+        self.sell_quantity = np.zeros(self.capacity, dtype=np.int64)
+        self.oi = np.zeros(self.capacity, dtype=np.int64)
+        self.exchange_timestamp = np.full(self.capacity, np.nan, dtype=np.float64)
+        self.last_update = np.zeros(self.capacity, dtype=np.float64)
+        self.symbols: list = []
+        self.symbol_to_slot: Dict[str, int] = {}
+        self.token_to_slot: Dict[Any, int] = {}
+        self.handles: Dict[str, PriceHandle] = {}
+        self.latest_exchange_timestamp: Optional[datetime.datetime] = None
+
+    def add_instrument(self, trading_symbol: str, instrument_token: Any) -> int:
+        slot = self.symbol_to_slot.get(trading_symbol, None)
+        if slot is None:
+            slot = len(self.symbols)
+            if slot >= self.capacity:
+                raise IndexError("PriceStore: capacity " + str(self.capacity) + " exhausted while adding " + trading_symbol)
+            self.symbols.append(trading_symbol)
+            self.symbol_to_slot[trading_symbol] = slot
+        self.token_to_slot[instrument_token] = slot
+        return slot
+
+    def slot_of(self, trading_symbol: str) -> int:
+        return self.symbol_to_slot[trading_symbol]
+
+    def slot_of_token(self, instrument_token: Any) -> int:
+        return self.token_to_slot[instrument_token]
+
+    def handle(self, trading_symbol: str) -> PriceHandle:
+        handle = self.handles.get(trading_symbol, None)
+        if handle is None:
+            handle = PriceHandle(self, self.symbol_to_slot[trading_symbol], trading_symbol)
+            self.handles[trading_symbol] = handle
+        return handle
+
+    def update(
+        self,
+        slot: int,
+        ltp: float,
+        volume: int = 0,
+        open: float = 0.0,
+        high: float = 0.0,
+        low: float = 0.0,
+        close: float = 0.0,
+        exchange_timestamp: Optional[datetime.datetime] = None,
+        buy_quantity: int = 0,
+        sell_quantity: int = 0,
+        oi: int = 0,
+    ) -> None:
+        self.ltp[slot] = ltp
+        self.volume[slot] = volume
+        self.open[slot] = open
+        self.high[slot] = high
+        self.low[slot] = low
+        self.close[slot] = close
+        self.buy_quantity[slot] = buy_quantity
+        self.sell_quantity[slot] = sell_quantity
+        self.oi[slot] = oi
+        if exchange_timestamp is not None:
+            self.exchange_timestamp[slot] = exchange_timestamp.timestamp()
+            self.latest_exchange_timestamp = exchange_timestamp
+        self.last_update[slot] = get_clock().timestamp()
+
+    def get_ltp(self, trading_symbol: str) -> float:
+        # raises KeyError for unknown symbols and for symbols which have not ticked yet, like the old dict did
+        slot = self.symbol_to_slot[trading_symbol]
+        if self.last_update[slot] == 0:
+            raise KeyError(trading_symbol)
+        return float(self.ltp[slot])
+
+    def ticked_count(self) -> int:
+        return int(np.count_nonzero(self.last_update[: len(self.symbols)]))
+
+    def ltps(self) -> Dict[str, Any]:
+        # symbol => ltp of every ticked instrument, for views and anything else that wants a plain dict
+        ticked = np.flatnonzero(self.last_update[: len(self.symbols)])
+        ltps: Dict[str, Any] = {self.symbols[slot]: float(self.ltp[slot]) for slot in ticked}
+        if self.latest_exchange_timestamp is not None:
+            ltps["exchange_timestamp"] = self.latest_exchange_timestamp
+        return ltps
@@ -0,0 +1,166 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core import Quote
+from core.clock import get_clock
+
+ENTRY_LIMIT = 2000  # cached quotes kept before the expired ones are dropped
+
+
+class QuoteCache:
+    # Per algo cache of broker quotes, shared by its strategies and the views. A quote is good for ttl seconds, a
+    # request for a key already being fetched waits for that fetch instead of making its own broker call. Keys are a
+    # prefix telling the kind of quote apart (see quote_prefix) and the symbol. Safe to use from any thread.
+    # get / get_many make the broker call on the caller's thread, on the algo loop that holds up every strategy until
+    # it returns and nothing else can ask for the quote meanwhile. Strategies use get_async / get_many_async, which
+    # make it on an executor thread, so strategies asking for a quote being fetched wait for that one call.
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Any] = {}  # key => (fetched at, quote)
+        self.inflight: Dict[str, Future] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}  # key => hits, misses (fetched), coalesced (waited for a fetch), errors
+
+    def get(self, prefix: str, trading_symbol: str, fetch: Callable[[], Quote]) -> Quote:
+        quote, future, owner = self.claim(prefix + trading_symbol)
+        if quote is not None:
+            return quote
+        if not owner:
+            return future.result()
+        return self.fetch(prefix + trading_symbol, future, fetch)
+
+    async def get_async(self, prefix: str, trading_symbol: str, fetch: Callable[[], Quote]) -> Quote:
+        quote, future, owner = self.claim(prefix + trading_symbol)
+        if quote is not None:
+            return quote
+        if not owner:
+            return await asyncio.wrap_future(future)
+        return await asyncio.get_running_loop().run_in_executor(None, self.fetch, prefix + trading_symbol, future, fetch)
+
+    def get_many(self, prefix: str, trading_symbols: List[str], fetch: Callable[[List[str]], Dict[str, Quote]]) -> Dict[str, Quote]:
+        # like get for each symbol, the ones neither cached nor being fetched are fetched together, a symbol the fetch
+        # leaves out is left out of the result
+        quotes, waiting, owned = self.claim_many(prefix, trading_symbols)
+        if len(owned) > 0:
+            quotes.update(self.fetch_many(prefix, owned, fetch))
+        for symbol, future in waiting.items():
+            try:
+                quote = future.result()
+            except Exception:
+                continue
+            if quote is not None:
+                quotes[symbol] = quote
+        return quotes
+
+    async def get_many_async(self, prefix: str, trading_symbols: List[str], fetch: Callable[[List[str]], Dict[str, Quote]]) -> Dict[str, Quote]:
+        quotes, waiting, owned = self.claim_many(prefix, trading_symbols)
+        if len(owned) > 0:
+            quotes.update(await asyncio.get_running_loop().run_in_executor(None, self.fetch_many, prefix, owned, fetch))
+        for symbol, future in waiting.items():
+            try:
+                quote = await asyncio.wrap_future(future)
+            except Exception:
+                continue
+            if quote is not None:
+                quotes[symbol] = quote
+        return quotes
+
+    def claim(self, key: str) -> Tuple[Optional[Quote], Optional[Future], bool]:
+        # (cached quote, None, False), or the fetch to wait for and whether the caller is the one to make it
+        with self.lock:
+            quote = self.cached(key)
+            if quote is not None:
+                return quote, None, False
+            future = self.inflight.get(key, None)
+            if future is not None:
+                self.count(key, "coalesced")
+                return None, future, False
+            return None, self.start(key), True
+
+    def claim_many(self, prefix: str, trading_symbols: List[str]) -> Tuple[Dict[str, Quote], Dict[str, Future], Dict[str, Future]]:
+        # claim for each symbol: (cached quotes, fetches to wait for, fetches to make) by symbol
+        quotes: Dict[str, Quote] = {}
+        waiting: Dict[str, Future] = {}
+        owned: Dict[str, Future] = {}
+        with self.lock:
+            for symbol in dict.fromkeys(trading_symbols):
+                key = prefix + symbol
+                quote = self.cached(key)
+                if quote is not None:
+                    quotes[symbol] = quote
+                elif key in self.inflight:
+                    self.count(key, "coalesced")
+                    waiting[symbol] = self.inflight[key]
+                else:
+                    owned[symbol] = self.start(key)
+        return quotes, waiting, owned
+
+    def fetch(self, key: str, future: Future, fetch: Callable[[], Quote]) -> Quote:
+        try:
+            quote = fetch()
+        except Exception as e:
+            self.finish(key, future, None, e)
+            raise
+        self.finish(key, future, quote)
+        return quote
+
+    def fetch_many(self, prefix: str, owned: Dict[str, Future], fetch: Callable[[List[str]], Dict[str, Quote]]) -> Dict[str, Quote]:
+        try:
+            fetched = fetch(list(owned))
+        except Exception as e:
+            for symbol, future in owned.items():
+                self.finish(prefix + symbol, future, None, e)
+            raise
+        for symbol, future in owned.items():
+            self.finish(prefix + symbol, future, fetched.get(symbol, None))
+        return {symbol: fetched[symbol] for symbol in owned if symbol in fetched}
+
+    def cached(self, key: str) -> Optional[Quote]:
+        # with the lock held
+        entry = self.entries.get(key, None)
+        if entry is not None and get_clock().timestamp() - entry[0] <= self.ttl:
+            self.count(key, "hits")
+            return entry[1]
+        return None
+
+    def start(self, key: str) -> Future:
+        # with the lock held
+        self.count(key, "misses")
+        future: Future = Future()
+        self.inflight[key] = future
+        return future
+
+    def finish(self, key: str, future: Future, quote: Optional[Quote], error: Optional[Exception] = None) -> None:
+        now = get_clock().timestamp()
+        with self.lock:
+            del self.inflight[key]
+            if error is not None:
+                self.count(key, "errors")
+            elif quote is not None:
+                self.entries[key] = (now, quote)
+                if len(self.entries) > ENTRY_LIMIT:
+                    self.entries = {k: entry for k, entry in self.entries.items() if now - entry[0] <= self.ttl}
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(quote)
+
+    def count(self, key: str, stat: str) -> None:
+        # with the lock held
+        if key not in self.stats:
+            self.stats[key] = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+        self.stats[key][stat] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            keys = {key: dict(stats) for key, stats in sorted(self.stats.items())}
+        totals = {stat: sum(stats[stat] for stats in keys.values()) for stat in ["hits", "misses", "coalesced", "errors"]}
+        return {"ttl": self.ttl, "totals": totals, "keys": keys}
+
+
+def quote_prefix(kind: str, exchange: str) -> str:
+    # quotes of one symbol asked for differently are cached apart, eg "quote:NFO:", "quote:NSE:", "index:NSE:"
+    return kind + ":" + exchange + ":"
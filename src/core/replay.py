@@ -0,0 +1,199 @@
+# Offline replay of a recorded tick journal (core.journal) through unchanged BaseStrategy subclasses.
+#
+# Run from src/:  python -m core.replay --short-code <short_code> --date 2024-05-02 --strategy core.strategy.TestStrategy
+#
+# Ticks go through a Ticker and the algo's TickHandoff / ticks_listener exactly like live ones, time comes from a
+# SimulatedClock that jumps from tick to tick, and orders are filled against the replayed prices by the paper broker.
+# Trades and strategies are saved under deploy_dir/replay/<date>/, never over the live trade files.
+
+import argparse
+import asyncio
+import importlib
+import os
+from datetime import datetime
+from typing import Dict, Iterator, List, Sequence, Tuple, Type
+
+import app  # noqa: F401, wires config/views the same way flask does before the broker modules are imported
+import instruments
+from algos.base import BaseAlgo
+from broker import paper
+from config import get_server_config
+from core.chain import OptionChains
+from core.clock import SimulatedClock, set_clock
+from core.events import EventBus
+from core.handoff import TickHandoff
+from core.journal import JournalReader, journal_paths
+from core.quotes import QuoteCache
+from core.strategy import BaseStrategy
+from models import AlgoStatus, TickData
+from models.trade import Trade
+from utils import get_epoch, get_market_endtime, get_today_date_str
+
+
+class ReplayAlgo(BaseAlgo):
+    broker: paper.Broker
+    ticker: paper.Ticker
+
+    def __init__(
+        self,
+        short_code: str,
+        reader: JournalReader,
+        strategies: List[Type[BaseStrategy]],
+        multiple: int = 1,
+        run: Sequence[int] = (1, 1, 1, 1, 1, 1, 1, 1, 1, 1),
+        latency_ms: float = 0,
+        slippage: float = 0,
+        settle_rounds: int = 8,
+    ) -> None:
+        super(ReplayAlgo, self).__init__(name=short_code + "_replay", args=(None, short_code, multiple))
+        self.loop.set_debug(False)
+        self.reader = reader
+        self.strategy_classes = strategies
+        self.run_config = list(run)
+        self.paper_settings = {"latency_ms": latency_ms, "slippage": slippage}
+        self.settle_rounds = settle_rounds  # loop iterations given to strategies after every batch
+        first = int(reader.records["recv_ts"][0]) if len(reader) > 0 else 0
+        self.clock = SimulatedClock(datetime.fromtimestamp(first / 1_000_000_000) if first > 0 else datetime.now())
+
+    def get_questdb_connection(self):
+        return None
+
+    def start_algo(self):
+        set_clock(self.clock)
+
+        # the saved instrument master for lot and tick sizes, recorded symbols it does not know get placeholders
+        instruments_list = instruments.load_instruments(self.short_code)
+        known = set(isd["tradingsymbol"] for isd in instruments_list)
+        for symbol, token in zip(self.reader.symbols, self.reader.tokens):
+            if symbol not in known:
+                instruments_list.append({"tradingsymbol": symbol, "instrument_token": token if token is not None else symbol, "segment": "", "tick_size": 0.05, "lot_size": 1})
+        instruments.register_instruments(self.short_code, instruments_list)
+
+        self.price_store = instruments.price_stores[self.short_code]
+        self.events = EventBus(self.loop, self.price_store)
+        self.option_chains = OptionChains(self.price_store, self.subscriptions.hold, self.subscriptions.release)
+        self.quote_cache = QuoteCache(float(get_server_config().get("quote_cache_ttl", 1.0)))
+
+        self.intradayTradesDir = os.path.join(get_server_config()["deploy_dir"], "replay", get_today_date_str())
+        if os.path.exists(self.intradayTradesDir) == False:
+            os.makedirs(self.intradayTradesDir)
+
+        # a paper broker without data broker, its ticker only sees what the replay pushes into on_feed_ticks
+        self.broker = paper.Broker({"broker_name": "paper", "short_code": self.short_code, "paper": self.paper_settings})
+        self.broker.orders_queue = self.orders_queue
+        self.broker.trades_queue = self.trades_queue
+        self.ticker = paper.Ticker(self.short_code, self.broker)
+
+        self.tick_handoff = TickHandoff(self.loop, self.ticks_listener)
+        self.ticker.register_batch_listener(self.tick_handoff.on_ticks)
+        self.ticker.register_order_listener(self.order_update_listener_threadsafe)
+
+        self.status = AlgoStatus.STARTED
+
+    async def start_strategies(self, short_code, multiple=0):
+        for strategy in self.strategy_classes:
+            await self.start_strategy(strategy, short_code, multiple, list(self.run_config))
+
+    def frames(self) -> Iterator[Tuple[float, List[TickData]]]:
+        # the journal's batches, as (epoch seconds, ticks); TickData and the list are reused like a live ticker does
+        records = self.reader.records
+        slot_of = self.price_store.symbol_to_slot
+        buffers = [TickData(symbol, slot_of.get(symbol, -1)) for symbol in self.reader.symbols]
+        batch: List[TickData] = []
+        start = 0
+        while start < len(records):
+            recv_ts = records["recv_ts"][start]
+            end = start + int(records["recv_ts"][start : start + 100_000].searchsorted(recv_ts, side="right"))
+            batch.clear()
+            for _, exchange_ts, sid, ltp, qty, avg_price, volume, buy_qty, sell_qty, open, high, low, close, change, oi in records[start:end].tolist():
+                tick = buffers[sid]
+                tick.lastTradedPrice = ltp
+                tick.lastTradedQuantity = qty
+                tick.avgTradedPrice = avg_price
+                tick.volume = volume
+                tick.totalBuyQuantity = buy_qty
+                tick.totalSellQuantity = sell_qty
+                tick.open = open
+                tick.high = high
+                tick.low = low
+                tick.close = close
+                tick.change = change
+                tick.oi = oi
+                tick.exchange_timestamp = datetime.fromtimestamp(exchange_ts / 1_000_000_000) if exchange_ts > 0 else None
+                batch.append(tick)
+            yield int(recv_ts) / 1_000_000_000, batch
+            start = end
+
+    async def settle(self) -> None:
+        for _ in range(self.settle_rounds):
+            await asyncio.sleep(0)
+
+    async def replay(self) -> List[Trade]:
+        for coro in [self.play(), self.add_orders(), self.add_trades()]:
+            self.tasks.append(asyncio.create_task(coro))
+
+        started = False
+        min_ticked = min(4, len(self.reader.symbols))
+        for epoch, ticks in self.frames():
+            self.clock.advance_to(epoch)
+            self.ticker.on_feed_ticks(ticks)
+            await self.settle()
+            if not started and self.price_store.ticked_count() >= min_ticked:
+                started = True
+                await self.start_strategies(self.short_code, self.multiple)
+                await self.settle()
+
+        # let square off deadlines and the trade manager loop run out the day
+        self.clock.advance_to(max(self.clock.timestamp(), get_epoch(get_market_endtime())))
+        await self.settle()
+
+        self.save_trades_to_file()
+        self.save_strategies_to_file()
+        self.save_latency_to_file()
+        for task in self.tasks:
+            task.cancel()
+        return self.trades
+
+    def get_trades_filepath(self):
+        return os.path.join(self.intradayTradesDir, self.short_code + ".json")
+
+    def get_strategies_filepath(self):
+        return os.path.join(self.intradayTradesDir, self.short_code + "_strategies.json")
+
+    def get_latency_filepath(self):
+        return os.path.join(self.intradayTradesDir, self.short_code + "_latency.json")
+
+
+def load_class(path: str) -> Type:
+    module_name, class_name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a recorded tick journal through strategies")
+    parser.add_argument("--short-code", required=True)
+    parser.add_argument("--date", required=True, help="journal day, YYYY-MM-DD")
+    parser.add_argument("--journal-dir", help="defaults to deploy_dir/journal")
+    parser.add_argument("--strategy", action="append", required=True, help="dotted path of a BaseStrategy subclass, repeatable")
+    parser.add_argument("--multiple", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=0, help="order placement / modification latency")
+    parser.add_argument("--slippage", type=float, default=0, help="adverse fill slippage as a fraction of the price")
+    args = parser.parse_args()
+
+    journal_dir = args.journal_dir if args.journal_dir else os.path.join(get_server_config()["deploy_dir"], "journal")
+    reader = JournalReader(journal_paths(journal_dir, args.short_code, args.date)[0])
+    algo = ReplayAlgo(args.short_code, reader, [load_class(path) for path in args.strategy], args.multiple, latency_ms=args.latency_ms, slippage=args.slippage)
+    algo.start_algo()
+    trades = algo.loop.run_until_complete(algo.replay())
+
+    pnl: Dict[str, float] = {}
+    for trade in trades:
+        pnl[trade.strategy] = pnl.get(trade.strategy, 0) + trade.pnl
+        print("%s %s %s qty=%d entry=%.2f exit=%.2f pnl=%.2f %s" % (trade.strategy, trade.trading_symbol, trade.state, trade.filled_qty, trade.entry, trade.exit, trade.pnl, trade.exit_reason))
+    for strategy, strategy_pnl in pnl.items():
+        print("%s: pnl = %.2f" % (strategy, strategy_pnl))
+    print("ticks replayed = %d, trades saved to %s" % (len(reader), algo.get_trades_filepath()))
+
+
+if __name__ == "__main__":
+    main()
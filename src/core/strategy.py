@@ -2,18 +2,33 @@ import asyncio
 import functools
 import logging
 import math
-import time
 from abc import ABC
 from datetime import datetime
 from math import ceil
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 from broker.base import Broker
 from core import Quote
-from exceptions import DeRegisterStrategyException, DisableTradeException
-from instruments import get_cmp, get_instrument_data_by_symbol, round_to_ticksize
+from core.chain import OptionChain, OptionChains
+from core.clock import get_clock
+from core.events import EventBus
+from core.quotes import QuoteCache, quote_prefix
+from core.strikes import StrikeChain
+from core.triggers import Trigger
+from exceptions import (
+    DeRegisterStrategyException,
+    DisableTradeException,
+    StaleOrderRequestException,
+)
+from instruments import (
+    get_cmp,
+    get_instrument_data_by_symbol,
+    get_price_handle,
+    round_to_ticksize,
+)
 from models import (
     Direction,
+    OrderPriority,
     OrderStatus,
     OrderType,
     ProductType,
@@ -33,10 +48,30 @@ from utils import (
     is_today_weekly_expiry,
     prepare_weekly_options_symbol,
     prepareMonthlyExpiryFuturesSymbol,
-    wait_till_market_open,
+    wait_till_market_open_async,
 )
 
 
+def order_coroutine(method: Callable) -> Callable:
+    # The order methods of BaseStrategy are coroutines for the algo loop. Awaited there they run as they are; called from
+    # anywhere else (a Flask view, another thread or loop) they are scheduled onto the strategy's algo loop and a future of
+    # the result is returned, with no algo loop to schedule onto they fail instead of returning a coroutine nobody runs.
+    @functools.wraps(method)
+    def wrapper(self: "BaseStrategy", *args, **kwargs):
+        try:
+            running: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not None and (self.loop is None or running is self.loop):
+            return method(self, *args, **kwargs)
+        if self.loop is None or self.loop.is_closed():
+            raise RuntimeError(self.getName() + ": " + method.__name__ + " is a coroutine of the algo loop, await it there")
+        future = asyncio.run_coroutine_threadsafe(method(self, *args, **kwargs), self.loop)
+        return asyncio.wrap_future(future) if running is not None else future
+
+    return wrapper
+
+
 class BaseStrategy(ABC):
 
     def __init__(self, name: str, short_code: str, broker: Broker, multiple: int = 0) -> None:  # type: ignore
@@ -68,6 +103,24 @@ class BaseStrategy(ABC):
         self.exchange = "NFO"
         self.equityExchange = "NSE"
         self.run_config = [0, -1, -1, -1, -1, -1, 0, 0, 0, 0]
+        # strategies are woken up by events (price crossings, order updates, deadlines), polling is only a fallback
+        self.events: Optional[EventBus] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None  # the algo loop the strategy runs on, see order_coroutine
+        self.subscribe: Optional[Callable[[List[str]], None]] = None  # holds symbols on the algo's ticker (core.subscriptions)
+        self.chains: Optional[OptionChains] = None  # the algo's live option chains, shared by its strategies
+        self.quote_cache: Optional[QuoteCache] = None  # the algo's broker quotes, shared by its strategies
+        self.quoteMaxAge = 5.0  # seconds a streamed tick is good for as a quote, 0 to always ask the broker
+        self.quoteSubscribe = True  # stream symbols quoted from the broker, their next quotes come from the ticks
+        self.quoted: Set[str] = set()  # symbols held for quoteSubscribe, released by the algo with the strategy
+        self.strikeBand = 20  # strikes either side of ATM the strike selection and the option chain look at
+        self.heartbeatSeconds = 30
+        self.wakeup = asyncio.Event()
+        self.wake_reasons: Set[str] = set()  # why the current cycle runs, for process() to look at
+        self.pending_wake_reasons: Set[str] = set()
+        self.woken_trades: Dict[str, Trade] = {}  # trades whose trigger level was crossed, tracked in the current cycle
+        self.pending_woken_trades: Dict[str, Trade] = {}
+        self.trade_triggers: Dict[str, Tuple[Tuple, List[Trigger]]] = {}  # trade id => (armed levels, triggers)
+        self.mtm_triggers: Tuple[Tuple, List[Trigger]] = ((), [])
 
     def getName(self) -> str:
         return self.name
@@ -142,7 +195,7 @@ class BaseStrategy(ABC):
     def canTradeToday(self) -> bool:
         # if the run is not set, it will default to -1, thus wait
         while self.getLots() == -1:
-            time.sleep(2)
+            get_clock().sleep(2)
 
         # strategy will run only if the number of lots is > 0
         return self.getLots() > 0
@@ -184,20 +237,22 @@ class BaseStrategy(ABC):
         if self.canTradeToday() == False:
             raise DeRegisterStrategyException("Can't be traded today.")
 
-        now = datetime.now()
+        now = get_clock().now()
         if now < get_market_starttime():
-            wait_till_market_open(self.getName())
+            await wait_till_market_open_async(self.getName())
 
-        now = datetime.now()
+        now = get_clock().now()
         if now < self.startTimestamp:
             waitSeconds = get_epoch(self.startTimestamp) - get_epoch(now)
             logging.info("%s: Waiting for %d seconds till startegy start timestamp reaches...", self.getName(), waitSeconds)
             if waitSeconds > 0:
-                time.sleep(waitSeconds)
+                await get_clock().sleep_async(waitSeconds)
 
         if self.getVIXThreshold() > get_cmp(self.short_code, "INDIA VIX"):
             raise DeRegisterStrategyException("VIX threshold is not met. Can't run it!")
 
+        self.subscribe_default_events()
+
         # Run in an loop and keep processing
         while True:
 
@@ -205,7 +260,7 @@ class BaseStrategy(ABC):
                 logging.warn("%s: Exiting the strategy as market closed or strategy was disabled.", self.getName())
                 break
 
-            now = datetime.now()
+            now = get_clock().now()
             if now > self.squareOffTimestamp:
                 self.setDisabled()
                 logging.warn("%s: Disabled the strategy as Squareoff time is passed.", self.getName())
@@ -213,95 +268,188 @@ class BaseStrategy(ABC):
                 return
 
             # track each trade and take necessary action
-            self.trackAndUpdateAllTrades()
+            await self.trackAndUpdateAllTrades()
 
-            self.checkStrategyHealth()
+            await self.checkStrategyHealth()
 
             # Derived class specific implementation will be called when process() is called
             await self.process()
 
-            # Sleep and wake up 5s after every 15th second, ie after trade manager has updated trades
-
-            waitSeconds = 5 - (now.second % 5) + 3
-            await asyncio.sleep(waitSeconds)
-
-    def trackAndUpdateAllTrades(self):
+            await self.wait_for_wakeup()
 
+    def subscribe_default_events(self) -> None:
+        if self.events is None:
+            return
+        self.events.subscribe_order_updates(self)
+        for deadline in [self.stopTimestamp, self.squareOffTimestamp]:
+            if deadline is not None:
+                self.events.subscribe_deadline(self, deadline)
         for trade in self.trades:
+            if trade.state == TradeState.ACTIVE and trade.intraday_squareoff_timestamp is not None:
+                self.events.subscribe_deadline(self, datetime.fromtimestamp(trade.intraday_squareoff_timestamp))
+
+    def subscribe_price_cross(self, trading_symbol: str, level: float) -> None:
+        # wake up once the price of trading_symbol crosses level, only possible for symbols the ticker streams
+        if self.events is not None:
+            self.events.subscribe_price_cross(self, trading_symbol, level)
+
+    def subscribe_deadline(self, when: datetime) -> None:
+        if self.events is not None:
+            self.events.subscribe_deadline(self, when)
+
+    def wake(self, reason: str, trade: Optional[Trade] = None) -> None:
+        self.pending_wake_reasons.add(reason)
+        if trade is not None:
+            self.pending_woken_trades[trade.trade_id] = trade
+        self.wakeup.set()
+
+    async def wait_for_wakeup(self) -> None:
+        if self.events is None:
+            # not attached to an algo event bus, poll like before: wake up 5s after every 15th second, ie after trade manager has updated trades
+            now = get_clock().now()
+            await get_clock().sleep_async(5 - (now.second % 5) + 3)
+            return
+        if not await get_clock().wait_event(self.wakeup, self.heartbeatSeconds):
+            self.pending_wake_reasons.add("heartbeat")
+        self.wakeup.clear()
+        self.wake_reasons = self.pending_wake_reasons
+        self.pending_wake_reasons = set()
+        self.woken_trades = self.pending_woken_trades
+        self.pending_woken_trades = {}
+
+    async def trackAndUpdateAllTrades(self):
+
+        trades = self.trades
+        reasons = self.wake_reasons
+        if self.events is not None and len(reasons) > 0 and "trigger:mtm" not in reasons and all(reason.startswith("trigger:") for reason in reasons):
+            # only trade trigger levels were crossed, the other trades have nothing new to track. A crossed MTM level
+            # has no trade of its own, checkStrategyHealth needs the pnl of all of them
+            trades = list(self.woken_trades.values())
+
+        for trade in trades:
             if trade.state == TradeState.ACTIVE:
-                self._trackEntryOrder(trade)
-                self._trackTargetOrder(trade)
-                self._trackSLOrder(trade)
+                await self._trackEntryOrder(trade)
+                if trade.exit_reason == TradeExitReason.TRADE_FAILED.value and trade.entry > 0 and len(trade.target_orders) == 0:
+                    # an unwound basket leg which filled before its entry order could be cancelled
+                    trade.target = self.get_trade_cmp(trade)
+                    await self.square_off_trade(trade, TradeExitReason.TRADE_FAILED)
+                await self._trackTargetOrder(trade)
+                await self._trackSLOrder(trade)
                 if trade.intraday_squareoff_timestamp != None:
                     nowEpoch = get_epoch()
                     if nowEpoch >= trade.intraday_squareoff_timestamp:
-                        trade.target = get_cmp(self.short_code, trade.trading_symbol)
-                        self.square_off_trade(trade, TradeExitReason.SQUARE_OFF)
+                        trade.target = self.get_trade_cmp(trade)
+                        await self.square_off_trade(trade, TradeExitReason.SQUARE_OFF)
+            self.arm_trade_triggers(trade)
 
-    def checkStrategyHealth(self):
+    def arm_trade_triggers(self, trade: Trade) -> None:
+        # keep SL, target and square off time of an active trade in the algo's trigger index, re-armed only when they change
+        if self.events is None:
+            return
+        levels: Tuple = ()
+        if trade.state == TradeState.ACTIVE:
+            levels = (trade.direction, trade.stopLoss, trade.target, trade.intraday_squareoff_timestamp)
+        armed_levels, triggers = self.trade_triggers.get(trade.trade_id, ((), []))
+        if levels == armed_levels and all(trigger.active for trigger in triggers):
+            return
+        for trigger in triggers:
+            self.events.unsubscribe(trigger)
+        triggers = []
+        if len(levels) > 0:
+            long = trade.direction == Direction.LONG
+            if trade.stopLoss > 0:
+                triggers.append(self.events.subscribe_price_level(self, trade.trading_symbol, trade.stopLoss, not long, trade))
+            if trade.target > 0:
+                triggers.append(self.events.subscribe_price_level(self, trade.trading_symbol, trade.target, long, trade))
+            if trade.intraday_squareoff_timestamp is not None:
+                triggers.append(self.events.subscribe_time(self, trade.intraday_squareoff_timestamp, trade))
+            self.trade_triggers[trade.trade_id] = (levels, triggers)
+        else:
+            self.trade_triggers.pop(trade.trade_id, None)
+
+    def arm_mtm_triggers(self) -> None:
+        # strategy SL / target / trail thresholds of isTargetORSLHit as levels on the strategy MTM the event bus moves with ticks
+        if self.events is None or not self.isEnabled() or (self.strategySL == 0 and self.strategyTarget == 0):
+            return
+        weights: Dict[str, float] = {}
+        for trade in self.trades:
+            if trade.state == TradeState.ACTIVE and trade.filled_qty > 0:
+                weight = trade.filled_qty if trade.direction == Direction.LONG else -trade.filled_qty
+                weights[trade.trading_symbol] = weights.get(trade.trading_symbol, 0) + weight
+        self.events.set_mtm(self, sum([trade.pnl for trade in self.trades]), weights)
+
+        lots = self.getLots()
+        levels = (self.strategySL * lots, self.strategyTarget * lots)
+        armed_levels, triggers = self.mtm_triggers
+        if levels == armed_levels and all(trigger.active for trigger in triggers):
+            return
+        for trigger in triggers:
+            self.events.unsubscribe(trigger)
+        triggers = []
+        if self.strategySL != 0:
+            triggers.append(self.events.subscribe_mtm(self, self.strategySL * lots, False))
+        if self.strategyTarget > 0:
+            triggers.append(self.events.subscribe_mtm(self, self.strategyTarget * lots, True))
+        if self.strategySL > 0:
+            triggers.append(self.events.subscribe_mtm(self, self.strategySL * 1.2 * lots, True))  # trail the strategy SL
+        self.mtm_triggers = (levels, triggers)
+
+    async def checkStrategyHealth(self):
         if self.isEnabled():
             SLorTargetHit = self.isTargetORSLHit()
             if SLorTargetHit is not None:
-                self.squareOffStrategy(SLorTargetHit)
+                await self.square_off(SLorTargetHit)
+        self.arm_mtm_triggers()
 
-    def _trackEntryOrder(self, trade: Trade):
+    async def _trackEntryOrder(self, trade: Trade):
         if trade.state != TradeState.ACTIVE:
             return
 
-        if len(trade.entry_orders) == 0:
+        entries = trade.entry_state
+        if entries.orders == 0:
             return
 
-        trade.filled_qty = 0
-        trade.entry = 0
-        orderCanceled = 0
-        orderRejected = 0
-
-        for entryOrder in trade.entry_orders:
-            if entryOrder.order_status == OrderStatus.CANCELLED:
-                orderCanceled += 1
-
-            if entryOrder.order_status == entryOrder.order_status == OrderStatus.REJECTED:
-                orderRejected += 1
+        trade.filled_qty = entries.filled_qty
+        trade.entry = entries.average_price
 
+        for entryOrder in trade.entry_orders if entries.working > 0 else []:
             if entryOrder.filled_qty > 0:
-                trade.entry = (trade.entry * trade.filled_qty + entryOrder.average_price * entryOrder.filled_qty) / (trade.filled_qty + entryOrder.filled_qty)
-            elif entryOrder.order_status not in [OrderStatus.REJECTED, OrderStatus.CANCELLED, None] and not entryOrder.order_type in [OrderType.SL_LIMIT]:
+                continue
+            if entryOrder.order_status not in [OrderStatus.REJECTED, OrderStatus.CANCELLED, None] and not entryOrder.order_type in [OrderType.SL_LIMIT]:
                 omp = OrderModifyParams()
                 if trade.direction == Direction.LONG:
                     omp.new_price = round_to_ticksize(self.short_code, trade.trading_symbol, entryOrder.price * 1.01) + 0.05
                 else:
                     omp.new_price = round_to_ticksize(self.short_code, trade.trading_symbol, entryOrder.price * 0.99) - 0.05
                 try:
-                    self.modify_order(entryOrder, omp, trade.qty)
+                    await self.modify_order(entryOrder, omp, trade.qty, OrderPriority.ENTRY, trade.trade_id)
                 except Exception as e:
-                    if e.args[0] == "Maximum allowed order modifications exceeded.":
-                        self.cancel_order(entryOrder)
+                    # an order out of modifications is replaced by the broker (broker.modify), try again next cycle
+                    logging.info("%s: couldn't re-price entry order %s: %s", self.getName(), entryOrder.order_id, str(e))
             elif entryOrder.order_status in [OrderStatus.TRIGGER_PENDING]:
                 nowEpoch = get_epoch()
                 if nowEpoch >= get_epoch(self.stopTimestamp):
-                    self.cancel_order(entryOrder)
-
-            trade.filled_qty += entryOrder.filled_qty
+                    await self.cancel_order(entryOrder)
 
-        if orderCanceled == len(trade.entry_orders):
+        if entries.status == OrderStatus.CANCELLED:
             trade.state = TradeState.CANCELLED
 
-        if orderRejected == len(trade.entry_orders):
+        if entries.status == OrderStatus.REJECTED:
             trade.state = TradeState.DISABLED
 
-        if orderRejected > 0:
+        if entries.count(OrderStatus.REJECTED) > 0:
             strategy = self
             for trade in strategy.trades:
                 if trade.state in [TradeState.ACTIVE]:
-                    trade.target = get_cmp(self.short_code, trade.trading_symbol)
-                    self.square_off_trade(trade, TradeExitReason.TRADE_FAILED)
+                    trade.target = self.get_trade_cmp(trade)
+                    await self.square_off_trade(trade, TradeExitReason.TRADE_FAILED)
                 strategy.setDisabled()
 
         # Update the current market price and calculate pnl
-        trade.cmp = get_cmp(self.short_code, trade.trading_symbol)
+        trade.cmp = self.get_trade_cmp(trade)
         calculate_trade_pnl(trade)
 
-    def _trackSLOrder(self, trade: Trade):
+    async def _trackSLOrder(self, trade: Trade):
         if trade.state != TradeState.ACTIVE:
             for entryOrder in trade.entry_orders:
                 if entryOrder.order_status in [OrderStatus.OPEN, OrderStatus.TRIGGER_PENDING]:
@@ -314,28 +462,15 @@ class BaseStrategy(ABC):
             else:
                 trade.stopLoss = newSL
 
-        if len(trade.sl_orders) == 0 and trade.entry > 0:
+        sls = trade.sl_state
+        if sls.orders == 0 and trade.entry > 0 and trade.exit_reason is None:
             # Place SL order
-            self.place_sl_order(trade)
+            await self.place_sl_order(trade)
         else:
-            slCompleted = 0
-            slAverage = 0.0
-            slQuantity = 0
-            slCancelled = 0
-            slRejected = 0
-            slOpen = 0
-            for slOrder in trade.sl_orders:
-                if slOrder.order_status == OrderStatus.COMPLETE:
-                    slCompleted += 1
-                    slAverage = (slQuantity * slAverage + slOrder.filled_qty * slOrder.average_price) / (slQuantity + slOrder.filled_qty)
-                    slQuantity += slOrder.filled_qty
-                elif slOrder.order_status == OrderStatus.CANCELLED:
-                    slCancelled += 1
-                elif slOrder.order_status == OrderStatus.REJECTED:
-                    slRejected += 1
-                elif slOrder.order_status == OrderStatus.OPEN:
-                    slOpen += 1
-                    newPrice = (slOrder.price + get_cmp(self.short_code, trade.trading_symbol)) * 0.5
+            for slOrder in trade.sl_orders if sls.count(OrderStatus.OPEN) > 0 else []:
+                if slOrder.order_status == OrderStatus.OPEN:
+                    # the SL triggered but its limit price was passed, chase it
+                    newPrice = (slOrder.price + self.get_trade_cmp(trade)) * 0.5
                     omp = OrderModifyParams()
                     if trade.direction == Direction.LONG:
                         omp.new_trigger_price = round_to_ticksize(self.short_code, trade.trading_symbol, newPrice) - 0.05
@@ -344,44 +479,40 @@ class BaseStrategy(ABC):
                         omp.new_trigger_price = round_to_ticksize(self.short_code, trade.trading_symbol, newPrice) + 0.05
                         omp.new_price = round_to_ticksize(self.short_code, trade.trading_symbol, newPrice * 1.01) + 0.05
 
-                    self.modify_order(slOrder, omp, trade.qty)
+                    await self.modify_order(slOrder, omp, trade.qty)
 
-            if slCompleted == len(trade.sl_orders) and len(trade.sl_orders) > 0:
+            if sls.status == OrderStatus.COMPLETE:
                 # SL Hit
-                exit = slAverage
+                exit = sls.average_price
                 exitReason = TradeExitReason.SL_HIT if trade.initial_stoploss == trade.stopLoss else TradeExitReason.TRAIL_SL_HIT
                 self.setTradeToCompleted(trade, exit, exitReason)
                 # Make sure to cancel target order if exists
-                self.cancel_orders(trade.target_orders)
-
-            elif slCancelled == len(trade.sl_orders) and len(trade.sl_orders) > 0:
-                targetOrderPendingCount = 0
-                for targetOrder in trade.target_orders:
-                    if targetOrder.order_status not in [OrderStatus.COMPLETE, OrderStatus.OPEN]:
-                        targetOrderPendingCount += 1
-                if targetOrderPendingCount == len(trade.target_orders):
+                await self.cancel_orders(trade.target_orders)
+
+            elif sls.status == OrderStatus.CANCELLED:
+                if trade.target_state.count(OrderStatus.COMPLETE) + trade.target_state.count(OrderStatus.OPEN) == 0:
                     # Cancel target order if exists
-                    self.cancel_orders(trade.target_orders)
+                    await self.cancel_orders(trade.target_orders)
                     # SL order cancelled outside of algo (manually or by broker or by exchange)
                     logging.error(
                         "SL order tradeID %s cancelled outside of Algo. Setting the trade as completed with exit price as current market price.",
                         trade.trade_id,
                     )
-                    exit = get_cmp(self.short_code, trade.trading_symbol)
+                    exit = self.get_trade_cmp(trade)
                     self.setTradeToCompleted(trade, exit, TradeExitReason.SL_CANCELLED)
-            elif slRejected > 0:
+            elif sls.count(OrderStatus.REJECTED) > 0:
                 strategy = self
                 for trade in strategy.trades:
                     if trade.state in [TradeState.ACTIVE]:
-                        trade.target = get_cmp(self.short_code, trade.trading_symbol)
-                        self.square_off_trade(trade, TradeExitReason.TRADE_FAILED)
+                        trade.target = self.get_trade_cmp(trade)
+                        await self.square_off_trade(trade, TradeExitReason.TRADE_FAILED)
                     strategy.setDisabled()
-            elif slOpen > 0:
+            elif sls.count(OrderStatus.OPEN) > 0:
                 pass  # handled above, skip calling trail SL
             else:
-                self.checkAndUpdateTrailSL(trade)
+                await self.checkAndUpdateTrailSL(trade)
 
-    def checkAndUpdateTrailSL(self, trade: Trade):
+    async def checkAndUpdateTrailSL(self, trade: Trade):
         # Trail the SL if applicable for the trade
         strategyInstance = self
         newTrailSL = round_to_ticksize(self.short_code, trade.trading_symbol, strategyInstance.getTrailingSL(trade))
@@ -392,13 +523,13 @@ class BaseStrategy(ABC):
                     updateSL = True
                 else:
                     logging.info("TradeManager: Trail SL %f triggered Squareoff at market for tradeID %s", newTrailSL, trade.trade_id)
-                    self.square_off_trade(trade, reason=TradeExitReason.SL_HIT)
+                    await self.square_off_trade(trade, reason=TradeExitReason.SL_HIT)
             elif trade.direction == Direction.SHORT and newTrailSL < trade.stopLoss:
                 if newTrailSL > trade.cmp:
                     updateSL = True
                 else:  # in case the SL is called due to all leg squareoff
                     logging.info("TradeManager: Trail SL %f triggered Squareoff at market for tradeID %s", newTrailSL, trade.trade_id)
-                    self.square_off_trade(trade, reason=TradeExitReason.SL_HIT)
+                    await self.square_off_trade(trade, reason=TradeExitReason.SL_HIT)
         if updateSL == True:
             omp = OrderModifyParams()
             omp.new_trigger_price = newTrailSL
@@ -409,82 +540,72 @@ class BaseStrategy(ABC):
             try:
                 oldSL = trade.stopLoss
                 for slOrder in trade.sl_orders:
-                    self.modify_order(slOrder, omp, trade.qty)
+                    await self.modify_order(slOrder, omp, trade.qty)
                 logging.info("TradeManager: Trail SL: Successfully modified stopLoss from %f to %f for tradeID %s", oldSL, newTrailSL, trade.trade_id)
                 # IMPORTANT: Dont forget to update this on successful modification
                 trade.stopLoss = newTrailSL
             except Exception as e:
                 logging.error("TradeManager: Failed to modify SL order for tradeID %s : Error => %s", trade.trade_id, str(e))
 
-    def _trackTargetOrder(self, trade: Trade):
+    async def _trackTargetOrder(self, trade: Trade):
         if trade.state != TradeState.ACTIVE and self.isTargetORSLHit() is not None:
             return
         if trade.target == 0:  # Do not place Target order if no target provided
             return
-        if len(trade.target_orders) == 0 and trade.entry > 0:  # place target order only after the entry happened
+        targets = trade.target_state
+        if targets.orders == 0 and trade.entry > 0:  # place target order only after the entry happened
             # Place Target order
-            self.place_target_order(trade)
+            await self.place_target_order(trade)
         else:
-            targetCompleted = 0
-            targetAverage = 0.0
-            targetQuantity = 0
-            targetCancelled = 0
-            targetOpen = 0
-            for targetOrder in trade.target_orders:
-                if targetOrder.order_status == OrderStatus.COMPLETE:
-                    targetCompleted += 1
-                    targetAverage = (targetQuantity * targetAverage + targetOrder.filled_qty * targetOrder.average_price) / (
-                        targetQuantity + targetOrder.filled_qty
-                    )
-                    targetQuantity += targetOrder.filled_qty
-                elif targetOrder.order_status == OrderStatus.CANCELLED:
-                    targetCancelled += 1
-                elif targetOrder.order_status == OrderStatus.OPEN and trade.exit_reason is not None:
-                    targetOpen += 1
+            for targetOrder in trade.target_orders if targets.count(OrderStatus.OPEN) > 0 and trade.exit_reason is not None else []:
+                if targetOrder.order_status == OrderStatus.OPEN:
+                    # exiting, chase the target towards the market
                     omp = OrderModifyParams()
                     if trade.direction == Direction.LONG:
-                        omp.new_trigger_price = round_to_ticksize(targetOrder.price * 0.99) - 0.05
-                        omp.new_price = round_to_ticksize(omp.new_trigger_price * 0.99) - 0.05
+                        omp.new_trigger_price = round_to_ticksize(self.short_code, trade.trading_symbol, targetOrder.price * 0.99) - 0.05
+                        omp.new_price = round_to_ticksize(self.short_code, trade.trading_symbol, omp.new_trigger_price * 0.99) - 0.05
                     else:
-                        omp.new_trigger_price = round_to_ticksize(targetOrder.price * 1.01) + 0.05
-                        omp.new_price = round_to_ticksize(omp.new_trigger_price * 1.01) + 0.05
+                        omp.new_trigger_price = round_to_ticksize(self.short_code, trade.trading_symbol, targetOrder.price * 1.01) + 0.05
+                        omp.new_price = round_to_ticksize(self.short_code, trade.trading_symbol, omp.new_trigger_price * 1.01) + 0.05
 
-                    self.modify_order(targetOrder, omp, trade.qty)
+                    await self.modify_order(targetOrder, omp, trade.qty)
 
-            if targetCompleted == len(trade.target_orders) and len(trade.target_orders) > 0:
+            if targets.status == OrderStatus.COMPLETE:
                 # Target Hit
-                exit = targetAverage
+                exit = targets.average_price
                 self.setTradeToCompleted(trade, exit, TradeExitReason.TARGET_HIT)
                 # Make sure to cancel sl order
-                self.cancel_orders(trade.sl_orders)
+                await self.cancel_orders(trade.sl_orders)
 
-            elif targetCancelled == len(trade.target_orders) and len(trade.target_orders) > 0:
+            elif targets.status == OrderStatus.CANCELLED:
                 # Target order cancelled outside of algo (manually or by broker or by exchange)
                 logging.error(
                     "Target orderfor tradeID %s cancelled outside of Algo. Setting the trade as completed with exit price as current market price.",
                     trade.trade_id,
                 )
-                exit = get_cmp(self.short_code, trade.trading_symbol)
+                exit = self.get_trade_cmp(trade)
                 self.setTradeToCompleted(trade, exit, TradeExitReason.TARGET_CANCELLED)
                 # Cancel SL order
-                self.cancel_orders(trade.sl_orders)
+                await self.cancel_orders(trade.sl_orders)
 
-    def cancel_orders(self, orders: List[Order]):
+    @order_coroutine
+    async def cancel_orders(self, orders: List[Order], priority: OrderPriority = OrderPriority.PROTECT):
         if len(orders) == 0:
             return
         for order in orders:
             if order.order_status == OrderStatus.CANCELLED:
                 continue
             try:
-                self.cancel_order(order)
+                await self.cancel_order(order, priority)
             except Exception as e:
                 logging.error("Failed to cancel order %s: Error => %s", order.order_id, str(e))
                 raise (e)
             logging.info("Successfully cancelled order %s", order.order_id)
 
-    def place_entry_order(self, trade: Trade):
+    @order_coroutine
+    async def place_entry_order(self, trade: Trade, checked: bool = False):
         try:
-            if not self.shouldPlaceTrade(trade):
+            if not checked and not self.shouldPlaceTrade(trade):
                 return False
         except DisableTradeException as e:
             logging.info("Going to disable trade ID %s with the reason %s", trade.trade_id, str(e))
@@ -503,21 +624,26 @@ class BaseStrategy(ABC):
         oip.price = round_to_ticksize(self.short_code, trade.trading_symbol, trade.requested_entry * (1.01 if trade.direction == Direction.LONG else 0.99))
         oip.qty = trade.qty
         oip.tag = trade.strategy
+        oip.decision_time = get_clock().timestamp()
         if trade.is_futures == True or trade.is_options == True:
             oip.is_fno = True
         try:
-            placed_order = self.broker.place_order(oip)
-            trade.entry_orders.append(placed_order)
+            placed_order = await self.broker.place_order_async(oip, OrderPriority.ENTRY, trade.trade_id)
+            trade.add_entry_order(placed_order)
             self.orders[placed_order.order_id] = placed_order
         except Exception as e:
             logging.error("Execute trade failed for tradeID %s: Error => %s", trade.trade_id, str(e))
             return False
 
         logging.info("Execute trade successful for %s and entryOrder %s", trade, placed_order)
+        # set trade state to ACTIVE, as the old trade manager did once the entry order was placed
+        trade.state = TradeState.ACTIVE
+        trade.start_timestamp = get_epoch()
         self.broker.trades_queue.put_nowait(trade)
         return True
 
-    def place_target_order(self, trade: Trade, isMarketOrder: bool = False, target: float = 0.0):
+    @order_coroutine
+    async def place_target_order(self, trade: Trade, isMarketOrder: bool = False, target: float = 0.0):
         oip = OrderInputParams(trade.trading_symbol)
         oip.exchange = trade.exchange
         oip.direction = Direction.SHORT if trade.direction == Direction.LONG else Direction.LONG
@@ -531,11 +657,13 @@ class BaseStrategy(ABC):
         oip.price = round_to_ticksize(self.short_code, trade.trading_symbol, target * (+1.01 if trade.direction == Direction.LONG else 0.99))
         oip.qty = trade.filled_qty
         oip.tag = trade.strategy
+        oip.decision_time = get_clock().timestamp()
         if trade.is_futures == True or trade.is_options == True:
             oip.is_fno = True
         try:
-            placed_order = self.broker.place_order(oip)
-            trade.target_orders.append(placed_order)
+            # a market target is an exit, it goes ahead of everything else
+            placed_order = await self.broker.place_order_async(oip, OrderPriority.SQUARE_OFF if isMarketOrder else OrderPriority.PROTECT, trade.trade_id)
+            trade.add_target_order(placed_order)
             self.orders[placed_order.order_id] = placed_order
             trade.target = target
         except Exception as e:
@@ -543,7 +671,8 @@ class BaseStrategy(ABC):
             raise (e)
         logging.info("Successfully placed Target order %s for tradeID %s", placed_order.order_id, trade.trade_id)
 
-    def place_sl_order(self, trade: Trade):
+    @order_coroutine
+    async def place_sl_order(self, trade: Trade):
         oip = OrderInputParams(trade.trading_symbol)
         oip.exchange = trade.exchange
         oip.direction = Direction.SHORT if trade.direction == Direction.LONG else Direction.LONG
@@ -553,22 +682,32 @@ class BaseStrategy(ABC):
         oip.price = round_to_ticksize(self.short_code, trade.trading_symbol, trade.stopLoss * (0.99 if trade.direction == Direction.LONG else 1.01))
         oip.qty = trade.qty
         oip.tag = trade.strategy
+        oip.decision_time = get_clock().timestamp()
         if trade.is_futures == True or trade.is_options == True:
             oip.is_fno = True
         try:
-            placed_order = self.broker.place_order(oip)
-            trade.sl_orders.append(placed_order)
+            placed_order = await self.broker.place_order_async(oip, OrderPriority.PROTECT, trade.trade_id)
+            trade.add_sl_order(placed_order)
             self.orders[placed_order.order_id] = placed_order
         except Exception as e:
             logging.error("Failed to place SL order for tradeID %s: Error => %s", trade.trade_id, str(e))
             raise (e)
         logging.info("Successfully placed SL order %s for tradeID %s", placed_order.order_id, trade.trade_id)
 
-    def cancel_order(self, order: Order) -> None:
-        self.broker.cancel_order(order)
+    @order_coroutine
+    async def cancel_order(self, order: Order, priority: OrderPriority = OrderPriority.PROTECT) -> None:
+        try:
+            await self.broker.cancel_order_async(order, priority)
+        except StaleOrderRequestException:
+            logging.info("%s: cancel of order %s superseded by a newer one", self.getName(), order.order_id)
 
-    def modify_order(self, order: Order, omp: OrderModifyParams, qty: int):
-        self.broker.modify_order(order, omp, qty)
+    @order_coroutine
+    async def modify_order(self, order: Order, omp: OrderModifyParams, qty: int, priority: OrderPriority = OrderPriority.PROTECT, group: Optional[str] = None):
+        try:
+            await self.broker.modify_order_async(order, omp, qty, priority, group)
+        except StaleOrderRequestException as e:
+            # a newer modification or cancel of the order was queued behind it, or the trade is being squared off
+            logging.info("%s: modification of order %s not sent: %s", self.getName(), order.order_id, str(e))
 
     def setTradeToCompleted(self, trade: Trade, exit, exitReason=None):
         trade.state = TradeState.COMPLETED
@@ -586,29 +725,35 @@ class BaseStrategy(ABC):
 
         calculate_trade_pnl(trade)
 
-    def square_off(self, reason=TradeExitReason.SQUARE_OFF) -> None:
-        for trade in self.trades:
-            if trade.state in [TradeState.ACTIVE]:
-                trade.target = get_cmp(self.short_code, trade.trading_symbol)
-                self.square_off_trade(trade, reason)
+    @order_coroutine
+    async def square_off(self, reason=TradeExitReason.SQUARE_OFF) -> None:
+        # entries still waiting for the order budget would only add exposure now
+        self.broker.drop_queued_orders(self.getName() + ":")
+        trades = [trade for trade in self.trades if trade.state in [TradeState.ACTIVE]]
+        for trade in trades:
+            trade.target = self.get_trade_cmp(trade)
+        # the trades' exit orders are independent, send them all without waiting on each other's responses
+        await asyncio.gather(*[self.square_off_trade(trade, reason) for trade in trades])
         self.setDisabled()
 
-    def square_off_trade(self, trade: Trade, reason=TradeExitReason.SQUARE_OFF):
+    @order_coroutine
+    async def square_off_trade(self, trade: Trade, reason=TradeExitReason.SQUARE_OFF):
         logging.info("TradeManager: squareOffTrade called for tradeID %s with reason %s", trade.trade_id, reason)
         if trade == None or trade.state != TradeState.ACTIVE:
             return
 
         trade.exit_reason = reason.value
+        self.broker.drop_queued_orders(trade.trade_id)
         if len(trade.entry_orders) > 0:
             for entryOrder in trade.entry_orders:
                 if entryOrder.order_status in [OrderStatus.OPEN, OrderStatus.TRIGGER_PENDING]:
                     # Cancel entry order if it is still open (not filled or partially filled case)
-                    self.cancel_orders(trade.entry_orders)
+                    await self.cancel_orders(trade.entry_orders, OrderPriority.SQUARE_OFF)
                     break
 
         if len(trade.sl_orders) > 0:
             try:
-                self.cancel_orders(trade.sl_orders)
+                await self.cancel_orders(trade.sl_orders, OrderPriority.SQUARE_OFF)
             except Exception:
                 # probably the order is being processed.
                 logging.info(
@@ -623,17 +768,17 @@ class BaseStrategy(ABC):
                 if targetOrder.order_status == OrderStatus.OPEN:
                     omp = OrderModifyParams()
                     omp.new_price = round_to_ticksize(self.short_code, trade.trading_symbol, trade.cmp * (0.99 if trade.direction == Direction.LONG else 1.01))
-                    self.modify_order(targetOrder, omp, trade.filled_qty)
+                    await self.modify_order(targetOrder, omp, trade.filled_qty, OrderPriority.SQUARE_OFF)
         elif trade.entry > 0:
             # Place new target order to exit position, adjust target to current market price
             logging.info("TradeManager: placing new target order to exit position for tradeID %s", trade.trade_id)
-            self.place_target_order(trade, isMarketOrder=True, target=(trade.cmp * (0.99 if trade.direction == Direction.LONG else 1.01)))
+            await self.place_target_order(trade, isMarketOrder=True, target=(trade.cmp * (0.99 if trade.direction == Direction.LONG else 1.01)))
 
     def shouldPlaceTrade(self, trade: Trade) -> bool:
         if trade.qty == 0:
             raise DisableTradeException("Invalid Quantity")
 
-        now = datetime.now()
+        now = get_clock().now()
         if now > self.stopTimestamp:
             raise DisableTradeException("NoNewTradesCutOffTimeReached")
 
@@ -647,9 +792,26 @@ class BaseStrategy(ABC):
         if trade != None:
             self.trades.append(trade)
 
+    def get_trade_cmp(self, trade: Trade) -> float:
+        # resolve the price store slot once per trade, later reads are a plain array access
+        if trade.price_handle is None:
+            trade.price_handle = get_price_handle(self.short_code, trade.trading_symbol)
+        if not trade.price_handle.has_tick:
+            raise KeyError(trade.trading_symbol)
+        return trade.price_handle.ltp
+
     def get_quote(self, trading_symbol):
+        quote = self.get_tick_quote(trading_symbol)
+        if quote is not None:
+            return quote
         try:
-            return self.broker.get_quote(trading_symbol, self.short_code, self.isFnO, self.exchange)
+            fetch = functools.partial(self.broker.get_quote, trading_symbol, self.short_code, self.isFnO, self.exchange)
+            if self.quote_cache is not None:
+                quote = self.quote_cache.get(quote_prefix("quote", self.quoteExchange()), trading_symbol, fetch)
+            else:
+                quote = fetch()
+            self.subscribe_quoted([trading_symbol])
+            return quote
         except KeyError as e:
             logging.info("%s::%s: Could not get Quote for %s => %s", self.short_code, self.getName(), trading_symbol, str(e))
         except Exception as exp:
@@ -657,10 +819,124 @@ class BaseStrategy(ABC):
 
         return Quote(trading_symbol)
 
+    def get_quotes(self, trading_symbols: List[str]) -> Dict[str, Quote]:
+        # one round trip for all of them where the broker has a batch quote call, an empty Quote for any not quoted
+        quotes: Dict[str, Quote] = {}
+        for symbol in trading_symbols:
+            quote = self.get_tick_quote(symbol)
+            if quote is not None:
+                quotes[symbol] = quote
+        missing = [symbol for symbol in trading_symbols if symbol not in quotes]
+        if len(missing) > 0:
+            try:
+                if self.quote_cache is not None:
+                    quoted = self.quote_cache.get_many(quote_prefix("quote", self.quoteExchange()), missing, self.fetch_quotes)
+                else:
+                    quoted = self.fetch_quotes(missing)
+                quotes.update(quoted)
+                self.subscribe_quoted(list(quoted))
+            except Exception as exp:
+                logging.info("%s::%s: Could not get Quotes for %s => %s", self.short_code, self.getName(), missing, str(exp))
+
+        return {symbol: quotes.get(symbol, None) or Quote(symbol) for symbol in trading_symbols}
+
+    def fetch_quotes(self, trading_symbols: List[str]) -> Dict[str, Quote]:
+        return self.broker.get_quotes(trading_symbols, self.short_code, self.isFnO, self.exchange)
+
+    def get_index_quote(self, trading_symbol: str, exchange: str = "NSE") -> Optional[Quote]:
+        quote = self.get_tick_quote(trading_symbol)
+        if quote is not None:
+            return quote
+        try:
+            fetch = functools.partial(self.broker.get_index_quote, trading_symbol, self.short_code, exchange)
+            if self.quote_cache is not None:
+                return self.quote_cache.get(quote_prefix("index", exchange), trading_symbol, fetch)
+            return fetch()
+        except Exception as exp:
+            logging.info("%s::%s: Could not get index Quote for %s => %s", self.short_code, self.getName(), trading_symbol, str(exp))
+        return None
+
+    # The same quotes for the algo loop: the broker is asked on an executor thread, so other strategies carry on
+    # meanwhile and the ones asking for the same quote wait for that one call (core.quotes).
+
+    async def get_quote_async(self, trading_symbol: str) -> Quote:
+        quote = self.get_tick_quote(trading_symbol)
+        if quote is not None:
+            return quote
+        try:
+            fetch = functools.partial(self.broker.get_quote, trading_symbol, self.short_code, self.isFnO, self.exchange)
+            if self.quote_cache is not None:
+                quote = await self.quote_cache.get_async(quote_prefix("quote", self.quoteExchange()), trading_symbol, fetch)
+            else:
+                quote = await asyncio.get_running_loop().run_in_executor(None, fetch)
+            self.subscribe_quoted([trading_symbol])
+            return quote
+        except Exception as exp:
+            logging.info("%s::%s: Could not get Quote for %s => %s", self.short_code, self.getName(), trading_symbol, str(exp))
+
+        return Quote(trading_symbol)
+
+    async def get_quotes_async(self, trading_symbols: List[str]) -> Dict[str, Quote]:
+        quotes: Dict[str, Quote] = {}
+        for symbol in trading_symbols:
+            quote = self.get_tick_quote(symbol)
+            if quote is not None:
+                quotes[symbol] = quote
+        missing = [symbol for symbol in trading_symbols if symbol not in quotes]
+        if len(missing) > 0:
+            try:
+                if self.quote_cache is not None:
+                    quoted = await self.quote_cache.get_many_async(quote_prefix("quote", self.quoteExchange()), missing, self.fetch_quotes)
+                else:
+                    quoted = await asyncio.get_running_loop().run_in_executor(None, self.fetch_quotes, missing)
+                quotes.update(quoted)
+                self.subscribe_quoted(list(quoted))
+            except Exception as exp:
+                logging.info("%s::%s: Could not get Quotes for %s => %s", self.short_code, self.getName(), missing, str(exp))
+
+        return {symbol: quotes.get(symbol, None) or Quote(symbol) for symbol in trading_symbols}
+
+    async def get_index_quote_async(self, trading_symbol: str, exchange: str = "NSE") -> Optional[Quote]:
+        quote = self.get_tick_quote(trading_symbol)
+        if quote is not None:
+            return quote
+        try:
+            fetch = functools.partial(self.broker.get_index_quote, trading_symbol, self.short_code, exchange)
+            if self.quote_cache is not None:
+                return await self.quote_cache.get_async(quote_prefix("index", exchange), trading_symbol, fetch)
+            return await asyncio.get_running_loop().run_in_executor(None, fetch)
+        except Exception as exp:
+            logging.info("%s::%s: Could not get index Quote for %s => %s", self.short_code, self.getName(), trading_symbol, str(exp))
+        return None
+
+    def quoteExchange(self) -> str:
+        # the exchange get_quote asks the broker for, quotes are cached per exchange
+        return self.exchange if self.isFnO else self.equityExchange
+
+    def get_tick_quote(self, trading_symbol: str) -> Optional[Quote]:
+        # from the algo's price store when the symbol streams and ticked in the last quoteMaxAge seconds, else None
+        if self.quoteMaxAge <= 0:
+            return None
+        try:
+            handle = get_price_handle(self.short_code, trading_symbol)
+        except KeyError:
+            return None
+        if not handle.has_tick or get_clock().timestamp() - handle.last_update > self.quoteMaxAge:
+            return None
+        return handle.quote()
+
+    def subscribe_quoted(self, trading_symbols: List[str]) -> None:
+        if not self.quoteSubscribe or self.subscribe is None:
+            return
+        new = [symbol for symbol in dict.fromkeys(trading_symbols) if symbol not in self.quoted]
+        if len(new) > 0:
+            self.quoted.update(new)
+            self.subscribe(new)
+
     def getTrailingSL(self, trade: Trade):
         return 0
 
-    def generateTrade(self, optionSymbol, direction, numLots, lastTradedPrice, slPercentage=0.0, slPrice=0.0, targetPrice=0.0, placeMarketOrder=True):
+    def createTrade(self, optionSymbol, direction, numLots, lastTradedPrice, slPercentage=0.0, slPrice=0.0, targetPrice=0.0, placeMarketOrder=True) -> Trade:
         trade = Trade(optionSymbol, self.getName())
         trade.is_options = True
         trade.exchange = self.exchange
@@ -678,11 +954,68 @@ class BaseStrategy(ABC):
         trade.qty = isd["lot_size"] * numLots
 
         trade.intraday_squareoff_timestamp = get_epoch(self.squareOffTimestamp)
+        return trade
 
-        if self.place_entry_order(trade):
+    @order_coroutine
+    async def generateTrade(self, optionSymbol, direction, numLots, lastTradedPrice, slPercentage=0.0, slPrice=0.0, targetPrice=0.0, placeMarketOrder=True):
+        trade = self.createTrade(optionSymbol, direction, numLots, lastTradedPrice, slPercentage, slPrice, targetPrice, placeMarketOrder)
+        if await self.place_entry_order(trade):
             self.trades.append(trade)
 
-    def generateTradeWithSLPrice(self, optionSymbol, direction, numLots, lastTradedPrice, underLying, underLyingStopLossPercentage, placeMarketOrder=True):
+    async def generateBasket(self, trades: List[Trade], hedgeFirst: bool = True) -> bool:
+        # Enters the legs of one position (built with createTrade) together: every leg is checked before any order goes
+        # out, then the entry orders are placed concurrently. With hedgeFirst the long legs are placed before the short
+        # ones, so the margin benefit of the hedge is there when the short legs reach the broker. If a leg can't be placed
+        # the legs already placed are unwound, the basket goes in as a whole or not at all.
+        if len(trades) == 0:
+            return False
+        if len(self.trades) + len(trades) > self.maxTradesPerDay:
+            logging.info("%s: basket of %d legs not placed, max trades per day is %d", self.getName(), len(trades), self.maxTradesPerDay)
+            return False
+        for trade in trades:
+            try:
+                if not self.shouldPlaceTrade(trade):
+                    return False
+            except DisableTradeException as e:
+                logging.info("%s: basket not placed, leg %s can't be traded: %s", self.getName(), trade.trading_symbol, str(e))
+                return False
+
+        basketId = trades[0].trade_id
+        for trade in trades:
+            trade.basket_id = basketId
+        if hedgeFirst:
+            waves = [[trade for trade in trades if trade.direction == Direction.LONG], [trade for trade in trades if trade.direction != Direction.LONG]]
+        else:
+            waves = [trades]
+
+        placed: List[Trade] = []
+        for wave in waves:
+            if len(wave) == 0:
+                continue
+            results = await asyncio.gather(*[self.place_entry_order(trade, checked=True) for trade in wave])
+            placed += [trade for trade, result in zip(wave, results) if result]
+            if not all(results):
+                logging.error("%s: basket %s failed, %d of %d legs placed, unwinding them", self.getName(), basketId, len(placed), len(trades))
+                self.trades += placed
+                await asyncio.gather(*[self.unwindTrade(trade) for trade in placed])
+                return False
+
+        self.trades += trades
+        return True
+
+    async def unwindTrade(self, trade: Trade):
+        # exits a leg whose basket failed: the entry order is cancelled if it is still working, a leg filled before the
+        # cancel got through is squared off by trackAndUpdateAllTrades
+        trade.exit_reason = TradeExitReason.TRADE_FAILED.value
+        for entryOrder in trade.entry_orders:
+            if entryOrder.order_status not in [OrderStatus.COMPLETE, OrderStatus.CANCELLED, OrderStatus.REJECTED]:
+                try:
+                    await self.cancel_order(entryOrder, OrderPriority.SQUARE_OFF)
+                except Exception as e:
+                    logging.info("%s: couldn't cancel entry order %s of %s, exiting it once filled: %s", self.getName(), entryOrder.order_id, trade.trade_id, str(e))
+
+    @order_coroutine
+    async def generateTradeWithSLPrice(self, optionSymbol, direction, numLots, lastTradedPrice, underLying, underLyingStopLossPercentage, placeMarketOrder=True):
         trade = Trade(optionSymbol, self.getName())
         trade.is_options = True
         trade.exchange = self.exchange
@@ -705,172 +1038,71 @@ class BaseStrategy(ABC):
         trade.state = TradeState.ACTIVE
         trade.start_timestamp = get_epoch()
         self.trades.append(trade)
-        self.place_entry_order(trade)
+        await self.place_entry_order(trade)
 
-    def getStrikeWithNearestPremium(self, optionType, nearestPremium, roundToNearestStrike=100):
-        # Get the nearest premium strike price
-        futureSymbol = prepareMonthlyExpiryFuturesSymbol(self.symbol, self.expiryDay)
-        quote = self.get_quote(futureSymbol)
-        if quote == None or quote.last_traded_price == 0:
-            logging.error("%s: Could not get quote for %s", self.getName(), futureSymbol)
-            return
-
-        strikePrice = getNearestStrikePrice(quote.last_traded_price, roundToNearestStrike)
-        premium = -1
-
-        lastPremium = premium
-        lastStrike = strikePrice
-
-        while premium < nearestPremium:  # check if we need to go ITM
-            premium = self.get_quote(prepare_weekly_options_symbol(self.symbol, strikePrice, optionType, expiryDay=self.expiryDay)).last_traded_price
-            if optionType == "CE":
-                strikePrice = strikePrice - roundToNearestStrike
-            else:
-                strikePrice = strikePrice + roundToNearestStrike
-
-        while True:
-            try:
-                symbol = prepare_weekly_options_symbol(self.symbol, strikePrice, optionType, expiryDay=self.expiryDay)
-                try:
-                    get_instrument_data_by_symbol(self.short_code, symbol)
-                except KeyError:
-                    logging.info("%s: Could not get instrument for %s", self.getName(), symbol)
-                    return lastStrike, lastPremium
-
-                quote = self.get_quote(symbol)
-
-                if quote.total_sell_quantity == 0 and quote.total_buy_quantity == 0:
-                    time.sleep(1)
-                    quote = self.get_quote(symbol)  # lets try one more time.
-
-                premium = quote.last_traded_price
+    def getOptionChain(self, roundToNearestStrike=100) -> Optional[OptionChain]:
+        # the live chain of this strategy's underlying and expiry, started on first use
+        if self.chains is None:
+            return None
+        try:
+            return self.chains.get(self.symbol, self.expiryDay, roundToNearestStrike, self.strikeBand)
+        except KeyError as e:
+            logging.info("%s: Could not start the option chain of %s => %s", self.getName(), self.symbol, str(e))
+            return None
 
-                if premium > nearestPremium:
-                    lastPremium = premium
-                else:
-                    # quote.lastTradedPrice < quote.upperCircuitLimit and quote.lastTradedPrice > quote.lowerCiruitLimit and \
-                    if (
-                        (lastPremium - nearestPremium) > (nearestPremium - premium)
-                        and quote.volume > 0
-                        and quote.total_sell_quantity > 0
-                        and quote.total_buy_quantity > 0
-                    ):
-                        return strikePrice, premium
-                    else:
-                        logging.info(
-                            "%s: Returning previous strike for %s as vol = %s sell = %s buy = %s",
-                            self.getName(),
-                            symbol,
-                            quote.volume,
-                            quote.total_sell_quantity,
-                            quote.total_buy_quantity,
-                        )
-                        return lastStrike, lastPremium
-
-                lastStrike = strikePrice
-                lastPremium = premium
-
-                if optionType == "CE":
-                    strikePrice = strikePrice + roundToNearestStrike
-                else:
-                    strikePrice = strikePrice - roundToNearestStrike
-                time.sleep(1)
-            except KeyError:
-                return lastStrike, lastPremium
+    async def getStrikeChain(self, optionType, roundToNearestStrike=100) -> Optional[StrikeChain]:
+        # from the live option chain once all its strikes ticked, else strikeBand strikes either side of the future's
+        # ATM strike, those listed, quoted in one batch. Strikes without a premium are left out (StrikeChain.priced)
+        optionChain = self.getOptionChain(roundToNearestStrike)
+        if optionChain is not None and optionChain.ready:
+            strikeChain = optionChain.strike_chain(optionType)
+            if strikeChain is not None:
+                return strikeChain
 
-    def getStrikeWithMinimumPremium(self, optionType, minimumPremium, roundToNearestStrike=100):
-        # Get the nearest premium strike price
         futureSymbol = prepareMonthlyExpiryFuturesSymbol(self.symbol, self.expiryDay)
-        quote = self.get_quote(futureSymbol)
+        quote = await self.get_quote_async(futureSymbol)
         if quote == None or quote.last_traded_price == 0:
             logging.error("%s: Could not get quote for %s", self.getName(), futureSymbol)
-            return
-
-        strikePrice = getNearestStrikePrice(quote.last_traded_price, roundToNearestStrike)
-        premium = -1
-
-        lastPremium = premium
-        lastStrike = strikePrice
-
-        while premium < minimumPremium:  # check if we need to go ITM
-            premium = self.get_quote(prepare_weekly_options_symbol(self.symbol, strikePrice, optionType, expiryDay=self.expiryDay)).last_traded_price
-            if optionType == "CE":
-                strikePrice = strikePrice - roundToNearestStrike
-            else:
-                strikePrice = strikePrice + roundToNearestStrike
+            return None
 
-        while True:
+        atmStrike = getNearestStrikePrice(quote.last_traded_price, roundToNearestStrike)
+        offsets = range(-self.strikeBand, self.strikeBand + 1) if optionType == "CE" else range(self.strikeBand, -self.strikeBand - 1, -1)
+        strikeToSymbol = {}
+        for offset in offsets:
+            strikePrice = atmStrike + offset * roundToNearestStrike
+            symbol = prepare_weekly_options_symbol(self.symbol, strikePrice, optionType, expiryDay=self.expiryDay)
             try:
-                symbol = prepare_weekly_options_symbol(self.symbol, strikePrice, optionType, expiryDay=self.expiryDay)
                 get_instrument_data_by_symbol(self.short_code, symbol)
-                quote = self.get_quote(symbol)
-
-                if quote.total_sell_quantity == 0 and quote.total_buy_quantity == 0:
-                    time.sleep(1)
-                    quote = self.get_quote(symbol)  # lets try one more time.
-
-                premium = quote.last_traded_price
-
-                if premium < minimumPremium:
-                    return lastStrike, lastPremium
-
-                lastStrike = strikePrice
-                lastPremium = premium
-
-                if optionType == "CE":
-                    strikePrice = strikePrice + roundToNearestStrike
-                else:
-                    strikePrice = strikePrice - roundToNearestStrike
-                time.sleep(1)
             except KeyError:
-                return lastStrike, lastPremium
-
-    def getStrikeWithMaximumPremium(self, optionType, maximumPremium, roundToNearestStrike=100):
-        # Get the nearest premium strike price
-        futureSymbol = prepareMonthlyExpiryFuturesSymbol(self.symbol, self.expiryDay)
-        quote = self.get_quote(futureSymbol)
-        if quote == None or quote.last_traded_price == 0:
-            logging.error("%s: Could not get quote for %s", self.getName(), futureSymbol)
-            return
-
-        strikePrice = getNearestStrikePrice(quote.last_traded_price, roundToNearestStrike)
-        premium = -1
-
-        lastPremium = premium
-        lastStrike = strikePrice
-
-        while premium < maximumPremium:  # check if we need to go ITM
-            premium = self.get_quote(prepare_weekly_options_symbol(self.symbol, strikePrice, optionType, expiryDay=self.expiryDay)).last_traded_price
-            if optionType == "CE":
-                strikePrice = strikePrice - roundToNearestStrike
-            else:
-                strikePrice = strikePrice + roundToNearestStrike
-
-        while True:
-            try:
-                symbol = prepare_weekly_options_symbol(self.symbol, strikePrice, optionType, expiryDay=self.expiryDay)
-                get_instrument_data_by_symbol(self.short_code, symbol)
-                quote = self.get_quote(symbol)
-
-                if quote.total_sell_quantity == 0 and quote.total_buy_quantity == 0:
-                    time.sleep(1)
-                    quote = self.get_quote(symbol)  # lets try one more time.
+                continue
+            strikeToSymbol[strikePrice] = symbol
+        if atmStrike not in strikeToSymbol:
+            logging.error("%s: Could not get instrument for ATM strike %s %s", self.getName(), atmStrike, optionType)
+            return None
 
-                premium = quote.last_traded_price
+        quotes = await self.get_quotes_async(list(strikeToSymbol.values()))
+        strikeChain = StrikeChain.from_quotes(atmStrike, list(strikeToSymbol), [quotes[symbol] for symbol in strikeToSymbol.values()])
+        if strikeChain is None:
+            logging.error("%s: Could not get premium of ATM strike %s %s", self.getName(), atmStrike, optionType)
+        return strikeChain
 
-                if premium < maximumPremium:
-                    return strikePrice, premium
+    async def getStrikeWithNearestPremium(self, optionType, nearestPremium, roundToNearestStrike=100):
+        chain = await self.getStrikeChain(optionType, roundToNearestStrike)
+        if chain is None:
+            return None
+        return chain.pick(chain.nearest(nearestPremium))
 
-                lastStrike = strikePrice
-                lastPremium = premium
+    async def getStrikeWithMinimumPremium(self, optionType, minimumPremium, roundToNearestStrike=100):
+        chain = await self.getStrikeChain(optionType, roundToNearestStrike)
+        if chain is None:
+            return None
+        return chain.pick(chain.minimum(minimumPremium))
 
-                if optionType == "CE":
-                    strikePrice = strikePrice + roundToNearestStrike
-                else:
-                    strikePrice = strikePrice - roundToNearestStrike
-                time.sleep(1)
-            except KeyError:
-                return lastStrike, lastPremium
+    async def getStrikeWithMaximumPremium(self, optionType, maximumPremium, roundToNearestStrike=100):
+        chain = await self.getStrikeChain(optionType, roundToNearestStrike)
+        if chain is None:
+            return None
+        return chain.pick(chain.maximum(maximumPremium))
 
     def getVIXAdjustment(self):
         return math.pow(get_cmp(self.short_code, "INDIA VIX") / 16, 0.5)
@@ -896,7 +1128,7 @@ class BaseStrategy(ABC):
         noOfDaysBeforeExpiry = find_days_before_weekly_expiry(symbol, expiryDay)
         if strategyLots[-noOfDaysBeforeExpiry] > 0:
             return strategyLots[-noOfDaysBeforeExpiry]
-        dayOfWeek = datetime.datetime.now().weekday() + 1  # adding + 1 to set monday index as 1
+        dayOfWeek = get_clock().now().weekday() + 1  # adding + 1 to set monday index as 1
         # this will handle the run condition during thread start by defaulting to -1, and thus wait in get Lots
         if dayOfWeek >= 1 and dayOfWeek <= 5:
             return strategyLots[dayOfWeek]
@@ -929,6 +1161,23 @@ class StartTimedBaseStrategy(BaseStrategy):
         self.multiple = multiple
         self.exchange = "NFO"
         self.equityExchange = "NSE"
+        self.events = None
+        self.loop = None
+        self.subscribe = None
+        self.chains = None
+        self.quote_cache = None
+        self.quoteMaxAge = 5.0
+        self.quoteSubscribe = True
+        self.quoted = set()
+        self.strikeBand = 20
+        self.heartbeatSeconds = 30
+        self.wakeup = asyncio.Event()
+        self.wake_reasons = set()
+        self.pending_wake_reasons = set()
+        self.woken_trades = {}
+        self.pending_woken_trades = {}
+        self.trade_triggers = {}
+        self.mtm_triggers = ((), [])
 
     def getName(self):
         return super().getName() + "_" + str(self.startTimestamp.time())
@@ -962,7 +1211,7 @@ class ManualStrategy(BaseStrategy):
         self.maxTradesPerDay = 10
 
     async def process(self):
-        now = datetime.now()
+        now = get_clock().now()
         if now < self.startTimestamp or not self.isEnabled():
             return
 
@@ -1008,7 +1257,7 @@ class TestStrategy(BaseStrategy):
                 self.peTrades.append(trade)
 
     async def process(self):
-        now = datetime.now()
+        now = get_clock().now()
         if now < self.startTimestamp or not self.isEnabled():
             return
 
@@ -1020,7 +1269,7 @@ class TestStrategy(BaseStrategy):
             return
         indexSymbol = "NIFTY 50"
         # Get current market price of Nifty Future
-        quote = self.broker.get_index_quote(indexSymbol, self.short_code)
+        quote = await self.get_index_quote_async(indexSymbol)
         if quote == None:
             logging.error("%s: Could not get quote for %s", self.getName(), indexSymbol)
             return
@@ -1028,21 +1277,22 @@ class TestStrategy(BaseStrategy):
         ATMStrike = getNearestStrikePrice(quote.last_traded_price, 50)
 
         ATMCESymbol = prepare_weekly_options_symbol(self.symbol, ATMStrike, "CE", expiryDay=self.expiryDay)
-        ATMCEQuote = self.get_quote(ATMCESymbol).last_traded_price
-
         ATMPESymbol = prepare_weekly_options_symbol(self.symbol, ATMStrike, "PE", expiryDay=self.expiryDay)
-        ATMPEQuote = self.get_quote(ATMPESymbol).last_traded_price
 
         OTMPEStrike = getNearestStrikePrice(quote.last_traded_price - 500, 50)
         OTMPESymbol = prepare_weekly_options_symbol(self.symbol, OTMPEStrike, "PE", expiryDay=self.expiryDay)
-        OTMPEQuote = self.get_quote(OTMPESymbol).last_traded_price
 
         OTMCEStrike = getNearestStrikePrice(quote.last_traded_price + 500, 50)
         OTMCESymbol = prepare_weekly_options_symbol(self.symbol, OTMCEStrike, "CE", expiryDay=self.expiryDay)
-        OTMCEQuote = self.get_quote(OTMCESymbol).last_traded_price
+
+        quotes = await self.get_quotes_async([ATMCESymbol, ATMPESymbol, OTMPESymbol, OTMCESymbol])
+        ATMCEQuote = quotes[ATMCESymbol].last_traded_price
+        ATMPEQuote = quotes[ATMPESymbol].last_traded_price
+        OTMPEQuote = quotes[OTMPESymbol].last_traded_price
+        OTMCEQuote = quotes[OTMCESymbol].last_traded_price
 
         # self.generateTrade(OTMPESymbol, Direction.SHORT, self.getLots(), OTMPEQuote * 1.2, 5)
-        self.generateTrade(OTMCESymbol, Direction.SHORT, self.getLots(), OTMCEQuote * 1.2, 5)
+        await self.generateTrade(OTMCESymbol, Direction.SHORT, self.getLots(), OTMCEQuote * 1.2, 5)
 
     def shouldPlaceTrade(self, trade: Trade):
         if not super().shouldPlaceTrade(trade):
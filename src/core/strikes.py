@@ -0,0 +1,87 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from core import Quote
+
+
+class StrikeChain:
+    # One option type of one expiry around the ATM strike, as arrays ordered from the deepest ITM strike to the
+    # furthest OTM one (ascending strikes for CE, descending for PE), so premiums fall along the arrays.
+    # The searches follow the old strike by strike walk: from ATM towards ITM to the first strike priced at or above
+    # the premium asked for, one strike past it, and from there towards OTM.
+
+    def __init__(
+        self, atm: int, strikes: List[int], premiums: np.ndarray, volumes: np.ndarray, buy_quantities: np.ndarray, sell_quantities: np.ndarray
+    ) -> None:
+        self.strikes = strikes
+        self.atm_index = strikes.index(atm)
+        self.premiums = premiums
+        self.volumes = volumes
+        self.buy_quantities = buy_quantities
+        self.sell_quantities = sell_quantities
+
+    @staticmethod
+    def priced(
+        atm: int, strikes: List[int], premiums: np.ndarray, volumes: np.ndarray, buy_quantities: np.ndarray, sell_quantities: np.ndarray
+    ) -> Optional["StrikeChain"]:
+        # strikes without a premium (not quoted or not traded yet, 0 or NaN) would break the premiums falling along the
+        # arrays the searches rely on, they are left out. None if the ATM strike is one of them.
+        keep = np.flatnonzero(premiums > 0)
+        kept = [strikes[i] for i in keep]
+        if atm not in kept:
+            return None
+        return StrikeChain(atm, kept, premiums[keep], volumes[keep], buy_quantities[keep], sell_quantities[keep])
+
+    @staticmethod
+    def from_quotes(atm: int, strikes: List[int], quotes: List[Quote]) -> Optional["StrikeChain"]:
+        return StrikeChain.priced(
+            atm,
+            strikes,
+            np.array([quote.last_traded_price for quote in quotes], dtype=np.float64),
+            np.array([quote.volume for quote in quotes], dtype=np.int64),
+            np.array([quote.total_buy_quantity for quote in quotes], dtype=np.int64),
+            np.array([quote.total_sell_quantity for quote in quotes], dtype=np.int64),
+        )
+
+    @property
+    def liquid(self) -> np.ndarray:
+        return (self.volumes > 0) & (self.buy_quantities > 0) & (self.sell_quantities > 0)
+
+    def start(self, premium: float) -> int:
+        itm = np.flatnonzero(self.premiums[: self.atm_index + 1][::-1] >= premium)
+        return max(self.atm_index - int(itm[0]) - 1, 0) if len(itm) > 0 else 0
+
+    def nearest(self, premium: float) -> int:
+        # the strike priced closest to premium, of the two around it, the cheaper one only if it is liquid
+        start = self.start(premium)
+        below = np.flatnonzero(self.premiums[start:] <= premium)
+        if len(below) == 0:
+            return len(self.strikes) - 1
+        i = start + int(below[0])
+        if i == start:
+            return i
+        if self.premiums[i - 1] - premium > premium - self.premiums[i] and self.liquid[i]:
+            return i
+        return i - 1
+
+    def minimum(self, premium: float) -> int:
+        # the furthest OTM strike priced at premium or more, -1 if none is
+        start = self.start(premium)
+        below = np.flatnonzero(self.premiums[start:] < premium)
+        if len(below) == 0:
+            return len(self.strikes) - 1
+        return start + int(below[0]) - 1
+
+    def maximum(self, premium: float) -> int:
+        # the first strike towards OTM priced below premium, the furthest OTM one if none is
+        start = self.start(premium)
+        below = np.flatnonzero(self.premiums[start:] < premium)
+        if len(below) == 0:
+            return len(self.strikes) - 1
+        return start + int(below[0])
+
+    def pick(self, i: int) -> Optional[Tuple[int, float]]:
+        if i < 0:
+            return None
+        return self.strikes[i], float(self.premiums[i])
@@ -0,0 +1,38 @@
+from typing import Callable, Dict, Iterable, List
+
+
+class Subscriptions:
+    # One refcount per symbol across everything in an algo which needs the symbol's ticks: the indices, the day's trades,
+    # the quote auto-subscribes of strategies (BaseStrategy.subscribe_quoted) and the bands of option chains
+    # (core.chain.OptionChains). A symbol is registered with the ticker by its first holder and unregistered once its
+    # last holder released it, every hold of a symbol needs a release of its own.
+
+    def __init__(self, register: Callable[[List[str]], None], unregister: Callable[[List[str]], None]) -> None:
+        self.register = register
+        self.unregister = unregister
+        self.holders: Dict[str, int] = {}  # symbol => holds
+
+    def hold(self, symbols: Iterable[str]) -> None:
+        new = []
+        for symbol in symbols:
+            holds = self.holders.get(symbol, 0)
+            self.holders[symbol] = holds + 1
+            if holds == 0:
+                new.append(symbol)
+        if len(new) > 0:
+            self.register(new)
+
+    def release(self, symbols: Iterable[str]) -> None:
+        gone = []
+        for symbol in symbols:
+            holds = self.holders.get(symbol, 0)
+            if holds > 1:
+                self.holders[symbol] = holds - 1
+            elif holds == 1:
+                del self.holders[symbol]
+                gone.append(symbol)
+        if len(gone) > 0:
+            self.unregister(gone)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.holders
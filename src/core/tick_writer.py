@@ -0,0 +1,143 @@
+import logging
+import socket
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional, Sequence, Tuple
+
+from models import TickData
+
+# ts, trading_symbol, ltp, qty, avgPrice, volume, totalBuyQuantity, totalSellQuantity, open, high, low, close, change
+TickRow = Tuple[int, str, float, int, float, int, int, int, float, float, float, float, float]
+
+
+class TickWriter(threading.Thread):
+    # Persists ticks into QuestDB's {short_code}_tickData table over the InfluxDB line protocol (ILP, tcp port 9009).
+    # The ticker thread only appends rows to a bounded deque, which silently drops the oldest rows when full;
+    # this thread drains the deque in large batches, so a slow or absent QuestDB never holds up ticks or the algo loop.
+
+    def __init__(
+        self,
+        short_code: str,
+        host: str = "127.0.0.1",
+        port: int = 9009,
+        max_rows: int = 500_000,
+        batch_rows: int = 10_000,
+        flush_interval: float = 1.0,
+    ) -> None:
+        super(TickWriter, self).__init__(name=short_code + "_tickWriter", daemon=True)
+        self.table = short_code + "_tickData"
+        self.host = host
+        self.port = port
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.rows: Deque[TickRow] = deque(maxlen=max_rows)
+        self.sock: Optional[socket.socket] = None
+        self.stopped = threading.Event()
+        self.rows_received = 0
+        self.rows_written = 0
+        self.reconnect_at = 0.0
+
+    def on_ticks(self, ticks: Sequence[TickData]) -> None:
+        # batch listener on the ticker thread, tickers reuse TickData so only plain values are kept
+        now_ns = time.time_ns()
+        append = self.rows.append
+        for tick in ticks:
+            append(
+                (
+                    int(tick.exchange_timestamp.timestamp() * 1_000_000_000) if tick.exchange_timestamp else now_ns,
+                    tick.trading_symbol,
+                    tick.lastTradedPrice,
+                    tick.lastTradedQuantity,
+                    tick.avgTradedPrice,
+                    tick.volume,
+                    tick.totalBuyQuantity,
+                    tick.totalSellQuantity,
+                    tick.open,
+                    tick.high,
+                    tick.low,
+                    tick.close,
+                    tick.change,
+                )
+            )
+        self.rows_received += len(ticks)
+
+    @property
+    def rows_dropped(self) -> int:
+        return self.rows_received - self.rows_written - len(self.rows)
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            self.stopped.wait(self.flush_interval)
+            while len(self.rows) > 0:
+                batch = self._take(self.batch_rows)
+                if not self._send(batch):
+                    break  # QuestDB is away, the batch is dropped and the deque keeps only the newest rows meanwhile
+                if len(batch) < self.batch_rows:
+                    break
+        self._close()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def _take(self, count: int) -> List[TickRow]:
+        popleft = self.rows.popleft
+        batch = []
+        try:
+            for _ in range(count):
+                batch.append(popleft())
+        except IndexError:
+            pass
+        return batch
+
+    def _send(self, batch: List[TickRow]) -> bool:
+        if self.sock is None:
+            if time.time() < self.reconnect_at:
+                return False
+            try:
+                self.sock = socket.create_connection((self.host, self.port), timeout=5)
+                logging.info("TickWriter: connected to QuestDB ILP at %s:%d", self.host, self.port)
+            except OSError as e:
+                logging.warning("TickWriter: Can't connect to QuestDB ILP at %s:%d, dropping %d ticks. Error => %s", self.host, self.port, len(batch), str(e))
+                self.reconnect_at = time.time() + 10
+                return False
+        try:
+            self.sock.sendall(self._to_lines(batch))
+            self.rows_written += len(batch)
+            return True
+        except OSError as e:
+            logging.warning("TickWriter: Failed to write %d ticks to QuestDB. Error => %s", len(batch), str(e))
+            self._close()
+            return False
+
+    def _to_lines(self, batch: List[TickRow]) -> bytes:
+        table = self.table
+        lines = [
+            '%s trading_symbol="%s",ltp=%r,qty=%di,avgPrice=%r,volume=%di,totalBuyQuantity=%di,totalSellQuantity=%di,open=%r,high=%r,low=%r,close=%r,change=%r %d\n'
+            % (
+                table,
+                symbol.replace("\\", "\\\\").replace('"', '\\"'),
+                float(ltp),
+                qty,
+                float(avg_price),
+                volume,
+                total_buy_quantity,
+                total_sell_quantity,
+                float(open),
+                float(high),
+                float(low),
+                float(close),
+                float(change),
+                ts,
+            )
+            for (ts, symbol, ltp, qty, avg_price, volume, total_buy_quantity, total_sell_quantity, open, high, low, close, change) in batch
+        ]
+        return "".join(lines).encode("utf-8")
+
+    def _close(self) -> None:
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
@@ -0,0 +1,96 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional
+
+
+class Trigger:
+    __slots__ = ("key", "level", "rising", "owner", "reason", "trade", "active")
+
+    def __init__(self, key: str, level: float, rising: bool, owner: Any, reason: str, trade: Any = None) -> None:
+        self.key = key
+        self.level = level
+        self.rising = rising  # fires when the value goes to or above level, else when it goes to or below
+        self.owner = owner
+        self.reason = reason
+        self.trade = trade
+        self.active = True
+
+
+class TriggerLevels:
+    # sorted levels of one key, kept as parallel lists so bisect works on plain floats
+    __slots__ = ("rising_levels", "rising", "falling_levels", "falling")
+
+    def __init__(self) -> None:
+        self.rising_levels: List[float] = []
+        self.rising: List[Trigger] = []
+        self.falling_levels: List[float] = []
+        self.falling: List[Trigger] = []
+
+
+class TriggerIndex:
+    # Per key (trading symbol, "mtm:<strategy>", "clock") sorted index of the levels someone waits for.
+    # An update only looks at the levels it crossed, so its cost is O(log n + crossings) whatever the number of open levels.
+    # Triggers are one shot; removing one only flags it, it is dropped when its level is crossed or on compact().
+
+    def __init__(self) -> None:
+        self.levels: Dict[str, TriggerLevels] = {}
+        self.active_count = 0
+
+    def add(self, key: str, level: float, rising: bool, owner: Any, reason: str, trade: Any = None) -> Trigger:
+        trigger = Trigger(key, level, rising, owner, reason, trade)
+        levels = self.levels.get(key, None)
+        if levels is None:
+            levels = TriggerLevels()
+            self.levels[key] = levels
+        if rising:
+            i = bisect_right(levels.rising_levels, level)
+            levels.rising_levels.insert(i, level)
+            levels.rising.insert(i, trigger)
+        else:
+            i = bisect_right(levels.falling_levels, level)
+            levels.falling_levels.insert(i, level)
+            levels.falling.insert(i, trigger)
+        self.active_count += 1
+        return trigger
+
+    def add_cross(self, key: str, level: float, current: Optional[float], owner: Any, reason: str, trade: Any = None) -> Trigger:
+        # fires when the value moves to the other side of level than current, rising if current is not known yet
+        return self.add(key, level, current is None or current < level, owner, reason, trade)
+
+    def remove(self, trigger: Optional[Trigger]) -> None:
+        if trigger is not None and trigger.active:
+            trigger.active = False
+            self.active_count -= 1
+
+    def update(self, key: str, value: float) -> List[Trigger]:
+        levels = self.levels.get(key, None)
+        if levels is None:
+            return []
+        fired: List[Trigger] = []
+        if levels.rising_levels and levels.rising_levels[0] <= value:
+            i = bisect_right(levels.rising_levels, value)
+            fired.extend(levels.rising[:i])
+            del levels.rising_levels[:i]
+            del levels.rising[:i]
+        if levels.falling_levels and levels.falling_levels[-1] >= value:
+            i = bisect_left(levels.falling_levels, value)
+            fired.extend(levels.falling[i:])
+            del levels.falling_levels[i:]
+            del levels.falling[i:]
+        if not fired:
+            return fired
+        fired = [trigger for trigger in fired if trigger.active]
+        for trigger in fired:
+            trigger.active = False
+        self.active_count -= len(fired)
+        return fired
+
+    def compact(self) -> None:
+        # drop removed triggers that were never crossed
+        for key in list(self.levels.keys()):
+            levels = self.levels[key]
+            levels.rising = [trigger for trigger in levels.rising if trigger.active]
+            levels.rising_levels = [trigger.level for trigger in levels.rising]
+            levels.falling = [trigger for trigger in levels.falling if trigger.active]
+            levels.falling_levels = [trigger.level for trigger in levels.falling]
+            if not levels.rising and not levels.falling:
+                del self.levels[key]
@@ -8,3 +8,9 @@ class DeRegisterStrategyException(Exception):
     def __init__(self, message: str):
         """Initialize the exception."""
         super(Exception, self).__init__(message)
+
+
+class StaleOrderRequestException(Exception):
+    def __init__(self, message: str):
+        """Initialize the exception."""
+        super(Exception, self).__init__(message)
@@ -6,16 +6,25 @@ from typing import Dict
 
 from broker.base import Broker
 from config import get_server_config
+from core.prices import PriceHandle, PriceStore
 from utils import get_epoch
 
 instruments_data: Dict[str, Dict] = {}
 symbol_to_instrument: Dict[str, Dict[str, str]] = {}
 token_to_instrument: Dict[str, Dict[str, str]] = {}
-symbol_to_CMP: Dict[str, Dict[str, float]] = {}
+price_stores: Dict[str, PriceStore] = {}
 
 
 def get_cmp(short_code, trading_symbol) -> float:
-    return symbol_to_CMP[short_code][trading_symbol]
+    return price_stores[short_code].get_ltp(trading_symbol)
+
+
+def get_price_handle(short_code, trading_symbol) -> PriceHandle:
+    return price_stores[short_code].handle(trading_symbol)
+
+
+def get_price_slot_by_token(short_code, instrument_token) -> int:
+    return price_stores[short_code].slot_of_token(instrument_token)
 
 
 def get_timestamps(short_code):
@@ -97,7 +106,6 @@ def fetch_instruments_from_server(short_code, broker: Broker):
 
 
 def fetch_instruments(short_code, broker: Broker):
-    symbol_to_CMP[short_code] = {}
     if short_code in instruments_data:
         return instruments_data[short_code]
 
@@ -113,9 +121,19 @@ def fetch_instruments(short_code, broker: Broker):
         logging.error("Could not fetch/load instruments data. Hence exiting the app.")
         return instruments_list
 
+    broker.instruments_list = instruments_list
+    register_instruments(short_code, instruments_list)
+
+    logging.info("Fetching instruments done. Instruments count = %d", len(instruments_list))
+    return instruments_list
+
+
+def register_instruments(short_code, instruments_list):
     symbol_to_instrument[short_code] = {}
     token_to_instrument[short_code] = {}
-    broker.instruments_list = instruments_list
+    # every instrument gets a dense slot in the price store, ticks are written there instead of a dict
+    price_store = PriceStore(len(instruments_list))
+    price_stores[short_code] = price_store
 
     try:
         for isd in instruments_list:
@@ -124,12 +142,11 @@ def fetch_instruments(short_code, broker: Broker):
             # logging.info('%s = %d', trading_symbol, instrumentToken)
             symbol_to_instrument[short_code][trading_symbol] = isd
             token_to_instrument[short_code][instrument_token] = isd
+            price_store.add_instrument(trading_symbol, instrument_token)
     except Exception as e:
         logging.exception("Exception while fetching instruments from server: %s", str(e))
 
-    logging.info("Fetching instruments done. Instruments count = %d", len(instruments_list))
     instruments_data[short_code] = instruments_list  # assign the list to static variable
-    return instruments_list
 
 
 def get_instrument_data_by_symbol(short_code, trading_symbol):
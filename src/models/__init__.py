@@ -1,13 +1,34 @@
-from dataclasses import dataclass
 from enum import Enum
+from typing import List, Sequence
+
+import numpy as np
 
 from models.user import UserDetails
 
 
-@dataclass
 class TickData:
-    def __init__(self, trading_symbol):
+    # slotted, tickers keep one instance per instrument and overwrite it on every tick instead of allocating
+    __slots__ = (
+        "trading_symbol",
+        "slot",
+        "lastTradedPrice",
+        "lastTradedQuantity",
+        "avgTradedPrice",
+        "volume",
+        "totalBuyQuantity",
+        "totalSellQuantity",
+        "open",
+        "high",
+        "low",
+        "close",
+        "change",
+        "oi",
+        "exchange_timestamp",
+    )
+
+    def __init__(self, trading_symbol, slot=-1):
         self.trading_symbol = trading_symbol
+        self.slot = slot  # price store slot of the instrument, -1 if not resolved
         self.lastTradedPrice = 0
         self.lastTradedQuantity = 0
         self.avgTradedPrice = 0
@@ -19,8 +40,33 @@ class TickData:
         self.low = 0
         self.close = 0
         self.change = 0
+        self.oi = 0
         self.exchange_timestamp = None
 
+    def copy(self) -> "TickData":
+        tick = TickData.__new__(TickData)
+        for attr in TickData.__slots__:
+            setattr(tick, attr, getattr(self, attr))
+        return tick
+
+
+class TickColumns:
+    # columnar view of one batch of ticks, for listeners that work on whole arrays instead of tick objects
+    def __init__(self, ticks: Sequence[TickData]) -> None:
+        count = len(ticks)
+        self.trading_symbols: List[str] = [tick.trading_symbol for tick in ticks]
+        self.slots = np.fromiter((tick.slot for tick in ticks), dtype=np.int64, count=count)
+        self.ltp = np.fromiter((tick.lastTradedPrice for tick in ticks), dtype=np.float64, count=count)
+        self.volume = np.fromiter((tick.volume for tick in ticks), dtype=np.int64, count=count)
+        self.open = np.fromiter((tick.open for tick in ticks), dtype=np.float64, count=count)
+        self.high = np.fromiter((tick.high for tick in ticks), dtype=np.float64, count=count)
+        self.low = np.fromiter((tick.low for tick in ticks), dtype=np.float64, count=count)
+        self.close = np.fromiter((tick.close for tick in ticks), dtype=np.float64, count=count)
+        self.change = np.fromiter((tick.change for tick in ticks), dtype=np.float64, count=count)
+
+    def __len__(self) -> int:
+        return len(self.trading_symbols)
+
 
 class Direction(Enum):
     LONG = "LONG"
@@ -44,6 +90,13 @@ class OrderStatus(Enum):
     CANCELLED = "CANCELLED"
 
 
+class OrderPriority(Enum):
+    # order dispatch classes, lower goes out first when the order budget is short
+    SQUARE_OFF = 0  # kill switch, square off and every other exit at market
+    PROTECT = 1  # SL / target placement and modifications, cancels
+    ENTRY = 2  # new exposure: entries and chasing their price
+
+
 class OrderType(Enum):
     LIMIT = "LIMIT"
     MARKET = "MARKET"
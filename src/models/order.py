@@ -1,4 +1,14 @@
-from models import Direction, OrderType, ProductType, Segment
+from typing import Dict, List, Optional, Set
+
+from models import Direction, OrderStatus, OrderType, ProductType, Segment
+
+TERMINAL_STATUSES = [OrderStatus.COMPLETE, OrderStatus.CANCELLED, OrderStatus.REJECTED]
+# Order state machine: the statuses an order may move to from each status. Until it is finished (None while the broker
+# hasn't reported it yet) anything goes, brokers pass through pending statuses in their own ways. A finished order
+# stays as it is, an update saying otherwise is older than the one which finished it.
+ORDER_TRANSITIONS: Dict[Optional[OrderStatus], Set[Optional[OrderStatus]]] = {
+    status: ({status} if status in TERMINAL_STATUSES else {None, *OrderStatus}) for status in [None, *OrderStatus]
+}
 
 
 class OrderInputParams:
@@ -15,6 +25,7 @@ class OrderInputParams:
         self.price: float = 0.0
         self.trigger_price: float = 0.0  # Applicable in case of SL order
         self.tag: str = ""
+        self.decision_time: float = 0.0  # clock time the strategy decided on the order, see core.latency
 
     def __str__(self):
         return (
@@ -79,6 +90,8 @@ class Order:
         self.trigger_price = oip.trigger_price if oip != None else 0  # Applicable in case of SL orders
         self.qty = oip.qty if oip != None else 0
         self.tag = oip.tag if oip != None else ""
+        self.direction = oip.direction if oip != None else None  # None for orders saved before it was kept
+        self.is_fno = oip.is_fno if oip != None else False
         self.order_id = ""  # The order id received from broker after placing the order
         self.order_status = None  # One of the status defined in ordermgmt.OrderStatus
         self.average_price = 0.0  # Average price at which the order is filled
@@ -88,6 +101,21 @@ class Order:
         self.update_timestamp = 0  # Applicable if you modify the order Ex: Trailing SL
         self.message = None  # In case any order rejection or any other error save the response from broker in this field
         self.parent_order_id = ""
+        self.exchange_timestamp = 0  # epoch of the latest exchange update applied, older updates arriving late are dropped
+        self.child_orders: List["Order"] = []  # slices of an order above the freeze limit, see broker.slicing
+        self.modify_count = 0  # modifications sent, brokers limit them per order, see broker.modify
+        self.aggregate = None  # models.trade.OrderAggregate of the trade orders the order is one of, not saved
+
+    def can_move_to(self, status: Optional[OrderStatus]) -> bool:
+        return status in ORDER_TRANSITIONS[self.order_status]
+
+    def apply_update(self, status: Optional[OrderStatus], filled_qty: int, average_price: float) -> None:
+        # the one place status and fills of an order change once it is placed, keeps the trade's aggregate in step
+        if self.aggregate is not None:
+            self.aggregate.move(self, status, filled_qty, average_price)
+        self.order_status = status
+        self.filled_qty = filled_qty
+        self.average_price = average_price
 
     def __str__(self):
         return (
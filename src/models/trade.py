@@ -1,10 +1,57 @@
 import logging
 import uuid
-from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
-from models import Direction, ProductType, TradeState
-from models.order import Order
+from core.clock import get_clock
+from core.prices import PriceHandle
+from models import Direction, OrderStatus, ProductType, TradeState
+from models.order import TERMINAL_STATUSES, Order
+
+
+class OrderAggregate:
+    # status counts and fills of one kind of a trade's orders (entry, SL or target). Order.apply_update moves them along
+    # with every order update, so tracking a trade doesn't go over its orders each cycle. Not saved, rebuilt on load.
+
+    def __init__(self) -> None:
+        self.orders = 0
+        self.counts: Dict[Optional[OrderStatus], int] = {}
+        self.filled_qty = 0
+        self.filled_value = 0.0
+
+    def add(self, order: Order) -> None:
+        self.orders += 1
+        self._count(order.order_status, order.filled_qty, order.average_price, 1)
+        order.aggregate = self
+
+    def move(self, order: Order, status: Optional[OrderStatus], filled_qty: int, average_price: float) -> None:
+        # order goes from its current status and fills to these
+        self._count(order.order_status, order.filled_qty, order.average_price, -1)
+        self._count(status, filled_qty, average_price, 1)
+
+    def _count(self, status: Optional[OrderStatus], filled_qty: int, average_price: float, sign: int) -> None:
+        self.counts[status] = self.counts.get(status, 0) + sign
+        self.filled_qty += sign * filled_qty
+        self.filled_value += sign * filled_qty * average_price
+
+    def count(self, status: Optional[OrderStatus]) -> int:
+        return self.counts.get(status, 0)
+
+    @property
+    def status(self) -> Optional[OrderStatus]:
+        # the status all the orders are in, None if they differ or there are none
+        for status, count in self.counts.items():
+            if count == self.orders and count > 0:
+                return status
+        return None
+
+    @property
+    def working(self) -> int:
+        # orders the broker reported and which are not finished yet
+        return self.orders - self.count(None) - sum(self.count(status) for status in TERMINAL_STATUSES)
+
+    @property
+    def average_price(self) -> float:
+        return self.filled_value / self.filled_qty if self.filled_qty > 0 else 0.0
 
 
 class Trade:
@@ -31,22 +78,39 @@ class Trade:
         self._stopLoss = 0.0
         self.target = 0.0  # Target price if applicable
         self.cmp = 0.0  # Last traded price
+        self.price_handle: Optional[PriceHandle] = None  # live view on the trading symbol's price store slot
         self.stoploss_percentage = 0.0
         self.stoploss_underlying_percentage = 0.0
 
         self.state = TradeState.CREATED  # state of the trade
         self.timestamp = 0  # Set this timestamp to strategy timestamp if you are not sure what to set
-        self.create_timestamp = int(datetime.timestamp(datetime.now()))  # Timestamp when the trade is created (Not triggered)
+        self.create_timestamp = int(get_clock().timestamp())  # Timestamp when the trade is created (Not triggered)
         self.start_timestamp = 0  # Timestamp when the trade gets triggered and order placed
         self.end_timestamp = 0  # Timestamp when the trade ended
         self.pnl = 0.0  # Profit loss of the trade. If trade is Active this shows the unrealized pnl else realized pnl
         self.pnl_percentage = 0.0  # Profit Loss in percentage terms
         self.exit = 0.0  # Exit price of the trade
         self.exit_reason = None  # SL/Target/SquareOff/Any Other
+        self.basket_id = None  # legs entered together with BaseStrategy.generateBasket share the id
 
         self.entry_orders: List[Order] = []  # Object of Type ordermgmt.Order
         self.sl_orders: List[Order] = []  # Object of Type ordermgmt.Order
         self.target_orders: List[Order] = []  # Object of Type ordermgmt.Order
+        self.entry_state = OrderAggregate()
+        self.sl_state = OrderAggregate()
+        self.target_state = OrderAggregate()
+
+    def add_entry_order(self, order: Order) -> None:
+        self.entry_orders.append(order)
+        self.entry_state.add(order)
+
+    def add_sl_order(self, order: Order) -> None:
+        self.sl_orders.append(order)
+        self.sl_state.add(order)
+
+    def add_target_order(self, order: Order) -> None:
+        self.target_orders.append(order)
+        self.target_state.add(order)
 
     @property
     def stopLoss(self):
@@ -0,0 +1 @@
+import app  # noqa: F401 config imports app, which has to come first for broker, algos and instruments to import
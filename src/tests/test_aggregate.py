@@ -0,0 +1,84 @@
+import random
+
+from broker.modify import split_off
+from broker.slicing import aggregate_slices
+from models import OrderStatus
+from models.order import TERMINAL_STATUSES, Order, OrderInputParams
+from models.trade import OrderAggregate, Trade
+
+
+def order(order_id: str, qty: int = 50) -> Order:
+    oip = OrderInputParams("NIFTY24MAY22000CE")
+    oip.qty = qty
+    order = Order(oip)
+    order.order_id = order_id
+    return order
+
+
+def assert_matches(aggregate: OrderAggregate, orders) -> None:
+    # what the aggregate keeps up to date, counted from the orders
+    assert aggregate.orders == len(orders)
+    for status in [None, *OrderStatus]:
+        assert aggregate.count(status) == sum(1 for order in orders if order.order_status == status)
+    assert aggregate.filled_qty == sum(order.filled_qty for order in orders)
+    assert abs(aggregate.filled_value - sum(order.filled_qty * order.average_price for order in orders)) < 1e-6
+    assert aggregate.working == sum(1 for order in orders if order.order_status is not None and order.order_status not in TERMINAL_STATUSES)
+    statuses = set(order.order_status for order in orders)
+    assert aggregate.status == (statuses.pop() if len(statuses) == 1 else None)
+
+
+def test_counts_follow_the_order_updates():
+    trade = Trade("NIFTY24MAY22000CE", "Test")
+    first, second = order("1"), order("2")
+    trade.add_entry_order(first)
+    trade.add_entry_order(second)
+    assert_matches(trade.entry_state, trade.entry_orders)
+    assert trade.entry_state.working == 0
+
+    first.apply_update(OrderStatus.OPEN, 0, 0.0)
+    second.apply_update(OrderStatus.OPEN, 20, 100.0)
+    assert_matches(trade.entry_state, trade.entry_orders)
+    assert trade.entry_state.status == OrderStatus.OPEN and trade.entry_state.working == 2
+
+    second.apply_update(OrderStatus.COMPLETE, 50, 101.0)
+    first.apply_update(OrderStatus.CANCELLED, 0, 0.0)
+    assert_matches(trade.entry_state, trade.entry_orders)
+    assert trade.entry_state.working == 0 and trade.entry_state.average_price == 101.0
+
+
+def test_counts_stay_consistent_through_random_updates():
+    rng = random.Random(7)
+    trade = Trade("NIFTY24MAY22000CE", "Test")
+    orders = [order(str(i)) for i in range(6)]
+    for tracked in orders:
+        trade.add_sl_order(tracked)
+    for _ in range(500):
+        tracked = rng.choice(orders)
+        if tracked.order_status in TERMINAL_STATUSES:
+            continue
+        status = rng.choice([OrderStatus.OPEN, OrderStatus.TRIGGER_PENDING, *TERMINAL_STATUSES])
+        filled_qty = tracked.qty if status == OrderStatus.COMPLETE else rng.randint(tracked.filled_qty, tracked.qty)
+        tracked.apply_update(status, filled_qty, round(rng.uniform(90, 110), 2))
+        assert_matches(trade.sl_state, trade.sl_orders)
+
+
+def test_split_off_order_keeps_the_trade_aggregate_on_the_sliced_order():
+    trade = Trade("NIFTY24MAY22000CE", "Test")
+    sl = order("1", 100)
+    trade.add_sl_order(sl)
+    sl.apply_update(OrderStatus.TRIGGER_PENDING, 0, 0.0)
+
+    broker_order = split_off(sl)
+    assert broker_order.aggregate is None and sl.aggregate is trade.sl_state
+    broker_order.apply_update(OrderStatus.CANCELLED, 40, 100.0)
+    replacement = order("2", 60)
+    replacement.order_status = OrderStatus.TRIGGER_PENDING
+    sl.child_orders.append(replacement)
+    aggregate_slices(sl)
+    assert_matches(trade.sl_state, trade.sl_orders)
+    assert trade.sl_state.count(OrderStatus.TRIGGER_PENDING) == 1 and trade.sl_state.filled_qty == 40
+
+    replacement.apply_update(OrderStatus.COMPLETE, 60, 110.0)
+    aggregate_slices(sl)
+    assert_matches(trade.sl_state, trade.sl_orders)
+    assert trade.sl_state.status == OrderStatus.COMPLETE and trade.sl_state.average_price == 106.0
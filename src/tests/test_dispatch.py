@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from broker.dispatch import OrderDispatcher
+from broker.ratelimit import RateLimiter
+from exceptions import StaleOrderRequestException
+from models import OrderPriority
+
+
+def dispatcher() -> OrderDispatcher:
+    # one order call at a time, 100 per second: the first goes straight out, the rest queue
+    return OrderDispatcher("test", RateLimiter("test", {"orders": [(100, 1)]}))
+
+
+async def admit(dispatcher: OrderDispatcher, admitted: list, name: str, priority: OrderPriority, key=None, group=None, cancel=False) -> None:
+    try:
+        await dispatcher.admit(priority, key, group, cancel)
+        admitted.append(name)
+    except StaleOrderRequestException:
+        admitted.append(name + " stale")
+
+
+def test_queued_calls_go_out_most_urgent_first():
+    admitted = []
+
+    async def run():
+        orders = dispatcher()
+        await admit(orders, admitted, "first entry", OrderPriority.ENTRY)
+        await asyncio.gather(
+            admit(orders, admitted, "entry 1", OrderPriority.ENTRY),
+            admit(orders, admitted, "sl", OrderPriority.PROTECT),
+            admit(orders, admitted, "entry 2", OrderPriority.ENTRY),
+            admit(orders, admitted, "square off", OrderPriority.SQUARE_OFF),
+            admit(orders, admitted, "target", OrderPriority.PROTECT),
+        )
+        assert orders.pending() == 0
+
+    asyncio.run(run())
+    assert admitted == ["first entry", "square off", "sl", "target", "entry 1", "entry 2"]
+
+
+def test_newer_call_for_the_same_key_supersedes_the_queued_one():
+    admitted = []
+
+    async def run():
+        orders = dispatcher()
+        await orders.admit(OrderPriority.ENTRY)
+        older = asyncio.ensure_future(admit(orders, admitted, "modify 1", OrderPriority.PROTECT, key="order-1"))
+        await asyncio.sleep(0)
+        await asyncio.gather(older, admit(orders, admitted, "modify 2", OrderPriority.PROTECT, key="order-1"))
+
+    asyncio.run(run())
+    assert admitted == ["modify 1 stale", "modify 2"]
+
+
+def test_less_urgent_call_for_the_same_key_queues_behind_the_queued_one():
+    admitted = []
+
+    async def run():
+        orders = dispatcher()
+        await orders.admit(OrderPriority.ENTRY)
+        older = asyncio.ensure_future(admit(orders, admitted, "protect modify", OrderPriority.PROTECT, key="order-1"))
+        await asyncio.sleep(0)
+        await asyncio.gather(older, admit(orders, admitted, "entry modify", OrderPriority.ENTRY, key="order-1"))
+
+    asyncio.run(run())
+    assert admitted == ["protect modify", "entry modify"]
+
+
+def test_modify_does_not_supersede_a_queued_square_off_cancel():
+    admitted = []
+
+    async def run():
+        orders = dispatcher()
+        await orders.admit(OrderPriority.ENTRY)
+        cancel = asyncio.ensure_future(admit(orders, admitted, "square off cancel", OrderPriority.SQUARE_OFF, key="order-1", cancel=True))
+        await asyncio.sleep(0)
+        await asyncio.gather(
+            cancel,
+            admit(orders, admitted, "sl modify", OrderPriority.PROTECT, key="order-1"),
+            admit(orders, admitted, "urgent modify", OrderPriority.SQUARE_OFF, key="order-1"),
+        )
+        assert orders.pending() == 0
+
+    asyncio.run(run())
+    assert admitted == ["sl modify stale", "urgent modify stale", "square off cancel"]
+
+
+@pytest.mark.parametrize(
+    "group, priority, dropped",
+    [
+        ("Strangle", OrderPriority.ENTRY, ["Strangle_1 entry", "Strangle_2 entry"]),
+        ("Strangle", OrderPriority.PROTECT, ["Strangle_1 entry", "Strangle_1 sl", "Strangle_2 entry"]),
+        ("Strangle_1", OrderPriority.SQUARE_OFF, ["Strangle_1 entry", "Strangle_1 sl", "Strangle_1 square off"]),
+        ("Straddle", OrderPriority.SQUARE_OFF, []),
+    ],
+)
+def test_drop_takes_queued_calls_of_the_group_at_or_below_the_priority(group, priority, dropped):
+    admitted = []
+    queued = [
+        ("Strangle_1 entry", OrderPriority.ENTRY, "Strangle_1"),
+        ("Strangle_1 sl", OrderPriority.PROTECT, "Strangle_1"),
+        ("Strangle_1 square off", OrderPriority.SQUARE_OFF, "Strangle_1"),
+        ("Strangle_2 entry", OrderPriority.ENTRY, "Strangle_2"),
+        ("Iron_1 entry", OrderPriority.ENTRY, "Iron_1"),
+    ]
+
+    async def run():
+        orders = dispatcher()
+        await orders.admit(OrderPriority.ENTRY)
+        tasks = [asyncio.ensure_future(admit(orders, admitted, name, priority, group=trade)) for name, priority, trade in queued]
+        await asyncio.sleep(0)
+        assert orders.pending() == len(queued)
+        assert orders.drop(group, priority) == len(dropped)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert sorted(name[: -len(" stale")] for name in admitted if name.endswith(" stale")) == sorted(dropped)
+    assert len(admitted) == len(queued)
@@ -0,0 +1,38 @@
+import numpy as np
+
+from core.journal import JOURNAL_MAGIC, TICK_DTYPE, TICK_DTYPE_V1, JournalReader, TickJournal
+from models import TickData
+
+
+def write_journal(directory, ois):
+    journal = TickJournal("test_journal", str(directory))
+    tick = TickData("NIFTY24MAY22000CE")
+    for oi in ois:
+        tick.lastTradedPrice = 100.0
+        tick.oi = oi
+        journal.on_ticks([tick])
+    path = journal.path
+    journal.close()
+    return path
+
+
+def test_open_interest_is_journaled(tmp_path):
+    reader = JournalReader(write_journal(tmp_path, [1500, 1650]))
+    assert reader.records["oi"].tolist() == [1500, 1650]
+    assert reader.for_symbol("NIFTY24MAY22000CE")["oi"].tolist() == [1500, 1650]
+
+
+def test_version_1_journal_reads_with_no_open_interest(tmp_path):
+    path = write_journal(tmp_path, [1500, 1650])
+    records = JournalReader(path).records
+    old = np.zeros(len(records), TICK_DTYPE_V1)
+    for name in TICK_DTYPE_V1.names:
+        old[name] = records[name]
+    with open(path, "wb") as jFile:
+        jFile.write(np.array([JOURNAL_MAGIC, 1, len(old), TICK_DTYPE_V1.itemsize, 0, 0, 0, 0], dtype="<i8").tobytes())
+        jFile.write(old.tobytes())
+
+    reader = JournalReader(path)
+    assert reader.records.dtype == TICK_DTYPE
+    assert reader.records["oi"].tolist() == [0, 0]
+    assert reader.records["ltp"].tolist() == [100.0, 100.0]
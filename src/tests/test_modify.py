@@ -0,0 +1,217 @@
+import asyncio
+from typing import Dict, List, Optional
+
+import pytest
+
+from broker.base import Broker
+from broker.reconcile import OrderBookDiff
+from exceptions import StaleOrderRequestException
+from models import Direction, OrderPriority, OrderStatus, OrderType
+from models.order import Order, OrderInputParams, OrderModifyParams
+
+
+class FakeBroker(Broker):
+    # records the order calls, book is what the order book shows of an order which got no order update
+    order_terminal_wait = 0.01
+
+    def __init__(self) -> None:
+        super().__init__({"broker_name": "fake", "short_code": "test_modify"})
+        self.orders_queue = asyncio.Queue()
+        self.placed: List[OrderInputParams] = []
+        self.cancelled: List[str] = []
+        self.cancel_error: Optional[str] = None
+        self.book: Dict[str, tuple] = {}  # order id => (status, filled qty) the order book shows
+
+    def place_order(self, oip: OrderInputParams) -> Order:
+        self.placed.append(oip)
+        order = Order(oip)
+        order.order_id = "replacement-" + str(len(self.placed))
+        order.order_status = OrderStatus.TRIGGER_PENDING
+        return order
+
+    def modify_order(self, order: Order, omp: OrderModifyParams, qty: int) -> Order:
+        return order
+
+    def cancel_order(self, order: Order) -> Order:
+        self.cancelled.append(order.order_id)
+        if self.cancel_error is not None:
+            raise Exception(self.cancel_error)
+        return order
+
+    def fetch_update_all_orders(self, orders: Dict[str, Order]) -> OrderBookDiff:
+        diff = OrderBookDiff()
+        for order_id, order in orders.items():
+            if order_id in self.book:
+                status, filled_qty = self.book[order_id]
+                order.apply_update(status, filled_qty, 100.0)
+                diff.changed.append(order)
+        return diff
+
+    def get_quote(self, trading_symbol, short_code, isFnO, exchange): ...
+    def get_index_quote(self, trading_symbol, short_code, exchange="NSE"): ...
+    def login(self, args): ...
+    def margins(self): ...
+    def positions(self): ...
+    def orders(self): ...
+    def instruments(self, exchange): ...
+    def handle_order_update_tick(self, order, data): ...
+
+
+def sl_order(qty: int = 100) -> Order:
+    oip = OrderInputParams("NIFTY24MAY22000CE")
+    oip.direction = Direction.LONG
+    oip.order_type = OrderType.SL_LIMIT
+    oip.qty = qty
+    oip.price = 110.0
+    oip.trigger_price = 108.0
+    order = Order(oip)
+    order.order_id = "sl-1"
+    order.order_status = OrderStatus.TRIGGER_PENDING
+    order.modify_count = 23  # within the reserve, the next modification replaces it
+    return order
+
+
+def modify_params(trigger_price: float) -> OrderModifyParams:
+    omp = OrderModifyParams()
+    omp.new_price = trigger_price + 2
+    omp.new_trigger_price = trigger_price
+    return omp
+
+
+def update_later(broker: FakeBroker, order: Order, status: OrderStatus, filled_qty: int) -> None:
+    # an order update arriving while replace_order waits for the cancel
+    def update() -> None:
+        order.apply_update(status, filled_qty, 100.0)
+        broker.order_updated(order)
+
+    asyncio.get_running_loop().call_soon(update)
+
+
+def modify(broker: FakeBroker, order: Order, omp: OrderModifyParams, on_cancel=None) -> Order:
+    async def run() -> Order:
+        if on_cancel is not None:
+            cancel_order = broker.cancel_order
+
+            def cancel(order: Order) -> Order:
+                try:
+                    return cancel_order(order)
+                finally:
+                    broker.loop.call_soon_threadsafe(on_cancel, order)
+
+            broker.cancel_order = cancel
+        broker.loop = asyncio.get_running_loop()
+        return await broker.modify_order_async(order, omp, order.qty, OrderPriority.PROTECT)
+
+    return asyncio.run(run())
+
+
+def test_replacement_sized_from_fills_confirmed_by_the_order_update():
+    broker = FakeBroker()
+    order = sl_order()
+    result = modify(broker, order, modify_params(105.0), lambda child: update_later(broker, child, OrderStatus.CANCELLED, 40))
+
+    assert broker.cancelled == ["sl-1"]
+    assert [oip.qty for oip in broker.placed] == [60]
+    assert broker.placed[0].trigger_price == 105.0
+    assert result is order and order.order_id == "sl-1"
+    assert [child.order_id for child in order.child_orders] == ["sl-1", "replacement-1"]
+    assert all(child is not order and child.parent_order_id == "sl-1" for child in order.child_orders)
+    assert order.qty == 100 and order.filled_qty == 40
+    assert order.order_status == OrderStatus.TRIGGER_PENDING
+    assert broker.terminal_waiters == {}
+
+
+def test_nothing_placed_when_the_order_filled_before_the_cancel():
+    broker = FakeBroker()
+    broker.cancel_error = "Order cannot be cancelled as it is being processed"
+    order = sl_order()
+    modify(broker, order, modify_params(105.0), lambda child: update_later(broker, child, OrderStatus.COMPLETE, 100))
+
+    assert broker.placed == []
+    assert len(order.child_orders) == 1
+    assert order.order_status == OrderStatus.COMPLETE and order.filled_qty == 100
+    assert broker.modifications.replaced == 0
+
+
+def test_order_book_confirms_the_cancel_without_an_order_update():
+    broker = FakeBroker()
+    broker.book["sl-1"] = (OrderStatus.CANCELLED, 30)
+    order = sl_order()
+    modify(broker, order, modify_params(105.0))
+
+    assert [oip.qty for oip in broker.placed] == [70]
+    assert order.filled_qty == 30 and order.qty == 100
+    assert order.order_status == OrderStatus.TRIGGER_PENDING
+
+
+def test_unconfirmed_cancel_places_nothing():
+    broker = FakeBroker()
+    order = sl_order()
+    with pytest.raises(StaleOrderRequestException):
+        modify(broker, order, modify_params(105.0))
+
+    assert broker.placed == []
+    assert broker.terminal_waiters == {}
+    assert order.child_orders[0].order_status == OrderStatus.TRIGGER_PENDING
+
+
+def test_replacing_a_slice_keeps_the_sliced_order_whole():
+    broker = FakeBroker()
+    order = sl_order(200)
+    order.order_id = "slices:sl-1"
+    first, second = sl_order(), sl_order()
+    second.order_id = "sl-2"
+    second.modify_count = 0
+    for child in [first, second]:
+        child.parent_order_id = order.order_id
+    order.child_orders = [first, second]
+    modify(broker, order, modify_params(105.0), lambda child: update_later(broker, child, OrderStatus.CANCELLED, 25))
+
+    assert [oip.qty for oip in broker.placed] == [75]
+    assert [child.order_id for child in order.child_orders] == ["sl-1", "sl-2", "replacement-1"]
+    assert second.trigger_price == 105.0 and second.modify_count == 1
+    assert order.qty == 200 and order.filled_qty == 25
+    assert order.trigger_price == 105.0
+
+
+def test_sl_limit_order_moves_with_its_trigger_price():
+    broker = FakeBroker()
+    order = sl_order()
+    order.modify_count = 0
+    omp = modify_params(108.0)  # new limit price, same trigger price
+    modify(broker, order, omp)
+
+    assert broker.modifications.noops == 1 and broker.modifications.sent == 0
+    assert order.modify_count == 0 and order.price == 110.0
+
+    modify(broker, order, modify_params(105.0))
+    assert broker.modifications.sent == 1
+    assert order.modify_count == 1 and order.price == 107.0 and order.trigger_price == 105.0
+
+
+def test_price_only_modification_of_an_sl_limit_order_is_sent():
+    broker = FakeBroker()
+    order = sl_order()
+    order.modify_count = 0
+    omp = OrderModifyParams()
+    omp.new_price = 112.0
+    omp.new_trigger_price = 0
+    modify(broker, order, omp)
+
+    assert broker.modifications.sent == 1 and order.price == 112.0
+
+
+def test_limit_order_moves_with_its_price():
+    broker = FakeBroker()
+    order = sl_order()
+    order.order_type = OrderType.LIMIT
+    order.modify_count = 0
+    omp = OrderModifyParams()
+    omp.new_price = 110.0
+    modify(broker, order, omp)
+    assert broker.modifications.noops == 1
+
+    omp = OrderModifyParams()
+    omp.new_price = 111.0
+    modify(broker, order, omp)
+    assert broker.modifications.sent == 1 and order.price == 111.0
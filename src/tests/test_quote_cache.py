@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core import Quote
+from core.quotes import QuoteCache
+
+
+class SlowBroker:
+    # a quote call taking a while, counting the calls made
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def quote(self, symbol: str = "NIFTY") -> Quote:
+        self.calls += 1
+        time.sleep(0.05)
+        quote = Quote(symbol)
+        quote.last_traded_price = 100.0
+        return quote
+
+    def quotes(self, symbols):
+        return {symbol: self.quote(symbol) for symbol in symbols if symbol != "UNLISTED"}
+
+
+def test_concurrent_callers_on_the_loop_share_one_fetch():
+    cache = QuoteCache(1.0)
+    broker = SlowBroker()
+
+    async def run():
+        return await asyncio.gather(cache.get_async("quote:NFO:", "NIFTY", broker.quote), cache.get_async("quote:NFO:", "NIFTY", broker.quote))
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert broker.calls == 1
+    assert cache.summary()["totals"] == {"hits": 0, "misses": 1, "coalesced": 1, "errors": 0}
+
+
+def test_loop_keeps_running_while_the_quote_is_fetched():
+    cache = QuoteCache(1.0)
+    broker = SlowBroker()
+    ran = []
+
+    async def other_strategy():
+        ran.append(True)
+
+    async def run():
+        fetch = asyncio.ensure_future(cache.get_async("quote:NFO:", "NIFTY", broker.quote))
+        await other_strategy()
+        assert not fetch.done()
+        return await fetch
+
+    assert asyncio.run(run()).last_traded_price == 100.0
+    assert ran == [True]
+
+
+def test_concurrent_batches_on_the_loop_share_the_symbols_they_have_in_common():
+    cache = QuoteCache(1.0)
+    broker = SlowBroker()
+
+    async def run():
+        return await asyncio.gather(
+            cache.get_many_async("quote:NFO:", ["CE", "PE", "UNLISTED"], broker.quotes), cache.get_many_async("quote:NFO:", ["PE", "FUT"], broker.quotes)
+        )
+
+    first, second = asyncio.run(run())
+    assert sorted(first) == ["CE", "PE"] and sorted(second) == ["FUT", "PE"]
+    assert first["PE"] is second["PE"]
+    assert broker.calls == 3
+
+
+def test_failed_fetch_reaches_every_caller_and_is_not_cached():
+    cache = QuoteCache(1.0)
+
+    def fail():
+        time.sleep(0.05)
+        raise KeyError("NIFTY")
+
+    async def run():
+        return await asyncio.gather(cache.get_async("quote:NFO:", "NIFTY", fail), cache.get_async("quote:NFO:", "NIFTY", fail), return_exceptions=True)
+
+    assert all(isinstance(result, KeyError) for result in asyncio.run(run()))
+    assert cache.inflight == {} and cache.entries == {}
+
+
+def test_threads_share_one_fetch():
+    cache = QuoteCache(1.0)
+    broker = SlowBroker()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("quote:NFO:", "NIFTY", broker.quote))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results[0] is results[1]
+    assert broker.calls == 1
+
+
+@pytest.mark.parametrize("ttl, calls", [(1.0, 1), (0.0, 2)])
+def test_quotes_are_good_for_ttl(ttl, calls):
+    cache = QuoteCache(ttl)
+    broker = SlowBroker()
+    cache.get("quote:NFO:", "NIFTY", broker.quote)
+    time.sleep(0.01)
+    cache.get("quote:NFO:", "NIFTY", broker.quote)
+    assert broker.calls == calls
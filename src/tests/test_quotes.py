@@ -0,0 +1,42 @@
+import pytest
+from kiteconnect.exceptions import NetworkException
+
+from broker.zerodha import Broker
+
+
+class RateLimitedHandle:
+    # kite's quote call, rejected as over the rate limit the first rejections times
+    def __init__(self, rejections: int) -> None:
+        self.rejections = rejections
+        self.calls = 0
+
+    def quote(self, key):
+        self.calls += 1
+        if self.calls <= self.rejections:
+            raise NetworkException("Too many requests", code=429)
+        return {key: {"last_price": 101.5, "ohlc": {"open": 100, "high": 102, "low": 99, "close": 100}, "net_change": 1.5}}
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr("broker.zerodha.time.sleep", lambda seconds: None)
+
+
+def zerodha(rejections: int) -> Broker:
+    broker = Broker({"broker_name": "zerodha", "short_code": "test_quotes"})
+    broker.broker_handle = RateLimitedHandle(rejections)
+    broker.rate_limiter.pause = lambda kind, seconds=1.0: None
+    return broker
+
+
+def test_rate_limited_quote_is_retried():
+    broker = zerodha(2)
+    assert broker.get_index_quote("NIFTY 50", "test_quotes").last_traded_price == 101.5
+    assert broker.broker_handle.calls == 3
+
+
+def test_rate_limited_quote_gives_up_after_quote_retries():
+    broker = zerodha(100)
+    with pytest.raises(Exception, match="No quote for NSE:NIFTY 50"):
+        broker.get_index_quote("NIFTY 50", "test_quotes")
+    assert broker.broker_handle.calls == broker.quote_retries + 1
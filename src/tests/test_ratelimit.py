@@ -0,0 +1,15 @@
+from broker.ratelimit import BREEZE_LIMITS, RateLimiter
+
+
+def test_breeze_quotes_leave_the_order_budget_alone():
+    limiter = RateLimiter("test", BREEZE_LIMITS)
+    for _ in range(70):
+        limiter.reserve("quotes")  # a strike chain fetched strike by strike, and then some
+    assert limiter.available_in("quotes") > 0
+    assert limiter.available_in("orders") == 0
+    assert limiter.available_in("order_book") > 0  # shares the quotes' budget
+
+
+def test_breeze_budgets_stay_within_the_account_limit():
+    per_minute = sum(rate * 60 for limits in BREEZE_LIMITS.values() for rate, _ in limits)
+    assert round(per_minute) == 100
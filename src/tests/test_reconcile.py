@@ -0,0 +1,100 @@
+import pytest
+
+from broker.reconcile import ORDER_BY_PROGRESS, accept_update, reconcile_order_book
+from models import OrderStatus
+from models.order import Order, OrderInputParams
+
+
+def order(order_id: str = "1", status: OrderStatus = OrderStatus.OPEN, filled_qty: int = 0, exchange_timestamp: int = 1000) -> Order:
+    oip = OrderInputParams("NIFTY24MAY22000CE")
+    oip.qty = 100
+    order = Order(oip)
+    order.order_id = order_id
+    order.order_status = status
+    order.filled_qty = filled_qty
+    order.exchange_timestamp = exchange_timestamp
+    return order
+
+
+def apply_row(order: Order, row: dict) -> None:
+    status = OrderStatus(row["status"])
+    if accept_update(order, row.get("exchange_update_timestamp", 0), status, row["filled_quantity"]):
+        order.apply_update(status, row["filled_quantity"], row.get("average_price", 0.0))
+
+
+def test_newer_update_is_accepted():
+    tracked = order(filled_qty=25)
+    assert accept_update(tracked, 1001, OrderStatus.OPEN, 50)
+    assert tracked.exchange_timestamp == 1001
+
+
+def test_same_second_update_is_accepted():
+    assert accept_update(order(), 1000, OrderStatus.COMPLETE, 100)
+
+
+@pytest.mark.parametrize(
+    "status, filled_qty",
+    [
+        (OrderStatus.OPEN, 50),  # more fills
+        (OrderStatus.COMPLETE, 100),
+        (OrderStatus.CANCELLED, 25),  # a terminal status
+    ],
+)
+def test_older_update_which_moves_the_order_forward_is_accepted(status, filled_qty):
+    tracked = order(filled_qty=25)
+    assert accept_update(tracked, 998, status, filled_qty)
+    assert tracked.exchange_timestamp == 1000
+
+
+def test_update_ordering_by_progress_ignores_update_times():
+    assert not accept_update(order(), 999, OrderStatus.TRIGGER_PENDING, 0)
+    assert accept_update(order(), 999, OrderStatus.TRIGGER_PENDING, 0, ORDER_BY_PROGRESS)
+    assert not accept_update(order(filled_qty=50), 1001, OrderStatus.OPEN, 25, ORDER_BY_PROGRESS)
+
+
+@pytest.mark.parametrize(
+    "tracked, exchange_epoch, status, filled_qty",
+    [
+        (order(), 999, OrderStatus.TRIGGER_PENDING, 0),  # older than the last update applied and no progress
+        (order(filled_qty=50), 1001, OrderStatus.OPEN, 25),  # fewer fills
+        (order(status=OrderStatus.COMPLETE, filled_qty=100), 1001, OrderStatus.OPEN, 100),  # back from a terminal status
+        (order(status=OrderStatus.CANCELLED), 1001, OrderStatus.OPEN, 0),
+        (order(status=OrderStatus.CANCELLED), 1001, OrderStatus.COMPLETE, 0),  # finished orders stay as they are
+        (order(status=OrderStatus.REJECTED), 1001, OrderStatus.OPEN, 0),
+    ],
+)
+def test_out_of_sequence_update_is_dropped(tracked, exchange_epoch, status, filled_qty):
+    before = (tracked.exchange_timestamp, tracked.order_status, tracked.filled_qty)
+    assert not accept_update(tracked, exchange_epoch, status, filled_qty)
+    assert (tracked.exchange_timestamp, tracked.order_status, tracked.filled_qty) == before
+
+
+def test_order_book_diff():
+    orders = {"1": order("1"), "2": order("2"), "3": order("3", OrderStatus.COMPLETE, 100)}
+    book = [
+        {"order_id": "1", "status": "COMPLETE", "filled_quantity": 100, "exchange_update_timestamp": 1005, "average_price": 101.0},
+        {"order_id": "2", "status": "OPEN", "filled_quantity": 0, "exchange_update_timestamp": 1000},  # unchanged
+        {"order_id": "3", "status": "OPEN", "filled_quantity": 100, "exchange_update_timestamp": 1010},  # back from COMPLETE, dropped
+        {"order_id": "4", "parent_order_id": "2", "status": "OPEN", "filled_quantity": 0, "exchange_update_timestamp": 1003},
+        {"order_id": "5", "status": "OPEN", "filled_quantity": 0, "exchange_update_timestamp": 1003},
+    ]
+    diff = reconcile_order_book(orders, book, apply_row)
+
+    assert [changed.order_id for changed in diff.changed] == ["1"]
+    assert orders["1"].order_status == OrderStatus.COMPLETE and orders["1"].average_price == 101.0
+    assert orders["3"].order_status == OrderStatus.COMPLETE
+    assert [(child.order_id, child.parent_order_id, child.order_status) for child in diff.new_children] == [("4", "2", OrderStatus.OPEN)]
+    assert [row["order_id"] for row in diff.unknown] == ["5"]
+    assert len(diff) == 2
+
+
+def test_rows_are_looked_up_by_order_id_key():
+    orders = {"7": order("7")}
+    book = [
+        {"orderReference": "7", "parentOrderId": None, "status": "CANCELLED", "filled_quantity": 0, "exchange_update_timestamp": 1001},
+        {"orderReference": "8", "parentOrderId": "7", "status": "OPEN", "filled_quantity": 0, "exchange_update_timestamp": 1001},
+    ]
+    diff = reconcile_order_book(orders, book, apply_row, order_id_key="orderReference", parent_id_key="parentOrderId")
+
+    assert orders["7"].order_status == OrderStatus.CANCELLED
+    assert [child.order_id for child in diff.new_children] == ["8"]
@@ -0,0 +1,107 @@
+import pytest
+
+import instruments
+from broker import slicing
+from broker.slicing import aggregate_slices, slice_quantities, sliced_order
+from models import OrderStatus
+from models.order import Order, OrderInputParams
+
+
+@pytest.mark.parametrize(
+    "qty, freeze_limit, lot_size, quantities",
+    [
+        (2000, 900, 25, [675, 675, 650]),
+        (2050, 900, 25, [700, 675, 675]),  # 82 lots over 3 slices
+        (2000, 1000, 75, [675, 675, 650]),  # freeze limit not in whole lots, 975 per slice at most
+        (1810, 1800, 50, [900, 910]),  # not in whole lots, the last slice keeps the odd 10
+        (900, 900, 25, [900]),
+        (500, None, 25, [500]),
+        (500, 20, 25, [500]),  # freeze limit below one lot
+    ],
+)
+def test_slice_quantities(qty, freeze_limit, lot_size, quantities):
+    assert slice_quantities(qty, freeze_limit, lot_size) == quantities
+
+
+@pytest.mark.parametrize("lot_size, freeze_limit", [(15, 900), (25, 900), (50, 1800), (75, 1000), (10, 1000)])
+def test_slices_are_whole_lots_within_the_freeze_limit(lot_size, freeze_limit):
+    max_slice = freeze_limit // lot_size * lot_size
+    for lots in range(1, 400):
+        quantities = slice_quantities(lots * lot_size, freeze_limit, lot_size)
+        assert sum(quantities) == lots * lot_size
+        assert all(0 < qty <= max_slice and qty % lot_size == 0 for qty in quantities)
+        assert len(quantities) == -(-lots * lot_size // max_slice)
+        assert max(quantities) - min(quantities) <= lot_size
+
+
+def child(order_id: str, qty: int, status: OrderStatus, filled_qty: int = 0, average_price: float = 0.0, price: float = 100.0) -> Order:
+    oip = OrderInputParams("BANKNIFTY24MAY48000CE")
+    oip.qty = qty
+    oip.price = price
+    order = Order(oip)
+    order.order_id = order_id
+    order.order_status = status
+    order.filled_qty = filled_qty
+    order.average_price = average_price
+    order.pending_qty = qty - filled_qty if status not in [OrderStatus.CANCELLED, OrderStatus.REJECTED, OrderStatus.COMPLETE] else 0
+    return order
+
+
+def sliced(*children: Order) -> Order:
+    oip = OrderInputParams("BANKNIFTY24MAY48000CE")
+    oip.qty = sum(order.qty for order in children)
+    return sliced_order(oip, list(children))
+
+
+def test_partly_filled_cancelled_and_rejected_slices():
+    order = sliced(
+        child("1", 900, OrderStatus.COMPLETE, 900, 100.0),
+        child("2", 900, OrderStatus.CANCELLED, 300, 103.0),
+        child("3", 200, OrderStatus.REJECTED),
+    )
+    assert order.qty == 2000
+    assert order.order_status == OrderStatus.CANCELLED
+    assert order.filled_qty == 1200
+    assert order.average_price == pytest.approx(100.75)
+    assert order.pending_qty == 0
+
+
+def test_slice_still_working_keeps_the_order_working():
+    order = sliced(
+        child("1", 900, OrderStatus.CANCELLED, 300, 100.0),
+        child("2", 900, OrderStatus.OPEN, 450, 102.0, price=104.0),
+        child("3", 200, OrderStatus.REJECTED),
+    )
+    assert order.order_status == OrderStatus.OPEN
+    assert order.filled_qty == 750
+    assert order.average_price == pytest.approx(101.2)
+    assert order.price == 104.0
+    assert order.pending_qty == 450
+
+
+def test_every_slice_rejected():
+    order = sliced(child("1", 900, OrderStatus.REJECTED), child("2", 100, OrderStatus.REJECTED))
+    assert order.order_status == OrderStatus.REJECTED and order.filled_qty == 0 and order.average_price == 0.0
+
+
+def test_cancelled_slice_and_its_filled_replacement_complete_the_order():
+    order = sliced(child("1", 900, OrderStatus.CANCELLED, 300, 100.0), child("2", 600, OrderStatus.COMPLETE, 600, 106.0))
+    order.qty = 900  # the replacement was only placed for what the cancelled slice left open
+    aggregate_slices(order)
+    assert order.order_status == OrderStatus.COMPLETE
+    assert order.filled_qty == 900 and order.average_price == pytest.approx(104.0)
+
+
+def test_user_freeze_limits_are_read_once_per_account(monkeypatch):
+    reads = []
+
+    def user_config(short_code: str) -> dict:
+        reads.append(short_code)
+        return {"freeze_limits": {"NIFTY": "1200"}}
+
+    monkeypatch.setattr(slicing, "get_user_config", user_config)
+    monkeypatch.setattr(instruments, "get_instrument_data_by_symbol", lambda short_code, symbol: {"name": symbol[:-12], "lot_size": 25})
+    limits = [slicing.get_freeze_limit("test_freeze", symbol) for symbol in ["NIFTY24MAY22000CE", "NIFTY24MAY22100PE", "BANKNIFTY24MAY48000CE"]]
+
+    assert limits == [1200, 1200, 900]
+    assert reads == ["test_freeze"]
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+
+import pytest
+
+from core.strategy import BaseStrategy, order_coroutine
+from models import TradeExitReason, TradeState
+from models.trade import Trade
+
+
+class MTMStrategy(BaseStrategy):
+    # two open trades whose pnl only changes when they are tracked, as a tick moved their price since the last cycle
+    def __init__(self) -> None:
+        super().__init__("MTMStrategy", "test_strategy", None)  # type: ignore
+        self.events = object()  # woken by the event bus, not polling
+        self.strategySL = -1000
+        self.tracked = []
+        self.exited = []
+        for symbol in ["NIFTY24MAY22000CE", "NIFTY24MAY22000PE"]:
+            trade = Trade(symbol, self.getName())
+            trade.state = TradeState.ACTIVE
+            self.trades.append(trade)
+
+    def getLots(self) -> int:
+        return 1
+
+    async def _trackEntryOrder(self, trade: Trade) -> None:
+        self.tracked.append(trade.trading_symbol)
+        trade.pnl = -600
+
+    async def _trackTargetOrder(self, trade: Trade) -> None: ...
+
+    async def _trackSLOrder(self, trade: Trade) -> None: ...
+
+    def arm_trade_triggers(self, trade: Trade) -> None: ...
+
+    def arm_mtm_triggers(self) -> None: ...
+
+    async def square_off(self, reason=TradeExitReason.SQUARE_OFF) -> None:
+        self.exited.append(reason)
+
+    @order_coroutine
+    async def exit_on_loop(self) -> str:
+        return threading.current_thread().name
+
+
+def cycle(strategy: MTMStrategy, reasons: set, woken: list) -> None:
+    strategy.wake_reasons = reasons
+    strategy.woken_trades = {trade.trade_id: trade for trade in woken}
+
+    async def run() -> None:
+        await strategy.trackAndUpdateAllTrades()
+        await strategy.checkStrategyHealth()
+
+    asyncio.run(run())
+
+
+def test_trade_trigger_only_tracks_its_trade():
+    strategy = MTMStrategy()
+    cycle(strategy, {"trigger:NIFTY24MAY22000CE"}, strategy.trades[:1])
+
+    assert strategy.tracked == ["NIFTY24MAY22000CE"]
+    assert strategy.exited == []
+
+
+def test_strategy_exits_on_the_mtm_wake():
+    strategy = MTMStrategy()
+    cycle(strategy, {"trigger:mtm", "trigger:NIFTY24MAY22000CE"}, strategy.trades[:1])
+
+    assert strategy.tracked == ["NIFTY24MAY22000CE", "NIFTY24MAY22000PE"]
+    assert strategy.exited == [TradeExitReason.STRATEGY_SL_HIT]
+
+
+def test_order_method_called_off_the_algo_loop_runs_on_it():
+    strategy = MTMStrategy()
+    strategy.loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=strategy.loop.run_forever, name="algo")
+    thread.start()
+    try:
+        assert strategy.exit_on_loop().result(timeout=5) == "algo"
+    finally:
+        strategy.loop.call_soon_threadsafe(strategy.loop.stop)
+        thread.join()
+        strategy.loop.close()
+
+
+def test_order_method_without_an_algo_loop_fails():
+    with pytest.raises(RuntimeError):
+        MTMStrategy().exit_on_loop()
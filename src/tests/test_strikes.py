@@ -0,0 +1,28 @@
+from typing import Optional
+
+from core import Quote
+from core.strikes import StrikeChain
+
+
+def quote(premium: Optional[float]) -> Quote:
+    quote = Quote("NIFTY")
+    if premium is not None:
+        quote.last_traded_price = premium
+        quote.volume = quote.total_buy_quantity = quote.total_sell_quantity = 1
+    return quote
+
+
+def test_strikes_without_a_premium_are_left_out():
+    # CE from deepest ITM to furthest OTM, 22100 not quoted and 22200 not traded yet
+    strikes = [21900, 22000, 22100, 22200, 22300, 22400]
+    chain = StrikeChain.from_quotes(22000, strikes, [quote(premium) for premium in [260.0, 180.0, None, 0.0, 60.0, 35.0]])
+
+    assert chain.strikes == [21900, 22000, 22300, 22400]
+    assert list(chain.premiums) == [260.0, 180.0, 60.0, 35.0]
+    assert chain.pick(chain.nearest(50.0)) == (22300, 60.0)
+    assert chain.pick(chain.minimum(100.0)) == (22000, 180.0)
+    assert chain.pick(chain.maximum(100.0)) == (22300, 60.0)
+
+
+def test_no_chain_without_an_atm_premium():
+    assert StrikeChain.from_quotes(22000, [21900, 22000, 22100], [quote(260.0), quote(None), quote(120.0)]) is None
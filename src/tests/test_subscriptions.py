@@ -0,0 +1,44 @@
+from core.chain import OptionChains
+from core.prices import PriceStore
+from core.subscriptions import Subscriptions
+from utils import prepare_weekly_options_symbol, prepareMonthlyExpiryFuturesSymbol
+
+
+def test_symbol_is_unregistered_with_its_last_holder():
+    registered, unregistered = [], []
+    subscriptions = Subscriptions(registered.extend, unregistered.extend)
+    subscriptions.hold(["NIFTY 50", "NIFTY24MAY22000CE"])  # an index and a trade
+    subscriptions.hold(["NIFTY24MAY22000CE", "NIFTY24MAY22100CE"])  # a strategy's quotes
+    subscriptions.release(["NIFTY24MAY22000CE", "NIFTY24MAY22100CE"])
+
+    assert registered == ["NIFTY 50", "NIFTY24MAY22000CE", "NIFTY24MAY22100CE"]
+    assert unregistered == ["NIFTY24MAY22100CE"]
+    assert "NIFTY24MAY22000CE" in subscriptions
+
+
+def test_recentred_chain_keeps_symbols_other_holders_hold():
+    future = prepareMonthlyExpiryFuturesSymbol("NIFTY", 3)
+    store = PriceStore(200)
+    store.add_instrument(future, 0)
+    options = {}
+    for strike in range(21500, 22550, 50):
+        for option_type in ["CE", "PE"]:
+            options[(strike, option_type)] = prepare_weekly_options_symbol("NIFTY", strike, option_type, expiryDay=3)
+            store.add_instrument(options[(strike, option_type)], options[(strike, option_type)])
+    registered, unregistered = [], []
+    subscriptions = Subscriptions(registered.extend, unregistered.extend)
+    chains = OptionChains(store, subscriptions.hold, subscriptions.release)
+    chain = chains.get("NIFTY", 3, 50, 2)
+    store.update(store.slot_of(future), 22010.0)
+    chains.on_ticks()
+    assert options[(21900, "CE")] in registered
+
+    subscriptions.hold([options[(21900, "CE")]])  # quoted by a strategy
+    store.update(store.slot_of(future), 22210.0)
+    chains.on_ticks()
+
+    assert chain.centre == 22200
+    assert options[(21900, "PE")] in unregistered
+    assert options[(21900, "CE")] not in unregistered
+    subscriptions.release([options[(21900, "CE")]])
+    assert options[(21900, "CE")] in unregistered
@@ -1,11 +1,10 @@
-import asyncio
 import calendar
 import functools
 import logging
-import time
 from datetime import datetime, timedelta
 
 from config import get_holidays, get_user_config
+from core.clock import get_clock
 from models import Direction, TradeState, UserDetails
 from models.trade import Trade
 
@@ -55,31 +54,31 @@ def calculate_trade_pnl(trade: Trade) -> None:
 def get_epoch(datetimeObj=None) -> int:
     # This method converts given datetimeObj to epoch seconds
     if datetimeObj == None:
-        datetimeObj = datetime.now()
+        datetimeObj = get_clock().now()
     epochSeconds = datetime.timestamp(datetimeObj)
     return int(epochSeconds)  # converting double to long
 
 
 def get_today_date_str() -> str:
-    return datetime.now().strftime(DateFormat)
+    return get_clock().now().strftime(DateFormat)
 
 
 def wait_till_market_open(context) -> None:
-    nowEpoch = get_epoch(datetime.now())
+    nowEpoch = get_epoch(get_clock().now())
     marketStartTimeEpoch = get_epoch(get_market_starttime())
     waitSeconds = marketStartTimeEpoch - nowEpoch
     if waitSeconds > 0:
         logging.info("%s: Waiting for %d seconds till market opens...", context, waitSeconds)
-        time.sleep(waitSeconds)
+        get_clock().sleep(waitSeconds)
 
 
 async def wait_till_market_open_async(context) -> None:
-    nowEpoch = get_epoch(datetime.now())
+    nowEpoch = get_epoch(get_clock().now())
     marketStartTimeEpoch = get_epoch(get_market_starttime())
     waitSeconds = marketStartTimeEpoch - nowEpoch
     if waitSeconds > 0:
         logging.info("%s: Waiting for %d seconds till market opens...", context, waitSeconds)
-        await asyncio.sleep(waitSeconds)
+        await get_clock().sleep_async(waitSeconds)
 
 
 def get_market_starttime(dateTimeObj=None):
@@ -92,7 +91,7 @@ def get_market_endtime(dateTimeObj=None):
 
 def get_time(hours, minutes, seconds, dateTimeObj=None):
     if dateTimeObj == None:
-        dateTimeObj = datetime.now()
+        dateTimeObj = get_clock().now()
     dateTimeObj = dateTimeObj.replace(hour=hours, minute=minutes, second=seconds, microsecond=0)
     return dateTimeObj
 
@@ -102,7 +101,7 @@ def prepare_weekly_options_symbol(inputSymbol, strike, optionType, numWeeksPlus=
     # Check if monthly and weekly expiry same
     expiryDateTimeMonthly = get_monthly_expiry_day(expiryDay=expiryDay)
     weekAndMonthExpriySame = False
-    if expiryDateTime == expiryDateTimeMonthly or expiryDateTimeMonthly == get_time(0, 0, 0, datetime.now()):
+    if expiryDateTime == expiryDateTimeMonthly or expiryDateTimeMonthly == get_time(0, 0, 0, get_clock().now()):
         expiryDateTime = expiryDateTimeMonthly
         weekAndMonthExpriySame = True
         logging.debug("Weekly and Monthly expiry is same for %s", expiryDateTime)
@@ -142,7 +141,7 @@ def get_weekly_expiry_day(inputSymbol, dateTimeObj=None, expiryDay=2):
     expiryDateTimeMonthly = get_monthly_expiry_day(expiryDay=expiryDay)
 
     if dateTimeObj == None:
-        dateTimeObj = datetime.now()
+        dateTimeObj = get_clock().now()
 
     if expiryDateTimeMonthly == get_time(0, 0, 0, dateTimeObj):
         datetimeExpiryDay = expiryDateTimeMonthly
@@ -164,7 +163,7 @@ def get_weekly_expiry_day(inputSymbol, dateTimeObj=None, expiryDay=2):
 
 def get_monthly_expiry_day(datetimeObj=None, expiryDay=3):
     if datetimeObj == None:
-        datetimeObj = datetime.now()
+        datetimeObj = get_clock().now()
     year = datetimeObj.year
     month = datetimeObj.month
     lastDay = calendar.monthrange(year, month)[1]  # 2nd entry is the last day of the month
@@ -208,7 +207,7 @@ def find_days_before_weekly_expiry(inputSymbol, expiryDay=2):
 
 
 def get_time_today(hours, minutes, seconds):
-    return get_time(hours, minutes, seconds, datetime.now())
+    return get_time(hours, minutes, seconds, get_clock().now())
 
 
 def is_holiday(datetimeObj):
@@ -225,7 +224,7 @@ def is_holiday(datetimeObj):
 
 
 def is_today_holiday():
-    return is_holiday(datetime.now())
+    return is_holiday(get_clock().now())
 
 
 def is_market_closed_for_the_day():
@@ -233,7 +232,7 @@ def is_market_closed_for_the_day():
     # Please note this will not return true if current time is < marketStartTime on a trading day
     if is_today_holiday():
         return True
-    now = datetime.now()
+    now = get_clock().now()
     marketEndTime = get_market_endtime()
     return now > marketEndTime
 
@@ -241,7 +240,7 @@ def is_market_closed_for_the_day():
 def prepareMonthlyExpiryFuturesSymbol(inputSymbol, expiryDay=2):
     expiryDateTime = get_monthly_expiry_day(expiryDay=expiryDay)
     expiryDateMarketEndTime = get_market_endtime(expiryDateTime)
-    now = datetime.now()
+    now = get_clock().now()
     if now > expiryDateMarketEndTime:
         # increasing today date by 20 days to get some day in next month passing to getMonthlyExpiryDayDate()
         expiryDateTime = get_monthly_expiry_day(now + timedelta(days=20), expiryDay)
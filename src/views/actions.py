@@ -1,4 +1,5 @@
 import asyncio
+import json
 
 from flask import redirect, request, url_for
 
@@ -18,7 +19,7 @@ def exit_strategy(algo: BaseAlgo, short_code: str, name: str):
     assert algo is not None
 
     async def square_off(name):
-        algo.strategy_to_instance[name].square_off(TradeExitReason.MANUAL_EXIT)
+        await algo.strategy_to_instance[name].square_off(TradeExitReason.MANUAL_EXIT)
 
     squareoff_task = asyncio.run_coroutine_threadsafe(square_off(name), algo.loop)
     squareoff_task.add_done_callback(algo.handle_exception)
@@ -81,6 +82,20 @@ def enter_trade(algo: BaseAlgo, short_code):
     return redirect(url_for("home", short_code=short_code))
 
 
+@token_required
+@app.route("/me/<short_code>/latency")
+def latency(algo: BaseAlgo, short_code):
+    # order latency histograms of the day so far, see core.latency
+    return app.response_class(json.dumps(algo.broker.latency.summary()), mimetype="application/json")
+
+
+@token_required
+@app.route("/me/<short_code>/quote_stats")
+def quote_stats(algo: BaseAlgo, short_code):
+    # hits, misses and coalesced requests of the algo's quote cache, see core.quotes
+    return app.response_class(json.dumps(algo.quote_cache.summary()), mimetype="application/json")
+
+
 @token_required
 @app.route("/me/<short_code>/get_quote")
 def get_quote(algo: BaseAlgo, short_code):
@@ -12,7 +12,7 @@ from app import flask_app as app
 from app import system_config
 from broker import brokers, load_broker_module
 from broker.base import Broker
-from instruments import symbol_to_CMP
+from instruments import price_stores
 from models import AlgoStatus
 from utils import get_user_details
 
@@ -44,7 +44,7 @@ def home(short_code):
         return render_template(
             "main.html",
             strategies=algo.strategy_to_instance.values(),
-            ltps=symbol_to_CMP[short_code] if short_code in symbol_to_CMP else {},
+            ltps=price_stores[short_code].ltps() if short_code in price_stores else {},
             algoStarted=True if broker is not None else False,
             isReady=True if broker is not None else False,
             # margins=(broker.margins() if broker is not None else {}),